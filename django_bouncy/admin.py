@@ -2,7 +2,9 @@
 
 from django.contrib import admin
 
-from django_bouncy.models import Bounce, Complaint, Delivery
+from django_bouncy.models import (
+    AddressStatus, Bounce, Complaint, Delivery, DeliveryRollup, InboxMessage
+)
 
 
 class BounceAdmin(admin.ModelAdmin):
@@ -30,6 +32,32 @@ class DeliveryAdmin(admin.ModelAdmin):
     search_fields = ('address',)
 
 
+class InboxMessageAdmin(admin.ModelAdmin):
+    """Admin model for 'InboxMessage' objects"""
+    list_display = ('sns_messageid', 'created_at', 'attempts', 'claimed_at')
+    search_fields = ('sns_messageid',)
+
+
+class AddressStatusAdmin(admin.ModelAdmin):
+    """Admin model for 'AddressStatus' objects"""
+    list_display = (
+        'address', 'hard_bounce', 'soft_bounce_count', 'complaint',
+        'last_bounce_time'
+    )
+    list_filter = ('hard_bounce', 'complaint', 'last_bounce_type')
+    search_fields = ('address',)
+
+
+class DeliveryRollupAdmin(admin.ModelAdmin):
+    """Admin model for 'DeliveryRollup' objects"""
+    list_display = ('hour', 'mail_from', 'domain', 'count')
+    list_filter = ('hour',)
+    search_fields = ('mail_from', 'domain')
+
+
 admin.site.register(Bounce, BounceAdmin)
 admin.site.register(Complaint, ComplaintAdmin)
 admin.site.register(Delivery, DeliveryAdmin)
+admin.site.register(InboxMessage, InboxMessageAdmin)
+admin.site.register(AddressStatus, AddressStatusAdmin)
+admin.site.register(DeliveryRollup, DeliveryRollupAdmin)
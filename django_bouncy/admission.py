@@ -0,0 +1,288 @@
+"""
+Admission control for the django_bouncy endpoints
+
+When the database slows down, requests that can't finish in time only tie up
+workers, and SNS redelivers them anyway. Past the limits set by
+BOUNCY_MAX_IN_FLIGHT (notifications being handled by this process),
+BOUNCY_MAX_CLUSTER_IN_FLIGHT (by every process sharing
+BOUNCY_ADMISSION_CACHE) or BOUNCY_MAX_WRITE_LATENCY (the moving average of
+database writes, in seconds), notifications are answered with a 503 and a
+Retry-After header, so they wait in SNS's retry queue instead. Nothing is
+checked unless at least one limit is set.
+"""
+import functools
+import logging
+import threading
+import time
+
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from django_bouncy.conf import get_settings
+from django_bouncy.instrumentation import NULL_TIMER, increment
+
+CLUSTER_IN_FLIGHT_KEY = u'bouncy-in-flight'
+# Counts left behind by processes that died mid-request are forgotten when
+# the shared counter expires, once no request has entered for this long
+CLUSTER_IN_FLIGHT_TIMEOUT = 300
+# Weight of the newest write in the moving average of write latency
+WRITE_LATENCY_WEIGHT = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionState(object):
+    """The work in flight in this process, and how quickly it's written"""
+    def __init__(self):
+        self.in_flight = 0
+        self.write_latency = None
+        self.last_write = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        """Count a request in, and return how many are now in flight"""
+        with self._lock:
+            self.in_flight += 1
+            return self.in_flight
+
+    def leave(self):
+        """Count a request out"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def reject(self):
+        """Count a rejected request"""
+        with self._lock:
+            self.rejected += 1
+
+    def record_write(self, seconds):
+        """Add a write taking `seconds` to the moving average"""
+        with self._lock:
+            if self.write_latency is None:
+                self.write_latency = seconds
+            else:
+                self.write_latency += WRITE_LATENCY_WEIGHT * (
+                    seconds - self.write_latency)
+            self.last_write = time.time()
+
+    def writes_slow(self, limit, retry_after):
+        """
+        Return whether the moving average of writes is over `limit`
+
+        Once nothing has been written for `retry_after` seconds the average
+        is out of date, so requests are let through to measure it again.
+        """
+        with self._lock:
+            return (
+                self.write_latency is not None
+                and self.write_latency > limit
+                and time.time() - self.last_write < retry_after
+            )
+
+    def reset(self):
+        """Forget everything"""
+        with self._lock:
+            self.in_flight = 0
+            self.write_latency = None
+            self.last_write = None
+            self.rejected = 0
+
+
+state = AdmissionState()
+
+
+class _WriteTimer(object):
+    """Times a database write and adds it to the moving average"""
+    __slots__ = ('started',)
+
+    def __init__(self):
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        state.record_write(time.perf_counter() - self.started)
+        return False
+
+
+def write_timer():
+    """Function to return a context manager that times a database write"""
+    if get_settings().max_write_latency is None:
+        return NULL_TIMER
+    return _WriteTimer()
+
+
+def _enabled(bouncy_settings):
+    """Function to check whether any admission limit is set"""
+    return (
+        bouncy_settings.max_in_flight is not None
+        or bouncy_settings.max_cluster_in_flight is not None
+        or bouncy_settings.max_write_latency is not None
+    )
+
+
+def _cluster_enter(bouncy_settings):
+    """
+    Function to count a request in across every process, and return how
+    many are now in flight, or `None` if the cache can't be reached
+    """
+    cache = caches[bouncy_settings.admission_cache]
+    try:
+        cache.add(CLUSTER_IN_FLIGHT_KEY, 0, CLUSTER_IN_FLIGHT_TIMEOUT)
+        in_flight = cache.incr(CLUSTER_IN_FLIGHT_KEY)
+        # The counter only expires once nothing has entered for the timeout,
+        # so it isn't forgotten while other requests are still in flight
+        cache.touch(CLUSTER_IN_FLIGHT_KEY, CLUSTER_IN_FLIGHT_TIMEOUT)
+        if in_flight < 1:
+            # Requests counted out after the counter expired left it below
+            # zero, so count this request in from zero
+            in_flight = cache.incr(CLUSTER_IN_FLIGHT_KEY, 1 - in_flight)
+        return in_flight
+    except Exception:  # pylint: disable=broad-except
+        # Let requests through rather than turn everything away
+        logger.warning('Cluster In-Flight Count Unavailable', exc_info=True)
+        return None
+
+
+def _cluster_leave(bouncy_settings):
+    """Function to count a request out across every process"""
+    cache = caches[bouncy_settings.admission_cache]
+    try:
+        in_flight = cache.decr(CLUSTER_IN_FLIGHT_KEY)
+        if in_flight < 0:
+            # The counter expired and was restarted while the request was in
+            # flight, so it didn't count this request in
+            cache.incr(CLUSTER_IN_FLIGHT_KEY, -in_flight)
+    except ValueError:
+        # The counter expired while the request was in flight
+        pass
+    except Exception:  # pylint: disable=broad-except
+        logger.warning('Cluster In-Flight Count Unavailable', exc_info=True)
+
+
+def cluster_in_flight():
+    """Function to return the requests in flight across every process"""
+    bouncy_settings = get_settings()
+    if bouncy_settings.max_cluster_in_flight is None:
+        return None
+    try:
+        return max(caches[bouncy_settings.admission_cache].get(
+            CLUSTER_IN_FLIGHT_KEY, 0), 0)
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def _overloaded(reason, bouncy_settings):
+    """Function to build the response to a request turned away"""
+    state.reject()
+    increment('admission_rejected', reason=reason)
+    logger.warning('Request Not Admitted: %s', reason)
+    response = HttpResponse(reason, status=503)
+    response['Retry-After'] = str(bouncy_settings.retry_after)
+    return response
+
+
+def admit():
+    """
+    Function to count a request in, if there's room for it
+
+    Returns a tuple of whether the request was counted in across every
+    process, and `None`; or of `False` and the response to return if there
+    isn't room. Call `release` with the first value once an admitted request
+    is finished.
+    """
+    bouncy_settings = get_settings()
+    if bouncy_settings.max_write_latency is not None and state.writes_slow(
+            bouncy_settings.max_write_latency, bouncy_settings.retry_after):
+        return False, _overloaded('Database Writes Too Slow', bouncy_settings)
+
+    in_flight = state.enter()
+    if (bouncy_settings.max_in_flight is not None
+            and in_flight > bouncy_settings.max_in_flight):
+        state.leave()
+        return False, _overloaded('Too Many Requests', bouncy_settings)
+
+    if bouncy_settings.max_cluster_in_flight is None:
+        return False, None
+    in_flight = _cluster_enter(bouncy_settings)
+    if in_flight is None:
+        return False, None
+    if in_flight > bouncy_settings.max_cluster_in_flight:
+        _cluster_leave(bouncy_settings)
+        state.leave()
+        return False, _overloaded('Too Many Requests', bouncy_settings)
+    return True, None
+
+
+def release(clustered):
+    """Function to count an admitted request out"""
+    state.leave()
+    if clustered:
+        _cluster_leave(get_settings())
+
+
+def snapshot():
+    """Function to describe the current admission state and limits"""
+    bouncy_settings = get_settings()
+    return {
+        'in_flight': state.in_flight,
+        'cluster_in_flight': cluster_in_flight(),
+        'write_latency': state.write_latency,
+        'rejected': state.rejected,
+        'max_in_flight': bouncy_settings.max_in_flight,
+        'max_cluster_in_flight': bouncy_settings.max_cluster_in_flight,
+        'max_write_latency': bouncy_settings.max_write_latency,
+    }
+
+
+def limit_view(view):
+    """Decorator to turn away notifications while the pipeline is full"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        """Admission controlled view"""
+        if request.method != 'POST' or not _enabled(get_settings()):
+            return view(request, *args, **kwargs)
+        clustered, response = admit()
+        if response is not None:
+            return response
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            release(clustered)
+    return wrapper
+
+
+def limit_async_view(view):
+    """
+    Decorator to turn away notifications to an asynchronous view while the
+    pipeline is full
+    """
+    # Only available from Django 3.0, like asynchronous views themselves
+    # pylint: disable=import-outside-toplevel
+    from asgiref.sync import sync_to_async
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        """Admission controlled view"""
+        bouncy_settings = get_settings()
+        if request.method != 'POST' or not _enabled(bouncy_settings):
+            return await view(request, *args, **kwargs)
+        if bouncy_settings.max_cluster_in_flight is None:
+            # Only this process's own count is checked
+            clustered, response = admit()
+        else:
+            # The shared count may be kept in a database or over the network
+            clustered, response = await sync_to_async(admit)()
+        if response is not None:
+            return response
+        try:
+            return await view(request, *args, **kwargs)
+        finally:
+            if clustered:
+                await sync_to_async(release)(clustered)
+            else:
+                release(clustered)
+    return wrapper
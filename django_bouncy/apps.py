@@ -0,0 +1,12 @@
+"""App configuration for the django_bouncy app"""
+from django.apps import AppConfig
+
+
+class BouncyConfig(AppConfig):
+    """App configuration for django_bouncy"""
+    name = 'django_bouncy'
+
+    def ready(self):
+        """Validate the settings at startup rather than on first request"""
+        from django_bouncy.conf import get_settings
+        get_settings()
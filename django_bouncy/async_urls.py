@@ -0,0 +1,12 @@
+"""
+URLs for the Django-Bouncy App, served by the asynchronous endpoint
+
+Include these instead of `django_bouncy.urls` when running under ASGI.
+"""
+from django.conf.urls import url
+# pylint: disable=invalid-name
+from django_bouncy.async_views import endpoint
+
+urlpatterns = [
+    url(r'^$', endpoint)
+]
@@ -0,0 +1,81 @@
+"""
+Asynchronous views for the django_bouncy app
+
+These need Django 3.1 or newer, installed with the `async` extra, running
+under ASGI.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+
+from django_bouncy.admission import limit_async_view
+from django_bouncy.conf import get_settings
+from django_bouncy.instrumentation import (
+    increment, instrument_async_view, timer
+)
+from django_bouncy.utils import approve_subscription
+from django_bouncy.views import (
+    check_request, check_signature, enqueue_notification, process_notification,
+    unsubscribe_confirmation
+)
+from django_bouncy import signals
+
+logger = logging.getLogger(__name__)
+
+
+@instrument_async_view
+@limit_async_view
+async def endpoint(request):
+    """
+    Asynchronous endpoint that SNS accesses. Includes logic verifying request
+
+    Responds exactly like `django_bouncy.views.endpoint`. Certificate fetches
+    and subscription confirmations run outside the event loop, in threads
+    that aren't tied to the ORM, and cache reads, database writes and signal
+    receivers run through `sync_to_async`.
+    """
+    # In order to 'hide' the endpoint, all non-POST requests should return
+    # the site's default HTTP404
+    if request.method != 'POST':
+        raise Http404
+
+    # The duplicate check reads BOUNCY_SEEN_CACHE, which may be a database
+    with timer('check'):
+        data, response = await sync_to_async(check_request)(request)
+    if response is not None:
+        return response
+
+    # Verify that the notification is signed by Amazon
+    if get_settings().verify_certificate:
+        with timer('verify'):
+            response = await sync_to_async(
+                check_signature, thread_sensitive=False)(data)
+        if response is not None:
+            return response
+    increment('notifications', type=data['Type'])
+
+    # Send a signal to say a valid notification has been received
+    with timer('notification_signal'):
+        await sync_to_async(signals.notification.send)(
+            sender='bouncy_endpoint', notification=data, request=request)
+
+    # Handle subscription-based messages.
+    if data['Type'] == 'SubscriptionConfirmation':
+        # Allow the disabling of the auto-subscription feature
+        if not get_settings().auto_subscribe:
+            raise Http404
+        return await sync_to_async(
+            approve_subscription, thread_sensitive=False)(data)
+    elif data['Type'] == 'UnsubscribeConfirmation':
+        return unsubscribe_confirmation()
+
+    # Leave the rest of the work to the bouncy_worker management command
+    if get_settings().deferred_processing:
+        with timer('enqueue'):
+            return await sync_to_async(enqueue_notification)(request, data)
+
+    return await sync_to_async(process_notification)(data)
+
+# csrf_exempt can only wrap coroutine functions from Django 5.0 onward
+endpoint.csrf_exempt = True
@@ -0,0 +1,87 @@
+"""Email backends for the django_bouncy app"""
+import copy
+import logging
+from email.utils import parseaddr
+
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from django_bouncy.conf import get_settings
+from django_bouncy.suppression import filter_sendable
+
+logger = logging.getLogger(__name__)
+
+
+class SuppressingEmailBackend(BaseEmailBackend):
+    """
+    An email backend removing suppressed recipients before sending
+
+    Messages are handed on to the backend in BOUNCY_EMAIL_BACKEND (Django's
+    SMTP backend by default) once every suppressed address has been removed
+    from their `to`, `cc` and `bcc` lists. All the recipients of a batch are
+    checked with a single call to `filter_sendable`. Messages left with no
+    recipients are dropped unless BOUNCY_DROP_SUPPRESSED_MESSAGES is False.
+
+    The number of addresses removed and messages dropped by this connection
+    are kept in `suppressed_count` and `dropped_count`.
+    """
+    def __init__(self, fail_silently=False, backend=None, **kwargs):
+        super(SuppressingEmailBackend, self).__init__(
+            fail_silently=fail_silently)
+        self.connection = get_connection(
+            backend or get_settings().email_backend,
+            fail_silently=fail_silently, **kwargs
+        )
+        self.suppressed_count = 0
+        self.dropped_count = 0
+
+    def open(self):
+        return self.connection.open()
+
+    def close(self):
+        return self.connection.close()
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+
+        recipients = set()
+        for message in email_messages:
+            recipients.update(
+                parseaddr(recipient)[1] for recipient in message.recipients())
+        suppressed = recipients.difference(filter_sendable(list(recipients)))
+        if not suppressed:
+            return self.connection.send_messages(email_messages)
+
+        drop_empty = get_settings().drop_suppressed_messages
+        previous_count = self.suppressed_count
+        sendable_messages = []
+        for message in email_messages:
+            message = self._remove_recipients(message, suppressed)
+            if drop_empty and not message.recipients():
+                self.dropped_count += 1
+                continue
+            sendable_messages.append(message)
+
+        logger.info(
+            'Removed %s Suppressed Recipient(s), Dropped %s Message(s)',
+            self.suppressed_count - previous_count,
+            len(email_messages) - len(sendable_messages)
+        )
+
+        if not sendable_messages:
+            return 0
+        return self.connection.send_messages(sendable_messages)
+
+    def _remove_recipients(self, message, suppressed):
+        """Return a copy of `message` without any suppressed recipients"""
+        message = copy.copy(message)
+        for field in ('to', 'cc', 'bcc'):
+            addresses = getattr(message, field)
+            kept = [
+                address for address in addresses
+                if parseaddr(address)[1] not in suppressed
+            ]
+            self.suppressed_count += len(addresses) - len(kept)
+            setattr(message, field, kept)
+        return message
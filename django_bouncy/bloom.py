@@ -0,0 +1,140 @@
+"""
+A Bloom filter of suppressed addresses, shared between processes
+
+The filter is written to a file which every process maps read-only, so the
+memory holding it is shared and checking an address that was never
+suppressed needs no database or cache traffic at all. A Bloom filter never
+gives false negatives, but answers "maybe" for a small, configurable
+fraction of other addresses, which must then be checked exactly.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+MAGIC = b'BOUNCYBF'
+# Magic, number of bits, number of hash functions, number of addresses,
+# and when the addresses were read (a UNIX timestamp)
+HEADER = struct.Struct('>8sQQQd')
+
+
+class BloomFilter(object):
+    """A Bloom filter held in a bytearray or a read-only memory map"""
+    def __init__(self, num_bits, num_hashes, data=None, count=0,
+                 built_at=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.count = count
+        self.built_at = time.time() if built_at is None else built_at
+        if data is None:
+            data = bytearray((num_bits + 7) // 8)
+        self.data = data
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate, **kwargs):
+        """Return an empty filter sized for `capacity` addresses"""
+        capacity = max(capacity, 1)
+        num_bits = int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return cls(num_bits, num_hashes, **kwargs)
+
+    def _positions(self, key):
+        """Yield the bit positions for `key`, using double hashing"""
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        first, second = struct.unpack('>QQ', digest[:16])
+        for number in range(self.num_hashes):
+            yield (first + number * second) % self.num_bits
+
+    def add(self, key):
+        """Add `key` to the filter"""
+        for position in self._positions(key):
+            self.data[position // 8] |= 1 << (position % 8)
+        self.count += 1
+
+    def __contains__(self, key):
+        data = self.data
+        for position in self._positions(key):
+            if not data[position // 8] & (1 << (position % 8)):
+                return False
+        return True
+
+    def write(self, path):
+        """
+        Write the filter to `path`
+
+        The file is written next to `path` and then renamed over it, so
+        readers only ever see a complete filter.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                temp_file.write(HEADER.pack(
+                    MAGIC, self.num_bits, self.num_hashes, self.count,
+                    self.built_at
+                ))
+                temp_file.write(self.data)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.chmod(temp_path, 0o644)
+            os.rename(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    @classmethod
+    def open(cls, path):
+        """Return the filter in `path`, mapped read-only into memory"""
+        with open(path, 'rb') as filter_file:
+            data = mmap.mmap(filter_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(data) < HEADER.size:
+            raise ValueError('Invalid Bloom Filter File')
+        magic, num_bits, num_hashes, count, built_at = HEADER.unpack(
+            data[:HEADER.size])
+        if magic != MAGIC or len(data) != HEADER.size + (num_bits + 7) // 8:
+            raise ValueError('Invalid Bloom Filter File')
+        return cls(
+            num_bits, num_hashes, data=memoryview(data)[HEADER.size:],
+            count=count, built_at=built_at
+        )
+
+
+class SharedBloomFilter(object):
+    """
+    The Bloom filter stored at `path`, reopened whenever the file is replaced
+
+    The file is checked for changes at most once every `check_interval`
+    seconds. `get` returns `None` while there is no file.
+    """
+    def __init__(self, path, check_interval=30):
+        self.path = path
+        self.check_interval = check_interval
+        self._filter = None
+        self._identity = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the current filter, reopening the file if it changed"""
+        now = time.time()
+        if (self._checked_at is not None
+                and now - self._checked_at < self.check_interval):
+            return self._filter
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                self._filter = self._identity = None
+                return None
+            identity = (stat.st_ino, stat.st_mtime, stat.st_size)
+            if identity != self._identity:
+                self._filter = BloomFilter.open(self.path)
+                self._identity = identity
+            return self._filter
@@ -0,0 +1,73 @@
+"""
+A directory of signing certificates shared by every process on a host
+
+When BOUNCY_CERT_DIR is set, certificates are written there as they are
+fetched and read from there before going to the network, so a restarted
+cache or a fresh worker doesn't fetch them again.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+
+from django_bouncy.conf import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def certificate_path(cert_dir, cert_url):
+    """Function to return the file holding the certificate from `cert_url`"""
+    return os.path.join(cert_dir, '{}.pem'.format(
+        hashlib.sha256(cert_url.encode('utf-8')).hexdigest()))
+
+
+def read_certificate(cert_url):
+    """Function to return the stored certificate, or `None`"""
+    cert_dir = get_settings().cert_dir
+    if cert_dir is None:
+        return None
+    try:
+        with open(certificate_path(cert_dir, cert_url), 'rb') as cert_file:
+            return cert_file.read()
+    except (IOError, OSError):
+        return None
+
+
+def delete_certificate(cert_url):
+    """Function to remove the stored certificate, if there is one"""
+    cert_dir = get_settings().cert_dir
+    if cert_dir is None:
+        return
+    try:
+        os.unlink(certificate_path(cert_dir, cert_url))
+    except (IOError, OSError):
+        pass
+
+
+def write_certificate(cert_url, pemfile):
+    """
+    Function to store a certificate
+
+    The file is written next to its final name and then renamed, so readers
+    only ever see a complete certificate. Failing to write it is logged but
+    not raised, since the certificate has already been fetched.
+    """
+    cert_dir = get_settings().cert_dir
+    if cert_dir is None:
+        return
+    if not isinstance(pemfile, bytes):
+        pemfile = pemfile.encode('ascii')
+    try:
+        if not os.path.isdir(cert_dir):
+            os.makedirs(cert_dir)
+        handle, temp_path = tempfile.mkstemp(dir=cert_dir, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                temp_file.write(pemfile)
+            os.chmod(temp_path, 0o644)
+            os.rename(temp_path, certificate_path(cert_dir, cert_url))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except (IOError, OSError):
+        logger.exception('Could Not Store Certificate: URL %s', cert_url)
@@ -0,0 +1,325 @@
+"""Settings for the django_bouncy app"""
+import json
+import re
+import sys
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+import six
+
+# AWS by default uses sns.{region}.amazonaws.com
+DEFAULT_DOMAIN_REGEX = r"sns.[a-z0-9\-]+.amazonaws.com$"
+
+_settings = None
+
+
+class BouncySettings(object):
+    """
+    An immutable snapshot of the django_bouncy settings
+
+    Regular expressions are compiled and the allowed topics are held in a
+    frozenset once, so the request path never has to re-read or re-parse
+    them. Any misconfiguration raises `ImproperlyConfigured` when the
+    snapshot is built.
+    """
+    __slots__ = (
+        'topic_arns', 'cert_domain_regex', 'subscribe_domain_regex',
+        'verify_certificate', 'auto_subscribe', 'key_cache',
+        'cert_cache_timeout', 'deferred_processing', 'seen_cache',
+        'seen_timeout', 'soft_bounce_limit', 'suppression_cache_size',
+        'suppression_cache_timeout', 'email_backend',
+        'drop_suppressed_messages', 'bloom_file', 'bloom_error_rate',
+        'retention_days', 'rollup_senders', 'rollup_topics',
+        'rollup_sample_rate', 'json_loads', 'metrics_sink', 'cert_fetcher',
+        'cert_fetch_timeout', 'cert_dir', 'signature_backend',
+        'max_body_size', 'require_sns_headers', 'negative_cache_timeout',
+        'max_in_flight', 'max_cluster_in_flight', 'admission_cache',
+        'max_write_latency', 'retry_after'
+    )
+
+    def __init__(self, source):
+        values = {
+            # `None` means notifications from any topic are accepted
+            'topic_arns': _topics(source),
+            'cert_domain_regex': _regex(source, 'BOUNCY_CERT_DOMAIN_REGEX'),
+            'subscribe_domain_regex': _regex(
+                source, 'BOUNCY_SUBSCRIBE_DOMAIN_REGEX'),
+            'verify_certificate': bool(
+                getattr(source, 'BOUNCY_VERIFY_CERTIFICATE', True)),
+            'auto_subscribe': bool(
+                getattr(source, 'BOUNCY_AUTO_SUBSCRIBE', True)),
+            'key_cache': _cache_alias(source, 'BOUNCY_KEY_CACHE'),
+            'cert_cache_timeout': _timeout(
+                source, 'BOUNCY_CERT_CACHE_TIMEOUT', 86400),
+            'deferred_processing': bool(
+                getattr(source, 'BOUNCY_DEFERRED_PROCESSING', False)),
+            # `None` turns off the cache of notifications already handled
+            'seen_cache': _cache_alias(
+                source, 'BOUNCY_SEEN_CACHE', allow_none=True),
+            'seen_timeout': _timeout(source, 'BOUNCY_SEEN_TIMEOUT', 86400),
+            # `None` means soft bounces never suppress an address
+            'soft_bounce_limit': _count(
+                source, 'BOUNCY_SOFT_BOUNCE_LIMIT', None),
+            'suppression_cache_size': _count(
+                source, 'BOUNCY_SUPPRESSION_CACHE_SIZE', 10000),
+            'suppression_cache_timeout': _timeout(
+                source, 'BOUNCY_SUPPRESSION_CACHE_TIMEOUT', 300),
+            # The backend wrapped by SuppressingEmailBackend
+            'email_backend': getattr(
+                source, 'BOUNCY_EMAIL_BACKEND',
+                'django.core.mail.backends.smtp.EmailBackend'
+            ),
+            'drop_suppressed_messages': bool(
+                getattr(source, 'BOUNCY_DROP_SUPPRESSED_MESSAGES', True)),
+            # `None` turns off the shared Bloom filter of suppressed addresses
+            'bloom_file': getattr(source, 'BOUNCY_BLOOM_FILE', None),
+            'bloom_error_rate': _rate(
+                source, 'BOUNCY_BLOOM_ERROR_RATE', 0.001),
+            'retention_days': _retention_days(source),
+            # Deliveries from these senders or topics are only counted
+            'rollup_senders': frozenset(
+                address.strip().lower() for address in
+                _string_list(source, 'BOUNCY_ROLLUP_SENDERS')
+            ),
+            'rollup_topics': frozenset(
+                _string_list(source, 'BOUNCY_ROLLUP_TOPICS')),
+            'rollup_sample_rate': _rate(
+                source, 'BOUNCY_ROLLUP_SAMPLE_RATE', 0.0, allow_zero=True),
+            'json_loads': _json_loads(source),
+            # `None` turns off django_bouncy.instrumentation
+            'metrics_sink': _metrics_sink(source),
+            'cert_fetcher': _cert_fetcher(source),
+            # Seconds to wait to connect to and then read from a cert host
+            'cert_fetch_timeout': _fetch_timeout(source),
+            # `None` turns off the on-disk certificate store
+            'cert_dir': getattr(source, 'BOUNCY_CERT_DIR', None),
+            'signature_backend': _signature_backend(source),
+            # Longer requests are rejected before they're read
+            'max_body_size': _count(
+                source, 'BOUNCY_MAX_BODY_SIZE', 1024 * 1024),
+            # Reject requests without the headers SNS always sends
+            'require_sns_headers': bool(
+                getattr(source, 'BOUNCY_REQUIRE_SNS_HEADERS', False)),
+            # Seconds to remember failed certificate fetches and bad
+            # signatures for. 0 turns it off.
+            'negative_cache_timeout': _timeout(
+                source, 'BOUNCY_NEGATIVE_CACHE_TIMEOUT', 60),
+            # `None` turns off each of django_bouncy.admission's limits
+            'max_in_flight': _count(source, 'BOUNCY_MAX_IN_FLIGHT', None),
+            'max_cluster_in_flight': _count(
+                source, 'BOUNCY_MAX_CLUSTER_IN_FLIGHT', None),
+            'admission_cache': _cache_alias(source, 'BOUNCY_ADMISSION_CACHE'),
+            'max_write_latency': _timeout(
+                source, 'BOUNCY_MAX_WRITE_LATENCY', None, allow_none=True),
+            'retry_after': _count(source, 'BOUNCY_RETRY_AFTER', 30),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('BouncySettings is immutable')
+
+
+def get_settings():
+    """Return the current settings snapshot, building it if necessary"""
+    global _settings  # pylint: disable=global-statement,invalid-name
+    snapshot = _settings
+    if snapshot is None:
+        snapshot = _settings = BouncySettings(settings)
+    return snapshot
+
+
+@receiver(setting_changed)
+def reload_settings(setting, **kwargs):
+    """Throw away the snapshot whenever a setting it depends on changes"""
+    # pylint: disable=unused-argument
+    global _settings  # pylint: disable=global-statement,invalid-name
+    if setting.startswith('BOUNCY_') or setting == 'CACHES':
+        _settings = None
+
+
+def _topics(source):
+    """Return the allowed topics as a frozenset"""
+    topics = getattr(source, 'BOUNCY_TOPIC_ARN', None)
+    if topics is None:
+        return None
+    # Because you can have bounces and complaints coming from multiple
+    # topics, BOUNCY_TOPIC_ARN is a list. A bare string would otherwise be
+    # checked by substring.
+    if isinstance(topics, six.string_types):
+        raise ImproperlyConfigured(
+            'BOUNCY_TOPIC_ARN must be a list of topic ARNs')
+    return frozenset(topics)
+
+
+def _regex(source, name):
+    """Return the compiled regular expression held in the setting `name`"""
+    pattern = getattr(source, name, DEFAULT_DOMAIN_REGEX)
+    try:
+        return re.compile(pattern)
+    except (re.error, TypeError) as error:
+        raise ImproperlyConfigured(
+            '{} is not a valid regular expression: {}'.format(name, error))
+
+
+def _cache_alias(source, name, allow_none=False):
+    """Return the cache alias in the setting `name`, checking it exists"""
+    alias = getattr(source, name, 'default')
+    if alias is None and allow_none:
+        return None
+    if alias not in source.CACHES:
+        raise ImproperlyConfigured(
+            '{} refers to an unknown cache "{}"'.format(name, alias))
+    return alias
+
+
+def _timeout(source, name, default, allow_none=False):
+    """Return the number of seconds (or `None`) in the setting `name`"""
+    timeout = getattr(source, name, default)
+    if timeout is None and allow_none:
+        return None
+    if not isinstance(timeout, (int, float)) or timeout < 0:
+        raise ImproperlyConfigured(
+            '{} must be a non-negative number of seconds'.format(name))
+    return timeout
+
+
+def _count(source, name, default):
+    """Return the positive whole number (or `None`) in the setting `name`"""
+    count = getattr(source, name, default)
+    if count is None and default is None:
+        return None
+    if not isinstance(count, int) or count < 1:
+        raise ImproperlyConfigured(
+            '{} must be a positive whole number'.format(name))
+    return count
+
+
+def _rate(source, name, default, allow_zero=False):
+    """Return the fraction between 0 and 1 in the setting `name`"""
+    rate = getattr(source, name, default)
+    if (not isinstance(rate, (int, float)) or isinstance(rate, bool)
+            or not (0 <= rate <= 1 if allow_zero else 0 < rate < 1)):
+        raise ImproperlyConfigured(
+            '{} must be a number between 0 and 1'.format(name))
+    return float(rate)
+
+
+def _string_list(source, name):
+    """Return the list of strings in the setting `name`"""
+    values = getattr(source, name, ())
+    if isinstance(values, six.string_types):
+        raise ImproperlyConfigured('{} must be a list'.format(name))
+    return list(values)
+
+
+def _retention_days(source):
+    """Return the number of days to keep each kind of feedback for"""
+    retention = getattr(source, 'BOUNCY_RETENTION_DAYS', {})
+    if not isinstance(retention, dict) or not set(retention) <= set(
+            ['bounce', 'complaint', 'delivery', 'rolled_up']):
+        raise ImproperlyConfigured(
+            'BOUNCY_RETENTION_DAYS must be a dictionary with "bounce", '
+            '"complaint", "delivery" or "rolled_up" keys')
+    for days in retention.values():
+        if days is not None and (not isinstance(days, int) or days < 1):
+            raise ImproperlyConfigured(
+                'BOUNCY_RETENTION_DAYS must give a positive number of days')
+    return dict(retention)
+
+
+def _decode_json(value):
+    """Function to decode JSON from a string or UTF-8 bytes with `json`"""
+    if isinstance(value, bytes):
+        # UnicodeDecodeError is a ValueError, like invalid JSON
+        value = value.decode('utf-8')
+    return json.loads(value)
+
+
+# json.loads only accepts bytes from Python 3.6
+_STDLIB_JSON_LOADS = (
+    json.loads if sys.version_info >= (3, 6) else _decode_json)
+
+
+def _json_loads(source):
+    """
+    Return the function used to decode notifications
+
+    BOUNCY_JSON_BACKEND is "json", "orjson", the dotted path of a function
+    that works like `json.loads`, or "auto" to use orjson when it's installed.
+    The function must accept bytes and raise `ValueError` for invalid JSON.
+    """
+    backend = getattr(source, 'BOUNCY_JSON_BACKEND', 'auto')
+    if backend in ('auto', 'orjson'):
+        try:
+            import orjson
+        except ImportError:
+            if backend == 'orjson':
+                raise ImproperlyConfigured(
+                    'BOUNCY_JSON_BACKEND is "orjson" but it is not installed')
+            return _STDLIB_JSON_LOADS
+        return orjson.loads
+    if backend == 'json':
+        return _STDLIB_JSON_LOADS
+    try:
+        return import_string(backend)
+    except ImportError as error:
+        raise ImproperlyConfigured(
+            'BOUNCY_JSON_BACKEND could not be imported: {}'.format(error))
+
+
+def _metrics_sink(source):
+    """Return an instance of the sink class named by BOUNCY_METRICS_SINK"""
+    path = getattr(source, 'BOUNCY_METRICS_SINK', None)
+    if path is None:
+        return None
+    try:
+        return import_string(path)()
+    except ImportError as error:
+        raise ImproperlyConfigured(
+            'BOUNCY_METRICS_SINK could not be imported: {}'.format(error))
+
+
+def _cert_fetcher(source):
+    """Return the callable named by BOUNCY_CERT_FETCHER"""
+    path = getattr(
+        source, 'BOUNCY_CERT_FETCHER', 'django_bouncy.fetchers.HTTPFetcher')
+    try:
+        fetcher = import_string(path)
+    except ImportError as error:
+        raise ImproperlyConfigured(
+            'BOUNCY_CERT_FETCHER could not be imported: {}'.format(error))
+    if isinstance(fetcher, type):
+        fetcher = fetcher()
+    return fetcher
+
+
+def _signature_backend(source):
+    """Return an instance of the class named by BOUNCY_SIGNATURE_BACKEND"""
+    path = getattr(
+        source, 'BOUNCY_SIGNATURE_BACKEND',
+        'django_bouncy.signatures.CryptographyBackend'
+    )
+    try:
+        return import_string(path)()
+    except ImportError as error:
+        raise ImproperlyConfigured(
+            'BOUNCY_SIGNATURE_BACKEND could not be imported: {}'.format(error))
+
+
+def _fetch_timeout(source):
+    """Return the connect and read timeouts for certificate fetches"""
+    timeout = getattr(source, 'BOUNCY_CERT_FETCH_TIMEOUT', (2, 5))
+    try:
+        connect_timeout, read_timeout = timeout
+    except (TypeError, ValueError):
+        connect_timeout = read_timeout = None
+    for value in (connect_timeout, read_timeout):
+        if not isinstance(value, (int, float)) or value <= 0:
+            raise ImproperlyConfigured(
+                'BOUNCY_CERT_FETCH_TIMEOUT must be a pair of positive '
+                'numbers of seconds')
+    return (connect_timeout, read_timeout)
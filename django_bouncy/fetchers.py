@@ -0,0 +1,88 @@
+"""
+Signing certificate fetchers for the django_bouncy app
+
+BOUNCY_CERT_FETCHER is the dotted path of a callable that takes a
+certificate URL and returns its contents as bytes, raising `IOError` if it
+can't. If the path names a class, an instance of it is used.
+"""
+import threading
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+from six.moves import http_client
+
+from django_bouncy.conf import get_settings
+
+
+class HTTPFetcher(object):
+    """
+    Fetches certificates over keep-alive connections
+
+    Each thread keeps one open connection per host, so repeated fetches
+    don't pay for a new TCP and TLS handshake. Connecting and reading are
+    limited by the two values in BOUNCY_CERT_FETCH_TIMEOUT.
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, url):
+        """Return the body of `url`"""
+        parsed = urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+
+        while True:
+            connection, reused = self._connection(
+                parsed.scheme, parsed.netloc)
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                body = response.read()
+            except (IOError, http_client.HTTPException) as error:
+                self._discard(parsed.scheme, parsed.netloc)
+                # The server may have closed a kept-alive connection, so
+                # only give up once a fresh connection has failed too
+                if reused:
+                    continue
+                raise IOError('Certificate Fetch Failed: {!r}'.format(error))
+            if response.status != 200:
+                raise IOError('Certificate Fetch Failed: HTTP {}'.format(
+                    response.status))
+            return body
+
+    def _connection(self, scheme, netloc):
+        """
+        Return this thread's connection to `netloc`, opening it if needed,
+        and whether it was already open
+        """
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        connection = connections.get((scheme, netloc))
+        # The connection closes itself when the server asks it to
+        if connection is not None and connection.sock is not None:
+            return connection, True
+
+        connect_timeout, read_timeout = get_settings().cert_fetch_timeout
+        if scheme == 'https':
+            connection_class = http_client.HTTPSConnection
+        else:
+            connection_class = http_client.HTTPConnection
+        connection = connection_class(netloc, timeout=connect_timeout)
+        try:
+            connection.connect()
+        except IOError as error:
+            raise IOError('Certificate Fetch Failed: {!r}'.format(error))
+        connection.sock.settimeout(read_timeout)
+        connections[(scheme, netloc)] = connection
+        return connection, False
+
+    def _discard(self, scheme, netloc):
+        """Close and forget this thread's connection to `netloc`"""
+        connection = self._local.connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
@@ -0,0 +1,183 @@
+"""
+Timings and counters for the django_bouncy request pipeline
+
+Nothing is recorded unless BOUNCY_METRICS_SINK is the dotted path of a sink
+class, so the only cost while it's turned off is a check for `None`. Use
+`MemorySink` to serve the totals from `django_bouncy.views.metrics` in the
+Prometheus text format, or subclass `NullSink` to send them elsewhere.
+"""
+import functools
+import threading
+import time
+
+from django_bouncy.conf import get_settings
+
+
+class NullSink(object):
+    """
+    A sink that discards everything
+
+    `labels` is always a tuple of sorted (name, value) pairs.
+    """
+    def increment(self, name, labels, value=1):
+        """Add `value` to the counter `name`"""
+        pass
+
+    def timing(self, name, labels, seconds):
+        """Record that something named `name` took `seconds`"""
+        pass
+
+
+class MemorySink(NullSink):
+    """A sink that keeps running totals in memory, for the metrics view"""
+    def __init__(self):
+        self.counters = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, labels, value=1):
+        """Add `value` to the counter `name`"""
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timing(self, name, labels, seconds):
+        """Add `seconds` to the total and count for `name`"""
+        key = (name, labels)
+        with self._lock:
+            count, total = self.timings.get(key, (0, 0.0))
+            self.timings[key] = (count + 1, total + seconds)
+
+    def clear(self):
+        """Reset every total"""
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+
+    def render(self):
+        """Return every total in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+
+        lines = []
+        for (name, labels), value in counters:
+            metric = 'bouncy_{}_total'.format(name)
+            _type_line(lines, metric, 'counter')
+            lines.append('{}{} {}'.format(metric, _labels(labels), value))
+        for (name, labels), (count, total) in timings:
+            metric = 'bouncy_{}'.format(name)
+            _type_line(lines, metric, 'summary')
+            lines.append('{}_count{} {}'.format(
+                metric, _labels(labels), count))
+            lines.append('{}_sum{} {!r}'.format(
+                metric, _labels(labels), total))
+        return '\n'.join(lines) + '\n'
+
+
+def _type_line(lines, metric, metric_type):
+    """Function to add a TYPE line when the lines reach a new metric"""
+    line = '# TYPE {} {}'.format(metric, metric_type)
+    if line not in lines:
+        lines.append(line)
+
+
+def _labels(labels):
+    """Function to format labels for the Prometheus text format"""
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, value.replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    ) + '}'
+
+
+class _NullTimer(object):
+    """A timer that does nothing, for when there's no sink"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    """Times a single stage and records it with `sink`"""
+    __slots__ = ('sink', 'stage', 'started')
+
+    def __init__(self, sink, stage):
+        self.sink = sink
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sink.timing(
+            'stage_seconds', (('stage', self.stage),),
+            time.perf_counter() - self.started
+        )
+        return False
+
+
+def timer(stage):
+    """Function to return a context manager that times the stage `stage`"""
+    sink = get_settings().metrics_sink
+    if sink is None:
+        return NULL_TIMER
+    return _Timer(sink, stage)
+
+
+def increment(name, **labels):
+    """Function to add one to the counter `name`"""
+    sink = get_settings().metrics_sink
+    if sink is not None:
+        sink.increment(name, tuple(sorted(labels.items())))
+
+
+def _record_response(sink, response, started):
+    """Function to record how a request was answered, and how quickly"""
+    sink.timing('request_seconds', (), time.perf_counter() - started)
+    labels = (('status', str(response.status_code)),)
+    if response.status_code in (400, 503):
+        # The body of every rejection names the reason for it
+        labels = (
+            ('reason', response.content.decode('utf-8', 'replace')),
+        ) + labels
+    sink.increment('responses', labels)
+
+
+def instrument_view(view):
+    """Decorator to time a view and count its responses"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        """Instrumented view"""
+        sink = get_settings().metrics_sink
+        if sink is None:
+            return view(request, *args, **kwargs)
+        started = time.perf_counter()
+        response = view(request, *args, **kwargs)
+        _record_response(sink, response, started)
+        return response
+    return wrapper
+
+
+def instrument_async_view(view):
+    """Decorator to time an asynchronous view and count its responses"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        """Instrumented view"""
+        sink = get_settings().metrics_sink
+        if sink is None:
+            return await view(request, *args, **kwargs)
+        started = time.perf_counter()
+        response = await view(request, *args, **kwargs)
+        _record_response(sink, response, started)
+        return response
+    return wrapper
@@ -0,0 +1,81 @@
+"""A small in-process LRU cache for the django_bouncy app"""
+import threading
+import time
+from collections import OrderedDict
+
+# Marker so that a timeout of `None` (never expire) can be passed explicitly
+DEFAULT_TIMEOUT = object()
+
+
+class LRUCache(object):
+    """
+    A bounded, thread-safe least-recently-used cache with per-entry expiry
+
+    Once more than `maxsize` entries are stored the least recently used one
+    is evicted. Expired entries are never returned by `get`, but remain
+    available through `get_stale` until they are evicted, so callers can fall
+    back on them when refreshing an entry fails.
+    """
+    def __init__(self, maxsize=128, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return the value for `key` if it is cached and not expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (
+                    entry[1] is not None and entry[1] <= time.time()):
+                self.misses += 1
+                return default
+            # Mark the key as the most recently used one
+            self._data[key] = self._data.pop(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_stale(self, key, default=None):
+        """Return the value for `key` even if it has expired"""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        """Cache `value` for `timeout` seconds (`None` never expires)"""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        expires = None if timeout is None else time.time() + timeout
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove `key` from the cache"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry and reset the hit and miss counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the hit and miss counters along with the cache size"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
@@ -0,0 +1,154 @@
+"""Benchmark the django_bouncy ingest path with synthetic notifications"""
+import json
+import platform
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from django_bouncy import utils, views
+from django_bouncy.testing import (
+    DEFAULT_TOPIC_ARN, SNSSigner, make_message, make_notification,
+    ses_timestamp, summarize
+)
+
+KINDS = ['bounce', 'complaint', 'delivery']
+
+
+class Command(BaseCommand):
+    """
+    Measure the per-call latency of each stage of the ingest path
+
+    `clean_time`, `verify_notification`, `process_message` and the whole
+    `endpoint` are timed with synthetic notifications, signed with a local
+    key, for every kind of feedback and number of recipients. Everything is
+    written to the default database inside a transaction that is rolled
+    back, so run it against a migrated SQLite or PostgreSQL database to
+    compare them. Feedback signals are never sent, since nothing is
+    committed.
+    """
+    help = 'Benchmark the ingest path with synthetic notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=200,
+            help='Number of calls timed for each benchmark')
+        parser.add_argument(
+            '--recipients', type=int, nargs='+', default=[1, 10, 50],
+            help='Numbers of recipients per notification')
+        parser.add_argument(
+            '--skip-verify', action='store_true',
+            help='Turn off signature verification in the endpoint')
+        parser.add_argument(
+            '--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        # pylint: disable=attribute-defined-outside-init
+        self.iterations = options['iterations']
+        self.signer = SNSSigner()
+        results = {
+            'started_at': ses_timestamp(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'benchmarks': {},
+        }
+
+        with override_settings(
+                BOUNCY_TOPIC_ARN=[DEFAULT_TOPIC_ARN],
+                BOUNCY_VERIFY_CERTIFICATE=not options['skip_verify']):
+            self.signer.install()
+            benchmarks = [
+                ('clean_time', self.bench_clean_time),
+                ('verify_notification', self.bench_verify),
+            ]
+            for kind in KINDS:
+                for recipients in options['recipients']:
+                    benchmarks += [(
+                        'process_message[{}x{}]'.format(kind, recipients),
+                        self.bench_process_message(kind, recipients)
+                    ), (
+                        'endpoint[{}x{}]'.format(kind, recipients),
+                        self.bench_endpoint(kind, recipients)
+                    )]
+
+            with transaction.atomic():
+                for name, benchmark in benchmarks:
+                    results['benchmarks'][name] = self.run(name, benchmark)
+                transaction.set_rollback(True)
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def run(self, name, benchmark):
+        """Time `benchmark` and summarize it, or record why it failed"""
+        latencies = []
+        try:
+            # A failure can't spoil the transaction for later benchmarks
+            with transaction.atomic():
+                for _ in range(self.iterations):
+                    latencies.append(benchmark())
+        except Exception as error:  # pylint: disable=broad-except
+            self.stderr.write('{} failed: {!r}'.format(name, error))
+            return {'error': repr(error)}
+        result = summarize(latencies)
+        self.stderr.write('{}: p50 {:.3f}ms, {:.0f}/s'.format(
+            name, result['p50_ms'], result['per_second'] or 0))
+        return result
+
+    @staticmethod
+    def bench_clean_time():
+        """Time parsing a single SES timestamp"""
+        time_string = ses_timestamp()
+        utils.parsed_times.clear()
+        started = time.perf_counter()
+        utils.clean_time(time_string)
+        return time.perf_counter() - started
+
+    def bench_verify(self):
+        """Time verifying a single signed notification"""
+        notification = self.signer.sign(make_notification(make_message()))
+        started = time.perf_counter()
+        if not utils.verify_notification(notification):
+            raise ValueError('Signature Not Verified')
+        return time.perf_counter() - started
+
+    @staticmethod
+    def bench_process_message(kind, recipients):
+        """Return a benchmark timing `process_message` alone"""
+        def benchmark():
+            """Time processing a single message"""
+            message = make_message(kind, recipients)
+            notification = make_notification(message)
+            started = time.perf_counter()
+            views.process_message(message, notification)
+            return time.perf_counter() - started
+        return benchmark
+
+    def bench_endpoint(self, kind, recipients):
+        """Return a benchmark timing the whole endpoint"""
+        factory = RequestFactory()
+
+        def benchmark():
+            """Time a single request to the endpoint"""
+            notification = self.signer.sign(
+                make_notification(make_message(kind, recipients)))
+            request = factory.post(
+                '/', json.dumps(notification),
+                content_type='text/plain; charset=UTF-8',
+                HTTP_X_AMZ_SNS_TOPIC_ARN=DEFAULT_TOPIC_ARN
+            )
+            started = time.perf_counter()
+            response = views.endpoint(request)
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise ValueError(response.content.decode('utf-8'))
+            return elapsed
+        return benchmark
@@ -0,0 +1,50 @@
+"""Build the shared Bloom filter of suppressed addresses"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_bouncy.bloom import BloomFilter
+from django_bouncy.conf import get_settings
+from django_bouncy.models import AddressStatus
+from django_bouncy.suppression import suppressed_filter
+
+
+class Command(BaseCommand):
+    """
+    Build the Bloom filter of suppressed addresses used by the suppression API
+
+    The new filter replaces the old file atomically, and running processes
+    pick it up on their next check. Run this regularly, for example from
+    cron, since addresses suppressed after a build are only caught by the
+    process that saved their feedback.
+    """
+    help = 'Build the shared Bloom filter of suppressed addresses'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', help='File to write (defaults to BOUNCY_BLOOM_FILE)')
+        parser.add_argument(
+            '--error-rate', type=float,
+            help='False positive rate (defaults to BOUNCY_BLOOM_ERROR_RATE)')
+
+    def handle(self, *args, **options):
+        bouncy_settings = get_settings()
+        path = options['path'] or bouncy_settings.bloom_file
+        if not path:
+            raise CommandError('No path given and BOUNCY_BLOOM_FILE not set')
+        error_rate = options['error_rate'] or bouncy_settings.bloom_error_rate
+
+        started = time.time()
+        queryset = AddressStatus.objects.filter(suppressed_filter())
+        bloom_filter = BloomFilter.for_capacity(
+            queryset.count(), error_rate, built_at=started)
+        for address in queryset.values_list(
+                'address', flat=True).iterator():
+            bloom_filter.add(address)
+        bloom_filter.write(path)
+
+        self.stdout.write(
+            'Wrote {} address(es) to {} ({} bytes) in {:.2f}s'.format(
+                bloom_filter.count, path, len(bloom_filter.data),
+                time.time() - started
+            ))
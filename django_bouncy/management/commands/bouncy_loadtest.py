@@ -0,0 +1,174 @@
+"""Fire notifications at a running django_bouncy endpoint and time them"""
+import copy
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+from six.moves import http_client
+from django.core.management.base import BaseCommand, CommandError
+
+from django_bouncy.testing import (
+    DEFAULT_CERT_URL, DEFAULT_TOPIC_ARN, SNSSigner, make_message,
+    make_notification, summarize
+)
+
+KINDS = ['bounce', 'complaint', 'delivery']
+
+
+class Command(BaseCommand):
+    """
+    Load test an endpoint with synthetic or recorded notifications
+
+    Notifications are posted the way SNS posts them, from `--concurrency`
+    threads that each keep one connection open, and at no more than
+    `--rate` requests per second in total. Every notification gets a new
+    MessageId, so none are treated as duplicates.
+
+    Notifications are unsigned unless `--sign-key` is given, so either turn
+    off BOUNCY_VERIFY_CERTIFICATE on the server, or sign them with a key
+    whose certificate the server can fetch from `--cert-url`.
+    """
+    help = 'Load test a django_bouncy endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='URL of the endpoint')
+        parser.add_argument(
+            '--requests', type=int, default=1000,
+            help='Number of notifications to send')
+        parser.add_argument(
+            '--concurrency', type=int, default=10,
+            help='Number of notifications in flight at once')
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Requests per second to send at (0 sends them flat out)')
+        parser.add_argument(
+            '--kind', choices=KINDS + ['mixed'], default='mixed',
+            help='Kind of synthetic notification to send')
+        parser.add_argument(
+            '--recipients', type=int, default=1,
+            help='Number of recipients in each synthetic notification')
+        parser.add_argument(
+            '--replay', nargs='+', metavar='FILE',
+            help='Send these recorded notifications instead')
+        parser.add_argument(
+            '--topic-arn', default=DEFAULT_TOPIC_ARN,
+            help='Topic the synthetic notifications come from')
+        parser.add_argument(
+            '--sign-key', metavar='FILE',
+            help='Sign notifications with this PEM-encoded private key')
+        parser.add_argument(
+            '--cert-url', default=DEFAULT_CERT_URL,
+            help='SigningCertURL of signed notifications')
+        parser.add_argument(
+            '--timeout', type=float, default=15,
+            help='Seconds to wait for each response (SNS waits 15)')
+
+    def handle(self, *args, **options):
+        # pylint: disable=attribute-defined-outside-init
+        url = urlparse(options['url'])
+        if url.scheme not in ('http', 'https'):
+            raise CommandError('URL must be http or https')
+        self.options = options
+        self.recorded = []
+        for path in options['replay'] or []:
+            with open(path) as recorded_file:
+                self.recorded.append(json.load(recorded_file))
+        self.signer = None
+        if options['sign_key']:
+            with open(options['sign_key'], 'rb') as key_file:
+                self.signer = SNSSigner(
+                    cert_url=options['cert_url'], private_key=key_file.read())
+
+        interval = 1.0 / options['rate'] if options['rate'] else 0
+        next_index = itertools.count()
+        results = []
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self.worker, args=(
+                url, next_index, started, interval, results))
+            for _ in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        summary = summarize([latency for latency, _ in results])
+        self.stdout.write(
+            'Sent {} notification(s) in {:.2f}s ({:.1f} per second)'.format(
+                len(results), elapsed, len(results) / elapsed))
+        if results:
+            self.stdout.write(
+                'Latency: p50 {p50_ms:.1f}ms, p95 {p95_ms:.1f}ms, '
+                'p99 {p99_ms:.1f}ms'.format(**summary))
+        self.stdout.write('Responses:')
+        for outcome, count in Counter(
+                outcome for _, outcome in results).most_common():
+            self.stdout.write('{:>8}  {}'.format(count, outcome))
+
+    def worker(self, url, next_index, started, interval, results):
+        """Send notifications until every one has been sent"""
+        # pylint: disable=too-many-arguments
+        if url.scheme == 'https':
+            connection_class = http_client.HTTPSConnection
+        else:
+            connection_class = http_client.HTTPConnection
+        connection = connection_class(
+            url.netloc, timeout=self.options['timeout'])
+        path = url.path or '/'
+
+        for index in next_index:
+            if index >= self.options['requests']:
+                break
+            if interval:
+                delay = started + index * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            notification = self.build(index)
+            headers = {
+                'Content-Type': 'text/plain; charset=UTF-8',
+                'x-amz-sns-message-type': notification['Type'],
+                'x-amz-sns-message-id': notification['MessageId'],
+                'x-amz-sns-topic-arn': notification['TopicArn'],
+            }
+            body = json.dumps(notification).encode('utf-8')
+
+            request_started = time.perf_counter()
+            try:
+                connection.request('POST', path, body, headers)
+                response = connection.getresponse()
+                content = response.read().decode('utf-8', 'replace')
+                outcome = '{} {}'.format(response.status, content[:80])
+            except (IOError, http_client.HTTPException) as error:
+                # Start a new connection for the next notification
+                connection.close()
+                outcome = 'Failed: {}'.format(error.__class__.__name__)
+            results.append((time.perf_counter() - request_started, outcome))
+        connection.close()
+
+    def build(self, index):
+        """Return the `index`th notification to send"""
+        if self.recorded:
+            notification = copy.deepcopy(
+                self.recorded[index % len(self.recorded)])
+            notification['MessageId'] = str(uuid.uuid4())
+        else:
+            kind = self.options['kind']
+            if kind == 'mixed':
+                kind = KINDS[index % len(KINDS)]
+            notification = make_notification(
+                make_message(kind, self.options['recipients']),
+                topic_arn=self.options['topic_arn']
+            )
+        if self.signer is not None:
+            self.signer.sign(notification)
+        return notification
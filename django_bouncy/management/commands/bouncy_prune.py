@@ -0,0 +1,124 @@
+"""Delete old feedback records from the django_bouncy tables"""
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from django_bouncy.conf import get_settings
+from django_bouncy.models import (
+    Bounce, Complaint, Delivery, RolledUpNotification
+)
+
+MODELS = {
+    'bounce': Bounce,
+    'complaint': Complaint,
+    'delivery': Delivery,
+    'rolled_up': RolledUpNotification,
+}
+
+
+class Command(BaseCommand):
+    """
+    Delete feedback records older than their BOUNCY_RETENTION_DAYS setting
+
+    BOUNCY_RETENTION_DAYS maps "bounce", "complaint" and "delivery" to the
+    number of days their records are kept for, and "rolled_up" to the number
+    of days a notification's deliveries are remembered as rolled up, so a
+    redelivery isn't counted again. Kinds without a setting are never pruned.
+
+    Records are deleted in primary key order, one short transaction per
+    batch, so that no lock is held for long. Since records are saved in
+    order, pruning stops at the first batch with nothing old enough.
+    """
+    help = ('Delete old Bounce, Complaint, Delivery and RolledUpNotification '
+            'records')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', choices=sorted(MODELS),
+            help='Only prune this kind of record (may be repeated)')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of records deleted per transaction')
+        parser.add_argument(
+            '--sleep', type=float, default=0.0,
+            help='Seconds to wait between batches')
+        parser.add_argument(
+            '--archive-dir',
+            help='Save deleted records to a gzipped JSON lines file here')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the records that would be deleted')
+
+    def handle(self, *args, **options):
+        retention = get_settings().retention_days
+        names = options['model'] or sorted(retention)
+        for name in names:
+            if retention.get(name) is None:
+                raise CommandError(
+                    'No BOUNCY_RETENTION_DAYS setting for {}'.format(name))
+
+        for name in names:
+            model = MODELS[name]
+            cutoff = timezone.now() - timedelta(days=retention[name])
+            if options['dry_run']:
+                count = model.objects.filter(created_at__lt=cutoff).count()
+                self.stdout.write('Would delete {} {} record(s)'.format(
+                    count, name))
+                continue
+
+            started = time.time()
+            archive = None
+            if options['archive_dir']:
+                archive = gzip.open(os.path.join(
+                    options['archive_dir'], '{}-{}.jsonl.gz'.format(
+                        name, timezone.now().strftime('%Y%m%d%H%M%S'))
+                ), 'wt')
+            try:
+                count = self.prune(
+                    model, cutoff, options['batch_size'], options['sleep'],
+                    archive
+                )
+            finally:
+                if archive is not None:
+                    archive.close()
+
+            elapsed = time.time() - started
+            rate = count / elapsed if elapsed else 0
+            self.stdout.write(
+                'Deleted {} {} record(s) in {:.2f}s ({:.0f} per second)'
+                .format(count, name, elapsed, rate))
+
+    @staticmethod
+    def prune(model, cutoff, batch_size, sleep, archive=None):
+        """Delete the records of `model` created before `cutoff`"""
+        count = 0
+        last_pk = 0
+        while True:
+            batch = list(model.objects.filter(
+                pk__gt=last_pk).order_by('pk').values_list(
+                    'pk', 'created_at')[:batch_size])
+            old_pks = [pk for pk, created_at in batch if created_at < cutoff]
+            if not old_pks:
+                return count
+
+            with transaction.atomic():
+                queryset = model.objects.filter(
+                    pk__gte=old_pks[0], pk__lte=old_pks[-1],
+                    created_at__lt=cutoff
+                )
+                if archive is not None:
+                    for record in queryset.values().iterator():
+                        archive.write(
+                            json.dumps(record, cls=DjangoJSONEncoder) + '\n')
+                count += queryset.delete()[0]
+
+            last_pk = batch[-1][0]
+            if sleep:
+                time.sleep(sleep)
@@ -0,0 +1,46 @@
+"""Rebuild the django_bouncy AddressStatus table from stored feedback"""
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+
+from django_bouncy.models import AddressStatus, Bounce, Complaint, Delivery
+from django_bouncy.status import update_address_status
+
+
+class Command(BaseCommand):
+    """
+    Rebuild every AddressStatus from the Bounce, Complaint and Delivery tables
+
+    The whole rebuild is a single transaction, so until it commits every
+    address keeps its old status, and `filter_sendable` and
+    SuppressingEmailBackend never see an empty table. Feedback saved while
+    the rebuild is running waits for it, so pause processing (for example
+    with BOUNCY_DEFERRED_PROCESSING) first.
+    """
+    help = 'Rebuild the AddressStatus table from stored feedback'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of feedback records read and applied at once')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=router.db_for_write(AddressStatus)):
+            self.rebuild(options['batch_size'])
+
+    def rebuild(self, batch_size):
+        """Replace every AddressStatus with one built from stored feedback"""
+        AddressStatus.objects.all().delete()
+
+        for model in (Bounce, Complaint, Delivery):
+            count = 0
+            last_pk = 0
+            while True:
+                batch = list(model.objects.filter(
+                    pk__gt=last_pk).order_by('pk')[:batch_size])
+                if not batch:
+                    break
+                update_address_status(model, batch)
+                count += len(batch)
+                last_pk = batch[-1].pk
+            self.stdout.write('Applied {} {} record(s)'.format(
+                count, model._meta.verbose_name))
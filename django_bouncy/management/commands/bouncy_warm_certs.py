@@ -0,0 +1,83 @@
+"""Fetch signing certificates into the on-disk store before they're needed"""
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_bouncy.certstore import read_certificate
+from django_bouncy.conf import get_settings
+from django_bouncy.models import InboxMessage
+from django_bouncy.utils import fetch_keyfile
+
+
+class Command(BaseCommand):
+    """
+    Put signing certificates in BOUNCY_CERT_DIR and the key cache
+
+    Certificates are taken from the URLs given, and from the SigningCertURL
+    of every notification waiting in the inbox with `--from-inbox`. Run it
+    when deploying so no request has to wait for a certificate to download.
+    """
+    help = 'Fetch signing certificates into BOUNCY_CERT_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls', nargs='*', metavar='url', help='SigningCertURL to fetch')
+        parser.add_argument(
+            '--from-inbox', action='store_true',
+            help='Also fetch the certificates of queued notifications')
+        parser.add_argument(
+            '--refresh', action='store_true',
+            help='Fetch certificates again even if they are already stored')
+
+    def handle(self, *args, **options):
+        bouncy_settings = get_settings()
+        if bouncy_settings.cert_dir is None:
+            raise CommandError('BOUNCY_CERT_DIR is not set')
+
+        urls = set(options['urls'])
+        if options['from_inbox']:
+            urls.update(self.inbox_urls())
+
+        failures = 0
+        for url in sorted(urls):
+            # Only fetch from hosts the endpoint would trust
+            if not bouncy_settings.cert_domain_regex.search(
+                    urlparse(url).netloc):
+                self.stderr.write('Improper Certificate Location {}'.format(
+                    url))
+                failures += 1
+                continue
+            # Whatever the key cache holds, only the directory counts
+            if not options['refresh'] and read_certificate(url) is not None:
+                continue
+            try:
+                fetch_keyfile(url)
+            except (IOError, ValueError) as error:
+                self.stderr.write('Could not fetch {}: {}'.format(url, error))
+                failures += 1
+                continue
+            # Failing to write the file is only logged by fetch_keyfile
+            if read_certificate(url) is None:
+                self.stderr.write('Could not store {}'.format(url))
+                failures += 1
+
+        self.stdout.write('Stored {} of {} certificate(s)'.format(
+            len(urls) - failures, len(urls)))
+        if failures:
+            raise CommandError('{} certificate(s) failed'.format(failures))
+
+    @staticmethod
+    def inbox_urls():
+        """Return the SigningCertURL of every queued notification"""
+        json_loads = get_settings().json_loads
+        urls = set()
+        for notification in InboxMessage.objects.values_list(
+                'notification', flat=True).iterator():
+            try:
+                urls.add(json_loads(notification)['SigningCertURL'])
+            except (ValueError, KeyError, TypeError):
+                continue
+        return urls
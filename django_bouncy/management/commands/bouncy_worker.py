@@ -0,0 +1,119 @@
+"""Process notifications queued in the django_bouncy inbox"""
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from django_bouncy.conf import get_settings
+from django_bouncy.models import InboxMessage
+from django_bouncy.views import process_notification
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Process notifications queued while BOUNCY_DEFERRED_PROCESSING is enabled
+
+    Several workers can run at once. Each claims a batch of messages in a
+    short transaction of its own (skipping rows another worker has locked,
+    on databases supporting `SELECT ... FOR UPDATE SKIP LOCKED`), then
+    processes every message in its own transaction. A claim that isn't
+    finished within `--claim-timeout` seconds, such as one left by a worker
+    that died, can be taken by another worker.
+    """
+    help = 'Process notifications queued in the django_bouncy inbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of messages claimed at once')
+        parser.add_argument(
+            '--max-attempts', type=int, default=5,
+            help='Number of times a failing message is retried')
+        parser.add_argument(
+            '--claim-timeout', type=float, default=300,
+            help='Seconds before another worker may take a claimed message')
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help='Seconds to wait when the inbox is empty')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the inbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            claimed, processed = self.process_batch(
+                options['batch_size'], options['max_attempts'],
+                options['claim_timeout']
+            )
+            if processed and options['verbosity'] > 1:
+                self.stdout.write('Processed {} message(s)'.format(processed))
+            if not claimed:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+
+    @staticmethod
+    def claim_batch(batch_size, max_attempts, claim_timeout):
+        """
+        Claim a batch of messages for this worker, and return them
+
+        The claim is committed straight away, so no locks are held while the
+        messages are processed. The update only takes messages that are
+        still unclaimed, so two workers can't claim the same one even where
+        rows can't be locked.
+        """
+        connection = connections[router.db_for_write(InboxMessage)]
+        now = timezone.now()
+        claimable = Q(claimed_at__isnull=True) | Q(
+            claimed_at__lt=now - timedelta(seconds=claim_timeout))
+        queryset = InboxMessage.objects.filter(
+            claimable, attempts__lt=max_attempts).order_by('pk')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        elif connection.features.has_select_for_update:
+            queryset = queryset.select_for_update()
+
+        token = uuid.uuid4().hex
+        with transaction.atomic(using=connection.alias):
+            pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+            InboxMessage.objects.filter(claimable, pk__in=pks).update(
+                claimed_by=token, claimed_at=now)
+        return list(
+            InboxMessage.objects.filter(claimed_by=token).order_by('pk'))
+
+    def process_batch(self, batch_size, max_attempts, claim_timeout):
+        """
+        Claim and process a batch of messages
+
+        Returns a tuple of the number of messages claimed and the number
+        processed successfully. A failing message is kept, with its error,
+        until it has been attempted `max_attempts` times.
+        """
+        using = router.db_for_write(InboxMessage)
+        claimed = processed = 0
+        for inbox_message in self.claim_batch(
+                batch_size, max_attempts, claim_timeout):
+            claimed += 1
+            try:
+                # Each message is saved, and its signals sent, on its own
+                with transaction.atomic(using=using):
+                    process_notification(get_settings().json_loads(
+                        inbox_message.notification))
+                    inbox_message.delete()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.exception(
+                    'Inbox Message Failed %s', inbox_message.sns_messageid)
+                InboxMessage.objects.filter(pk=inbox_message.pk).update(
+                    attempts=F('attempts') + 1, last_error=str(error),
+                    claimed_by=None, claimed_at=None
+                )
+            else:
+                processed += 1
+        return claimed, processed
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_bouncy', '0004_increase_processing_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxMessage',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sns_messageid', models.CharField(max_length=100)),
+                ('notification', models.TextField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(null=True, blank=True)),
+            ],
+        ),
+    ]
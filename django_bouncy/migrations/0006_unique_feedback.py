@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+FEEDBACK_MODELS = ('Bounce', 'Complaint', 'Delivery')
+
+
+def remove_duplicates(apps, schema_editor):
+    """Keep only the first record saved for each message and address"""
+    for model_name in FEEDBACK_MODELS:
+        model = apps.get_model('django_bouncy', model_name)
+        duplicates = model.objects.values(
+            'sns_messageid', 'address'
+        ).annotate(
+            first_id=Min('id'), count=Count('id')
+        ).filter(count__gt=1)
+        for duplicate in duplicates.iterator():
+            model.objects.filter(
+                sns_messageid=duplicate['sns_messageid'],
+                address=duplicate['address']
+            ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_bouncy', '0005_inboxmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='bounce',
+            unique_together=set([('sns_messageid', 'address')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='complaint',
+            unique_together=set([('sns_messageid', 'address')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='delivery',
+            unique_together=set([('sns_messageid', 'address')]),
+        ),
+    ]
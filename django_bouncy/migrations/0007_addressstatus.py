@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_bouncy', '0006_unique_feedback'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddressStatus',
+            fields=[
+                ('address', models.CharField(max_length=254, serialize=False, primary_key=True)),
+                ('hard_bounce', models.BooleanField(default=False, verbose_name='Hard Bounce')),
+                ('soft_bounce_count', models.PositiveIntegerField(default=0, verbose_name='Soft Bounces')),
+                ('complaint', models.BooleanField(default=False)),
+                ('last_bounce_type', models.CharField(max_length=50, null=True, verbose_name='Last Bounce Type', blank=True)),
+                ('last_bounce_subtype', models.CharField(max_length=50, null=True, verbose_name='Last Bounce Subtype', blank=True)),
+                ('last_bounce_time', models.DateTimeField(null=True, blank=True)),
+                ('last_complaint_time', models.DateTimeField(null=True, blank=True)),
+                ('last_delivery_time', models.DateTimeField(null=True, blank=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'address statuses',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_bouncy', '0007_addressstatus'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bounce',
+            index=models.Index(fields=['address', 'feedback_timestamp'], name='bouncy_bounce_address_time'),
+        ),
+        migrations.AddIndex(
+            model_name='bounce',
+            index=models.Index(fields=['mail_id'], name='bouncy_bounce_mail_id'),
+        ),
+        migrations.AddIndex(
+            model_name='bounce',
+            index=models.Index(condition=models.Q(hard=True), fields=['-feedback_timestamp'], name='bouncy_bounce_recent_hard'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['address', 'feedback_timestamp'], name='bouncy_complaint_address_time'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['mail_id'], name='bouncy_complaint_mail_id'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['address', 'delivered_time'], name='bouncy_delivery_address_time'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['mail_id'], name='bouncy_delivery_mail_id'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_bouncy', '0008_feedback_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('hour', models.DateTimeField()),
+                ('sns_topic', models.CharField(max_length=350)),
+                ('mail_from', models.EmailField(max_length=254)),
+                ('domain', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('processing_time_total', models.BigIntegerField(default=0)),
+                ('processing_time_min', models.IntegerField(default=0)),
+                ('processing_time_max', models.IntegerField(default=0)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': set([('hour', 'sns_topic', 'mail_from', 'domain')]),
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_bouncy', '0009_deliveryrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboxmessage',
+            name='claimed_by',
+            field=models.CharField(max_length=32, null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='inboxmessage',
+            name='claimed_at',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_bouncy', '0010_inboxmessage_claim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RolledUpNotification',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sns_messageid', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+    ]
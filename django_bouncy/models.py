@@ -1,5 +1,6 @@
 """Models for the django_bouncy app"""
 from django.db import models
+from django.db.models import Q
 
 
 class Feedback(models.Model):
@@ -20,6 +21,8 @@ class Feedback(models.Model):
     class Meta(object):
         """Meta info for Feedback Abstract Model"""
         abstract = True
+        # SNS may deliver the same notification more than once
+        unique_together = ('sns_messageid', 'address')
 
 
 class Bounce(Feedback):
@@ -43,6 +46,28 @@ class Bounce(Feedback):
         return "%s %s Bounce (message from %s)" % (
             self.address, self.bounce_type, self.mail_from)
 
+    class Meta(Feedback.Meta):
+        """Meta info for the Bounce model"""
+        # The address and time indexes here and on Complaint and Delivery
+        # serve lookups of an exact address. The admin's address search
+        # matches case-insensitively anywhere in an address, so it can't
+        # use them.
+        indexes = [
+            # The bounce history of an address, by time
+            models.Index(
+                fields=['address', 'feedback_timestamp'],
+                name='bouncy_bounce_address_time'
+            ),
+            # Every bounce for a sent email
+            models.Index(fields=['mail_id'], name='bouncy_bounce_mail_id'),
+            # The most recent hard bounces. Only created on databases
+            # supporting partial indexes, such as PostgreSQL and SQLite.
+            models.Index(
+                fields=['-feedback_timestamp'], condition=Q(hard=True),
+                name='bouncy_bounce_recent_hard'
+            ),
+        ]
+
 
 class Complaint(Feedback):
     """A complaint report for an individual email address"""
@@ -58,6 +83,19 @@ class Complaint(Feedback):
         return "%s Complaint (email sender: from %s)" % (
             self.address, self.mail_from)
 
+    class Meta(Feedback.Meta):
+        """Meta info for the Complaint model"""
+        indexes = [
+            # The complaint history of an address, by time
+            models.Index(
+                fields=['address', 'feedback_timestamp'],
+                name='bouncy_complaint_address_time'
+            ),
+            # Every complaint for a sent email
+            models.Index(
+                fields=['mail_id'], name='bouncy_complaint_mail_id'),
+        ]
+
 
 class Delivery(Feedback):
     """A delivery report for an individual email address"""
@@ -70,6 +108,115 @@ class Delivery(Feedback):
         return "%s Delivery (email sender: from %s)" % (
             self.address, self.mail_from)
 
-    class Meta(object):
+    class Meta(Feedback.Meta):
         """Meta info for the Delivery model"""
         verbose_name_plural = 'deliveries'
+        indexes = [
+            # The delivery history of an address, by time. Deliveries have
+            # no feedback_timestamp.
+            models.Index(
+                fields=['address', 'delivered_time'],
+                name='bouncy_delivery_address_time'
+            ),
+            # Every delivery for a sent email
+            models.Index(fields=['mail_id'], name='bouncy_delivery_mail_id'),
+        ]
+
+
+class InboxMessage(models.Model):
+    """
+    A verified notification waiting to be processed
+
+    Only used when BOUNCY_DEFERRED_PROCESSING is enabled. Rows are removed by
+    the `bouncy_worker` management command once they have been processed.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    sns_messageid = models.CharField(max_length=100)
+    notification = models.TextField()
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    # The worker processing the message, and when it claimed it
+    claimed_by = models.CharField(max_length=32, blank=True, null=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    def __unicode__(self):
+        """Unicode representation of InboxMessage"""
+        return "%s Inbox Message (%s attempts)" % (
+            self.sns_messageid, self.attempts)
+
+
+class AddressStatus(models.Model):
+    """
+    The current feedback state of a single, normalized email address
+
+    Kept up to date as feedback is saved, so deciding whether an address is
+    safe to send to only needs a primary key lookup. Every field can be
+    updated in any order, so feedback arriving out of order gives the same
+    result.
+    """
+    address = models.CharField(primary_key=True, max_length=254)
+    hard_bounce = models.BooleanField(
+        default=False, verbose_name="Hard Bounce")
+    soft_bounce_count = models.PositiveIntegerField(
+        default=0, verbose_name="Soft Bounces")
+    complaint = models.BooleanField(default=False)
+    last_bounce_type = models.CharField(
+        blank=True, null=True, max_length=50, verbose_name="Last Bounce Type")
+    last_bounce_subtype = models.CharField(
+        blank=True, null=True, max_length=50,
+        verbose_name="Last Bounce Subtype"
+    )
+    last_bounce_time = models.DateTimeField(blank=True, null=True)
+    last_complaint_time = models.DateTimeField(blank=True, null=True)
+    last_delivery_time = models.DateTimeField(blank=True, null=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        """Unicode representation of AddressStatus"""
+        return "%s Status" % self.address
+
+    class Meta(object):
+        """Meta info for the AddressStatus model"""
+        verbose_name_plural = 'address statuses'
+
+
+class DeliveryRollup(models.Model):
+    """
+    Delivery counts for one sender, topic and recipient domain over an hour
+
+    Used in place of individual Delivery records for the senders and topics
+    in BOUNCY_ROLLUP_SENDERS and BOUNCY_ROLLUP_TOPICS.
+    """
+    hour = models.DateTimeField()
+    sns_topic = models.CharField(max_length=350)
+    mail_from = models.EmailField()
+    domain = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+    processing_time_total = models.BigIntegerField(default=0)
+    processing_time_min = models.IntegerField(default=0)
+    processing_time_max = models.IntegerField(default=0)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        """Unicode representation of DeliveryRollup"""
+        return "%s Deliveries to %s (email sender: from %s)" % (
+            self.count, self.domain, self.mail_from)
+
+    class Meta(object):
+        """Meta info for the DeliveryRollup model"""
+        unique_together = ('hour', 'sns_topic', 'mail_from', 'domain')
+
+
+class RolledUpNotification(models.Model):
+    """
+    The MessageId of a notification whose deliveries have been rolled up
+
+    Inserted in the same transaction as the DeliveryRollup increments, so a
+    redelivery of the same notification doesn't count its deliveries twice.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    sns_messageid = models.CharField(max_length=100, unique=True)
+
+    def __unicode__(self):
+        """Unicode representation of RolledUpNotification"""
+        return "%s Rolled Up Notification" % self.sns_messageid
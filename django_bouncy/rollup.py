@@ -0,0 +1,87 @@
+"""Hourly rollups of deliveries for the django_bouncy app"""
+import zlib
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from django_bouncy.conf import get_settings
+from django_bouncy.models import DeliveryRollup, RolledUpNotification
+from django_bouncy.utils import normalize_address
+
+
+def should_roll_up(mail_from, topic):
+    """Function to decide whether deliveries are rolled up, not saved"""
+    config = get_settings()
+    return (
+        normalize_address(mail_from) in config.rollup_senders
+        or topic in config.rollup_topics
+    )
+
+
+def is_sampled(message_id):
+    """
+    Function to decide whether a rolled up notification is also saved
+
+    The decision is made from the notification's MessageId, so the same
+    notification is always either sampled or not, however often SNS sends it.
+    """
+    rate = get_settings().rollup_sample_rate
+    return zlib.crc32(message_id.encode('utf-8')) % 10000 < rate * 10000
+
+
+def roll_up_deliveries(message_id, topic, mail_from, delivered_time,
+                       processing_time, addresses):
+    """
+    Add the deliveries to `addresses` to their hourly DeliveryRollup rows
+
+    Missing rows are created, then every row is updated in the database with
+    F() expressions, so concurrent notifications never lose an increment.
+    Rows are always updated in the same order so that they can't deadlock.
+
+    The notification's `message_id` is recorded in the same transaction, and
+    a notification that has already been rolled up isn't counted again.
+    Returns whether the deliveries were counted.
+    """
+    if timezone.is_aware(delivered_time):
+        # Hours are truncated in UTC, as a time zone may be offset from it by
+        # a fraction of an hour. Naive times are in UTC already.
+        delivered_time = delivered_time.astimezone(timezone.utc)
+    hour = delivered_time.replace(minute=0, second=0, microsecond=0)
+    mail_from = normalize_address(mail_from)
+    counts = Counter(
+        normalize_address(address).rpartition('@')[2]
+        for address in addresses
+    )
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                RolledUpNotification.objects.create(sns_messageid=message_id)
+        except IntegrityError:
+            # A redelivery of a notification that has already been counted
+            return False
+        DeliveryRollup.objects.bulk_create([
+            DeliveryRollup(
+                hour=hour, sns_topic=topic, mail_from=mail_from,
+                domain=domain, processing_time_min=processing_time,
+                processing_time_max=processing_time
+            ) for domain in counts
+        ], ignore_conflicts=True)
+        for domain in sorted(counts):
+            DeliveryRollup.objects.filter(
+                hour=hour, sns_topic=topic, mail_from=mail_from, domain=domain
+            ).update(
+                count=F('count') + counts[domain],
+                processing_time_total=(
+                    F('processing_time_total')
+                    + processing_time * counts[domain]
+                ),
+                processing_time_min=Least(
+                    'processing_time_min', processing_time),
+                processing_time_max=Greatest(
+                    'processing_time_max', processing_time),
+            )
+    return True
@@ -10,3 +10,7 @@ subscription = Signal(providing_args=["result", "notification"])
 
 # New bounce or complaint received
 feedback = Signal(providing_args=["instance", "message", "notification"])
+
+# Every new bounce, complaint or delivery from a single notification
+feedback_batch = Signal(
+    providing_args=["instances", "message", "notification"])
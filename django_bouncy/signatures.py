@@ -0,0 +1,144 @@
+"""
+Signature verification for the django_bouncy app
+
+BOUNCY_SIGNATURE_BACKEND is the dotted path of a class whose instances load
+signing certificates and check signatures against them. Subclass
+`BaseSignatureBackend` to use another library.
+"""
+import calendar
+
+import six
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from django.utils.encoding import smart_bytes
+
+# The fields SNS signs, in the order it signs them, and whether each may be
+# left out of the notification
+NOTIFICATION_FIELDS = (
+    ('Message', False),
+    ('MessageId', False),
+    ('Subject', True),
+    ('Timestamp', False),
+    ('TopicArn', False),
+    ('Type', False),
+)
+SUBSCRIPTION_FIELDS = (
+    ('Message', False),
+    ('MessageId', False),
+    ('SubscribeURL', False),
+    ('Timestamp', False),
+    ('Token', False),
+    ('TopicArn', False),
+    ('Type', False),
+)
+
+# The fields the signature is checked with, and whether each may be left out
+SIGNATURE_FIELDS = (
+    ('Signature', False),
+    ('SignatureVersion', True),
+    ('SigningCertURL', False),
+)
+
+# The hash used for each SignatureVersion
+SIGNATURE_HASHES = {
+    '1': hashes.SHA1,
+    '2': hashes.SHA256,
+}
+
+
+def _signed_fields(data):
+    """Function to return the fields SNS signs for a notification"""
+    if data['Type'] == 'Notification':
+        return NOTIFICATION_FIELDS
+    return SUBSCRIPTION_FIELDS
+
+
+def has_signature_fields(data):
+    """
+    Function to check that a notification has every field its signature is
+    checked with, and that each of them is a string
+    """
+    for field, optional in _signed_fields(data) + SIGNATURE_FIELDS:
+        value = data.get(field)
+        if value is None and optional:
+            continue
+        if not isinstance(value, six.string_types):
+            return False
+    return True
+
+
+def string_to_sign(data):
+    """
+    Function to build the bytes SNS signs for a notification
+
+    Raises `KeyError` if a field that must be signed is missing, so check
+    notifications with `has_signature_fields` first.
+    """
+    parts = []
+    for field, optional in _signed_fields(data):
+        value = data.get(field) if optional else data[field]
+        if value is not None:
+            parts.append(field)
+            parts.append(value)
+    parts.append(u'')
+    return u'\n'.join(parts).encode('utf-8')
+
+
+class BaseSignatureBackend(object):
+    """
+    Loads signing certificates and checks signatures against them
+
+    Whatever `load_certificate` returns is kept in a per-process cache and
+    passed back to `verify`, so do as much of the work as possible there.
+    """
+    def load_certificate(self, pemfile):
+        """
+        Return the public key in the PEM-encoded `pemfile`, and when the
+        certificate expires as a UNIX timestamp
+        """
+        raise NotImplementedError
+
+    def verify(self, public_key, signature, message, signature_version):
+        """
+        Return whether `signature` is `public_key`'s signature of `message`
+        under the SNS SignatureVersion `signature_version`
+        """
+        raise NotImplementedError
+
+
+class CryptographyBackend(BaseSignatureBackend):
+    """Verifies signatures with the `cryptography` library"""
+    def load_certificate(self, pemfile):
+        """
+        Return the public key in the PEM-encoded `pemfile`, and when the
+        certificate expires as a UNIX timestamp
+        """
+        certificate = x509.load_pem_x509_certificate(
+            smart_bytes(pemfile), default_backend())
+        try:
+            expires = certificate.not_valid_after_utc
+        except AttributeError:
+            # cryptography before 42
+            expires = certificate.not_valid_after
+        return (
+            certificate.public_key(),
+            calendar.timegm(expires.utctimetuple())
+        )
+
+    def verify(self, public_key, signature, message, signature_version):
+        """
+        Return whether `signature` is `public_key`'s signature of `message`
+        under the SNS SignatureVersion `signature_version`
+        """
+        algorithm = SIGNATURE_HASHES.get(signature_version)
+        if algorithm is None:
+            return False
+        try:
+            public_key.verify(
+                signature, message, padding.PKCS1v15(), algorithm())
+        except InvalidSignature:
+            return False
+        return True
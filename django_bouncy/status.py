@@ -0,0 +1,70 @@
+"""Maintain the per-address AddressStatus table for the django_bouncy app"""
+from django.db import transaction
+from django.utils import timezone
+
+from django_bouncy.models import AddressStatus, Bounce, Complaint, Delivery
+from django_bouncy.utils import normalize_address
+
+STATUS_FIELDS = [
+    'hard_bounce', 'soft_bounce_count', 'complaint', 'last_bounce_type',
+    'last_bounce_subtype', 'last_bounce_time', 'last_complaint_time',
+    'last_delivery_time', 'modified_at'
+]
+
+
+def update_address_status(model, instances):
+    """
+    Fold newly saved feedback records into their addresses' AddressStatus
+
+    Missing rows are created, then every affected row is locked, updated and
+    written back in bulk. Rows are always locked in the same order so that
+    concurrent notifications can't deadlock each other.
+    """
+    addresses = sorted(set(
+        normalize_address(instance.address) for instance in instances))
+    if not addresses:
+        return
+
+    with transaction.atomic():
+        AddressStatus.objects.bulk_create(
+            [AddressStatus(address=address) for address in addresses],
+            ignore_conflicts=True
+        )
+        statuses = AddressStatus.objects.select_for_update().filter(
+            address__in=addresses).order_by('address').in_bulk()
+
+        now = timezone.now()
+        for instance in instances:
+            status = statuses[normalize_address(instance.address)]
+            apply_feedback(status, model, instance)
+            status.modified_at = now
+
+        AddressStatus.objects.bulk_update(statuses.values(), STATUS_FIELDS)
+
+
+def apply_feedback(status, model, instance):
+    """Update `status` with a single feedback record"""
+    if model is Bounce:
+        when = instance.feedback_timestamp or instance.mail_timestamp
+        if instance.hard:
+            status.hard_bounce = True
+        else:
+            status.soft_bounce_count += 1
+        if _is_latest(status.last_bounce_time, when):
+            status.last_bounce_time = when
+            status.last_bounce_type = instance.bounce_type
+            status.last_bounce_subtype = instance.bounce_subtype
+    elif model is Complaint:
+        when = instance.feedback_timestamp or instance.mail_timestamp
+        status.complaint = True
+        if _is_latest(status.last_complaint_time, when):
+            status.last_complaint_time = when
+    elif model is Delivery:
+        when = instance.delivered_time or instance.mail_timestamp
+        if _is_latest(status.last_delivery_time, when):
+            status.last_delivery_time = when
+
+
+def _is_latest(current, when):
+    """Return True if an event at `when` is newer than one at `current`"""
+    return current is None or (when is not None and when > current)
@@ -0,0 +1,134 @@
+"""
+Check whether email addresses can safely be sent to
+
+An address is suppressed once it has hard bounced, been complained about, or
+soft bounced at least BOUNCY_SOFT_BOUNCE_LIMIT times. Lookups are answered
+from the AddressStatus table, with results kept in a per-process cache that
+is updated whenever new feedback is saved in this process.
+
+If BOUNCY_BLOOM_FILE is set, addresses missing from the Bloom filter built by
+the `bouncy_build_bloom` command are sendable without any further lookup.
+Addresses suppressed since the filter was built are only caught by the
+process that saved their feedback until the filter is rebuilt, so rebuild it
+regularly.
+"""
+import time
+
+from django.core.signals import setting_changed
+from django.db.models import Q
+from django.dispatch import receiver
+
+from django_bouncy.bloom import SharedBloomFilter
+from django_bouncy.conf import get_settings
+from django_bouncy.lru import LRUCache
+from django_bouncy.models import AddressStatus, Bounce, Complaint
+from django_bouncy.utils import normalize_address
+from django_bouncy import signals
+
+# Number of addresses looked up with a single query
+CHUNK_SIZE = 500
+
+# Sized by BOUNCY_SUPPRESSION_CACHE_SIZE each time it is filled
+suppression_cache = LRUCache()
+
+# When this process last saw a bounce or complaint for each address
+recent_feedback = LRUCache(maxsize=10000)
+
+_shared_filter = None
+
+
+def is_suppressed(address):
+    """Return True if `address` should not be sent to"""
+    return not filter_sendable([address])
+
+
+def filter_sendable(addresses):
+    """
+    Return the addresses in `addresses` that can be sent to, in order
+
+    Addresses not found in the cache are looked up with one query for every
+    CHUNK_SIZE addresses.
+    """
+    normalized = [normalize_address(address) for address in addresses]
+
+    bloom_filter = get_bloom_filter()
+    suppressed = {}
+    missing = []
+    for address in set(normalized):
+        if bloom_filter is not None and not _maybe_suppressed(
+                address, bloom_filter):
+            suppressed[address] = False
+            continue
+        cached = suppression_cache.get(address)
+        if cached is None:
+            missing.append(address)
+        else:
+            suppressed[address] = cached
+
+    bouncy_settings = get_settings()
+    suppression_cache.maxsize = bouncy_settings.suppression_cache_size
+    for start in range(0, len(missing), CHUNK_SIZE):
+        chunk = missing[start:start + CHUNK_SIZE]
+        found = set(AddressStatus.objects.filter(
+            suppressed_filter(), address__in=chunk
+        ).values_list('address', flat=True))
+        for address in chunk:
+            suppressed[address] = address in found
+            suppression_cache.set(
+                address, address in found,
+                timeout=bouncy_settings.suppression_cache_timeout
+            )
+
+    return [
+        address for address, normal in zip(addresses, normalized)
+        if not suppressed[normal]
+    ]
+
+
+def get_bloom_filter():
+    """Return the shared Bloom filter in BOUNCY_BLOOM_FILE, if there is one"""
+    global _shared_filter  # pylint: disable=global-statement,invalid-name
+    path = get_settings().bloom_file
+    if path is None:
+        return None
+    if _shared_filter is None or _shared_filter.path != path:
+        _shared_filter = SharedBloomFilter(path)
+    return _shared_filter.get()
+
+
+def _maybe_suppressed(address, bloom_filter):
+    """Return True unless `address` is certainly sendable"""
+    if address in bloom_filter:
+        return True
+    # Catch feedback saved by this process since the filter was built
+    seen_at = recent_feedback.get_stale(address)
+    return seen_at is not None and seen_at >= bloom_filter.built_at
+
+
+def suppressed_filter():
+    """Return a filter matching the AddressStatus of suppressed addresses"""
+    condition = Q(hard_bounce=True) | Q(complaint=True)
+    limit = get_settings().soft_bounce_limit
+    if limit is not None:
+        condition |= Q(soft_bounce_count__gte=limit)
+    return condition
+
+
+@receiver(signals.feedback_batch)
+def invalidate_addresses(sender, instances, **kwargs):
+    """Forget the cached results for addresses that have new feedback"""
+    # pylint: disable=unused-argument
+    now = time.time()
+    for instance in instances:
+        address = normalize_address(instance.address)
+        suppression_cache.delete(address)
+        if sender in (Bounce, Complaint):
+            recent_feedback.set(address, now)
+
+
+@receiver(setting_changed)
+def reset_cache(setting, **kwargs):
+    """Empty the cache when the settings deciding its results change"""
+    # pylint: disable=unused-argument
+    if setting.startswith('BOUNCY_'):
+        suppression_cache.clear()
@@ -0,0 +1,341 @@
+"""
+Synthetic SNS notifications for testing and benchmarking the django_bouncy app
+
+`SNSSigner` holds a locally generated key and self-signed certificate, and
+signs notifications the way SNS does. `SNSSimulator` also serves that
+certificate and answers subscription confirmations over local HTTP, so the
+full verification and subscription paths can be exercised without reaching
+Amazon.
+"""
+import base64
+import json
+import math
+import re
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, quote, urlparse
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+from django.core.cache import caches
+
+from django_bouncy.conf import get_settings
+from django_bouncy.signatures import SIGNATURE_HASHES, string_to_sign
+
+DEFAULT_TOPIC_ARN = 'arn:aws:sns:us-east-1:000000000000:bouncy-synthetic'
+# Matches the default BOUNCY_CERT_DOMAIN_REGEX
+DEFAULT_CERT_URL = (
+    'https://sns.us-east-1.amazonaws.com/'
+    'SimpleNotificationService-bouncy-synthetic.pem'
+)
+
+
+def ses_timestamp(when=None):
+    """Function to format a datetime the way SES and SNS do"""
+    when = when or datetime.utcnow()
+    return when.strftime('%Y-%m-%dT%H:%M:%S.') + '{:03d}Z'.format(
+        when.microsecond // 1000)
+
+
+def make_message(kind='bounce', recipients=1, source='sender@example.com'):
+    """
+    Function to build an SES notification message
+
+    `kind` is "bounce", "complaint" or "delivery", and every message is sent
+    to `recipients` new addresses spread over a few domains.
+    """
+    token = uuid.uuid4().hex[:12]
+    addresses = [
+        'recipient{}-{}@example{}.com'.format(number, token, number % 5)
+        for number in range(recipients)
+    ]
+    timestamp = ses_timestamp()
+    message = {
+        'notificationType': kind.capitalize(),
+        'mail': {
+            'timestamp': timestamp,
+            'messageId': '{}-{}'.format(token, uuid.uuid4()),
+            'source': source,
+            'destination': addresses,
+        },
+    }
+    if kind == 'bounce':
+        message['bounce'] = {
+            'bounceType': 'Permanent',
+            'bounceSubType': 'General',
+            'reportingMTA': 'dns; email.example.com',
+            'timestamp': timestamp,
+            'feedbackId': str(uuid.uuid4()),
+            'bouncedRecipients': [{
+                'emailAddress': address,
+                'status': '5.1.1',
+                'action': 'failed',
+                'diagnosticCode': 'smtp; 550 5.1.1 user unknown',
+            } for address in addresses],
+        }
+    elif kind == 'complaint':
+        message['complaint'] = {
+            'userAgent': 'Synthetic Feedback Loop',
+            'complaintFeedbackType': 'abuse',
+            'arrivalDate': timestamp,
+            'timestamp': timestamp,
+            'feedbackId': str(uuid.uuid4()),
+            'complainedRecipients': [
+                {'emailAddress': address} for address in addresses],
+        }
+    elif kind == 'delivery':
+        message['delivery'] = {
+            'timestamp': timestamp,
+            'processingTimeMillis': 546,
+            'recipients': addresses,
+            'reportingMTA': 'a8-70.smtp-out.amazonses.com',
+            'smtpResponse': '250 ok: Message accepted',
+        }
+    else:
+        raise ValueError('Unknown Message Kind {}'.format(kind))
+    return message
+
+
+def make_notification(message, topic_arn=DEFAULT_TOPIC_ARN,
+                      cert_url=DEFAULT_CERT_URL):
+    """Function to wrap `message` in an unsigned SNS notification"""
+    return {
+        'Type': 'Notification',
+        'MessageId': str(uuid.uuid4()),
+        'TopicArn': topic_arn,
+        'Message': json.dumps(message),
+        'Timestamp': ses_timestamp(),
+        'SignatureVersion': '1',
+        'Signature': '',
+        'SigningCertURL': cert_url,
+        'UnsubscribeURL': (
+            'https://sns.us-east-1.amazonaws.com/?Action=Unsubscribe'
+            '&SubscriptionArn={}:{}'.format(topic_arn, uuid.uuid4())
+        ),
+    }
+
+
+class SNSSigner(object):
+    """
+    Signs notifications with a locally generated key, the way SNS does
+
+    The matching self-signed certificate is `certificate_pem`. `install`
+    puts it in the BOUNCY_KEY_CACHE under `cert_url`, so
+    `verify_notification` finds it without making a request. A new key is
+    generated unless the PEM-encoded `private_key` is given. Notifications
+    are signed with SHA1 for `signature_version` "1", and SHA256 for "2".
+    """
+    def __init__(self, cert_url=DEFAULT_CERT_URL, key_size=2048,
+                 private_key=None, signature_version='1'):
+        self.cert_url = cert_url
+        self.signature_version = signature_version
+        if private_key is None:
+            self.private_key = rsa.generate_private_key(
+                public_exponent=65537, key_size=key_size,
+                backend=default_backend()
+            )
+        else:
+            self.private_key = serialization.load_pem_private_key(
+                private_key, password=None, backend=default_backend())
+        name = x509.Name([
+            x509.NameAttribute(NameOID.COMMON_NAME, u'sns.amazonaws.com')])
+        now = datetime.utcnow()
+        certificate = x509.CertificateBuilder().subject_name(
+            name
+        ).issuer_name(
+            name
+        ).public_key(
+            self.private_key.public_key()
+        ).serial_number(
+            x509.random_serial_number()
+        ).not_valid_before(
+            now - timedelta(days=1)
+        ).not_valid_after(
+            now + timedelta(days=30)
+        ).sign(self.private_key, hashes.SHA256(), default_backend())
+        self.certificate_pem = certificate.public_bytes(
+            serialization.Encoding.PEM)
+
+    def sign(self, notification):
+        """Sign `notification` in place, and return it"""
+        notification['SigningCertURL'] = self.cert_url
+        notification['SignatureVersion'] = self.signature_version
+        signature = self.private_key.sign(
+            string_to_sign(notification), padding.PKCS1v15(),
+            SIGNATURE_HASHES[self.signature_version]()
+        )
+        notification['Signature'] = base64.b64encode(signature).decode('ascii')
+        return notification
+
+    def install(self):
+        """Put the certificate in the key cache under `cert_url`"""
+        caches[get_settings().key_cache].set(
+            self.cert_url, self.certificate_pem, None)
+
+
+CONFIRM_SUBSCRIPTION_RESPONSE = u'''<ConfirmSubscriptionResponse \
+xmlns="http://sns.amazonaws.com/doc/2010-03-31/">
+  <ConfirmSubscriptionResult>
+    <SubscriptionArn>{topic_arn}:{subscription}</SubscriptionArn>
+  </ConfirmSubscriptionResult>
+  <ResponseMetadata>
+    <RequestId>{request}</RequestId>
+  </ResponseMetadata>
+</ConfirmSubscriptionResponse>'''
+
+
+class _SimulatorServer(socketserver.ThreadingMixIn,
+                       BaseHTTPServer.HTTPServer):
+    """An HTTP server answering each connection in its own thread"""
+    daemon_threads = True
+
+
+class _SimulatorHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the simulator's certificate and subscription confirmations"""
+    protocol_version = 'HTTP/1.1'
+    simulator = None
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer a certificate fetch or a subscription confirmation"""
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == self.simulator.cert_path:
+            self.respond(200, self.simulator.signer.certificate_pem)
+        elif query.get('Action') == ['ConfirmSubscription']:
+            topic_arn = query['TopicArn'][0]
+            self.simulator.confirmed.append((topic_arn, query['Token'][0]))
+            self.respond(200, CONFIRM_SUBSCRIPTION_RESPONSE.format(
+                topic_arn=topic_arn, subscription=uuid.uuid4(),
+                request=uuid.uuid4()
+            ).encode('utf-8'))
+        else:
+            self.respond(404, b'Not Found')
+
+    def respond(self, status, body):
+        """Send `body` with the status code `status`"""
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Don't log every request"""
+        pass
+
+
+class SNSSimulator(object):
+    """
+    A local stand-in for SNS
+
+    Serves the signer's certificate and SubscribeURL confirmations from an
+    HTTP server on `host`, and builds notifications signed so that they
+    point there. Use it as a context manager, and apply `settings()` with
+    `override_settings` so the endpoint accepts its URLs:
+
+        with SNSSimulator() as simulator, override_settings(
+                **simulator.settings()):
+            ...
+
+    Confirmed subscriptions are listed in `confirmed` as (TopicArn, Token)
+    pairs.
+    """
+    cert_path = '/SimpleNotificationService-bouncy-simulator.pem'
+
+    def __init__(self, signer=None, host='127.0.0.1', port=0):
+        self.signer = signer or SNSSigner()
+        self.confirmed = []
+        handler = type('SimulatorHandler', (_SimulatorHandler,), {
+            'simulator': self})
+        self.server = _SimulatorServer((host, port), handler)
+        self.netloc = '{}:{}'.format(*self.server.server_address[:2])
+        self.signer.cert_url = 'http://{}{}'.format(
+            self.netloc, self.cert_path)
+        self._thread = None
+
+    def start(self):
+        """Start serving requests in a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving requests"""
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def settings(self, topic_arn=DEFAULT_TOPIC_ARN):
+        """Return the settings that make the endpoint trust the simulator"""
+        domain_regex = '^{}$'.format(re.escape(self.netloc))
+        return {
+            'BOUNCY_TOPIC_ARN': [topic_arn],
+            'BOUNCY_CERT_DOMAIN_REGEX': domain_regex,
+            'BOUNCY_SUBSCRIBE_DOMAIN_REGEX': domain_regex,
+            'BOUNCY_VERIFY_CERTIFICATE': True,
+        }
+
+    def notification(self, kind='bounce', recipients=1,
+                     topic_arn=DEFAULT_TOPIC_ARN):
+        """Return a signed notification of a synthetic message"""
+        return self.signer.sign(make_notification(
+            make_message(kind, recipients), topic_arn=topic_arn))
+
+    def subscription_confirmation(self, topic_arn=DEFAULT_TOPIC_ARN):
+        """Return a signed SubscriptionConfirmation for `topic_arn`"""
+        token = uuid.uuid4().hex
+        return self.signer.sign({
+            'Type': 'SubscriptionConfirmation',
+            'MessageId': str(uuid.uuid4()),
+            'Token': token,
+            'TopicArn': topic_arn,
+            'Message': (
+                'You have chosen to subscribe to the topic {}.\nTo confirm '
+                'the subscription, visit the SubscribeURL included in this '
+                'message.'.format(topic_arn)
+            ),
+            'SubscribeURL': (
+                'http://{}/?Action=ConfirmSubscription&TopicArn={}&Token={}'
+                .format(self.netloc, quote(topic_arn), token)
+            ),
+            'Timestamp': ses_timestamp(),
+        })
+
+
+def summarize(latencies):
+    """
+    Function to summarize per-call latencies, in seconds
+
+    Returns the count, the mean and 50th, 95th and 99th percentiles in
+    milliseconds, and the calls per second they add up to.
+    """
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'count': 0}
+    total = sum(latencies)
+
+    def percentile(fraction):
+        """Return the nearest-rank percentile, in milliseconds"""
+        index = max(0, int(math.ceil(fraction * len(latencies))) - 1)
+        return latencies[index] * 1000
+
+    return {
+        'count': len(latencies),
+        'mean_ms': total / len(latencies) * 1000,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'per_second': len(latencies) / total if total else None,
+    }
@@ -3,3 +3,24 @@
 
 from django_bouncy.tests.views import *
 from django_bouncy.tests.utils import *
+from django_bouncy.tests.conf import *
+from django_bouncy.tests.commands import *
+from django_bouncy.tests.status import *
+from django_bouncy.tests.suppression import *
+from django_bouncy.tests.backends import *
+from django_bouncy.tests.bloom import *
+from django_bouncy.tests.rollup import *
+from django_bouncy.tests.instrumentation import *
+from django_bouncy.tests.testing import *
+from django_bouncy.tests.fetchers import *
+from django_bouncy.tests.certstore import *
+from django_bouncy.tests.signatures import *
+from django_bouncy.tests.admission import *
+
+try:
+    # Asynchronous views need Django 3.1+
+    from django.test import AsyncRequestFactory
+except ImportError:
+    pass
+else:
+    from django_bouncy.tests.async_views import *
@@ -0,0 +1,139 @@
+"""Tests for admission.py in the django-bouncy app"""
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import Http404
+from django.test import RequestFactory
+from django.test.utils import override_settings
+try:
+    # Python 2.6/2.7
+    from mock import patch
+except ImportError:
+    # Python 3
+    from unittest.mock import patch
+
+from django_bouncy.tests.helpers import BouncyTestCase
+from django_bouncy import admission, views
+
+
+class AdmissionControlTest(BouncyTestCase):
+    """Test turning away notifications while the pipeline is full"""
+    def setUp(self):
+        admission.state.reset()
+        caches['default'].delete(admission.CLUSTER_IN_FLIGHT_KEY)
+        self.factory = RequestFactory()
+
+    def post(self):
+        """Post the example notification to the endpoint"""
+        request = self.factory.post(
+            '/', json.dumps(self.notification), content_type='text/plain',
+            HTTP_X_AMZ_SNS_TOPIC_ARN=settings.BOUNCY_TOPIC_ARN[0]
+        )
+        return views.endpoint(request)
+
+    def assertOverloaded(self, response, reason):
+        """Assert that `response` turned a request away for `reason`"""
+        # pylint: disable=invalid-name
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.content.decode('ascii'), reason)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_disabled(self):
+        """Test that nothing is counted without a limit"""
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(admission.state.in_flight, 0)
+        self.assertIsNone(admission.state.write_latency)
+
+    @override_settings(BOUNCY_MAX_IN_FLIGHT=1)
+    def test_in_flight_limit(self):
+        """Test that requests past the in-flight limit are turned away"""
+        clustered, response = admission.admit()
+        self.assertIsNone(response)
+
+        self.assertOverloaded(self.post(), 'Too Many Requests')
+        self.assertEqual(admission.state.rejected, 1)
+
+        admission.release(clustered)
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(admission.state.in_flight, 0)
+
+    @override_settings(BOUNCY_MAX_IN_FLIGHT=1)
+    def test_non_post_not_limited(self):
+        """Test that other requests still get the default HTTP404"""
+        admission.admit()
+        with self.assertRaises(Http404):
+            views.endpoint(self.factory.get('/'))
+
+    @override_settings(BOUNCY_MAX_CLUSTER_IN_FLIGHT=2)
+    def test_cluster_limit(self):
+        """Test that requests past the cluster-wide limit are turned away"""
+        caches['default'].set(admission.CLUSTER_IN_FLIGHT_KEY, 2)
+        self.assertOverloaded(self.post(), 'Too Many Requests')
+        self.assertEqual(
+            caches['default'].get(admission.CLUSTER_IN_FLIGHT_KEY), 2)
+
+        caches['default'].set(admission.CLUSTER_IN_FLIGHT_KEY, 1)
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(
+            caches['default'].get(admission.CLUSTER_IN_FLIGHT_KEY), 1)
+
+    @override_settings(BOUNCY_MAX_CLUSTER_IN_FLIGHT=2)
+    def test_cluster_count_kept_alive(self):
+        """Test that the cluster-wide count is refreshed as requests enter"""
+        cache = caches['default']
+        with patch.object(cache, 'touch', wraps=cache.touch) as touch:
+            clustered, response = admission.admit()
+        self.assertIsNone(response)
+        touch.assert_called_once_with(
+            admission.CLUSTER_IN_FLIGHT_KEY,
+            admission.CLUSTER_IN_FLIGHT_TIMEOUT)
+        admission.release(clustered)
+
+    @override_settings(BOUNCY_MAX_CLUSTER_IN_FLIGHT=2)
+    def test_cluster_count_not_negative(self):
+        """Test that requests counted out after the count expired don't
+        leave room for more than the cluster-wide limit"""
+        caches['default'].set(admission.CLUSTER_IN_FLIGHT_KEY, 0)
+        admission.release(True)
+        self.assertEqual(
+            caches['default'].get(admission.CLUSTER_IN_FLIGHT_KEY), 0)
+
+        caches['default'].set(admission.CLUSTER_IN_FLIGHT_KEY, -3)
+        self.assertEqual(admission.admit(), (True, None))
+        self.assertEqual(admission.admit(), (True, None))
+        self.assertOverloaded(self.post(), 'Too Many Requests')
+        self.assertEqual(
+            caches['default'].get(admission.CLUSTER_IN_FLIGHT_KEY), 2)
+
+    @override_settings(BOUNCY_MAX_WRITE_LATENCY=0.5)
+    def test_write_latency_limit(self):
+        """Test that requests are turned away while writes are slow"""
+        admission.state.record_write(2.0)
+        self.assertOverloaded(self.post(), 'Database Writes Too Slow')
+
+        # Once the average is out of date requests are let through again
+        admission.state.last_write -= 30
+        self.assertEqual(self.post().status_code, 200)
+        self.assertLess(admission.state.write_latency, 2.0)
+
+    def test_write_latency_average(self):
+        """Test that write latency is a moving average"""
+        admission.state.record_write(1.0)
+        admission.state.record_write(2.0)
+        self.assertAlmostEqual(admission.state.write_latency, 1.2)
+
+    @override_settings(BOUNCY_MAX_IN_FLIGHT=10, BOUNCY_MAX_WRITE_LATENCY=1)
+    def test_admission_view(self):
+        """Test that the admission state is served as JSON"""
+        admission.state.record_write(0.25)
+        response = views.admission(self.factory.get('/'))
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {
+            'in_flight': 0,
+            'cluster_in_flight': None,
+            'write_latency': 0.25,
+            'rejected': 0,
+            'max_in_flight': 10,
+            'max_cluster_in_flight': None,
+            'max_write_latency': 1,
+        })
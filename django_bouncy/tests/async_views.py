@@ -0,0 +1,162 @@
+"""Tests for async_views.py in the django-bouncy app"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import AsyncRequestFactory
+from django.test.utils import override_settings
+from django.http import Http404
+try:
+    # Python 2.6/2.7
+    from mock import patch
+except ImportError:
+    # Python 3
+    from unittest.mock import patch
+
+from django_bouncy.tests.helpers import BouncyTestCase, loader
+from django_bouncy import admission, async_views, utils
+from django_bouncy.models import Bounce
+
+
+class AsyncEndpointViewTest(BouncyTestCase):
+    """Test the asynchronous endpoint view"""
+    def setUp(self):
+        """Setup the test"""
+        self.factory = AsyncRequestFactory()
+
+    def post(self, notification):
+        """Return a request from SNS carrying `notification`"""
+        request = self.factory.post(
+            '/', data=json.dumps(notification),
+            content_type='text/plain; charset=UTF-8')
+        request.META['HTTP_X_AMZ_SNS_TOPIC_ARN'] = notification['TopicArn']
+        return request
+
+    async def test_non_post_http404(self):
+        """Test that GET requests to the endpoint throw a 404"""
+        with self.assertRaises(Http404):
+            await async_views.endpoint(self.factory.get('/'))
+
+    async def test_success(self):
+        """Test a successful request"""
+        result = await async_views.endpoint(self.post(self.notification))
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.content.decode('ascii'), 'Bounce Processed')
+
+    async def test_bounce_created(self):
+        """Test that the bounce is added to the database"""
+        await async_views.endpoint(self.post(self.notification))
+        exists = sync_to_async(Bounce.objects.filter(
+            sns_messageid=self.notification['MessageId']).exists)
+        self.assertTrue(await exists())
+
+    @override_settings(BOUNCY_TOPIC_ARN=['Bad ARN'])
+    async def test_bad_topic(self):
+        """Test the response if the topic does not match the settings"""
+        result = await async_views.endpoint(self.post(self.notification))
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(result.content.decode('ascii'), 'Bad Topic')
+
+    @override_settings(BOUNCY_VERIFY_CERTIFICATE=True)
+    @patch('django_bouncy.views.verify_notification')
+    async def test_bad_signature(self, mock):
+        """Test the response if the signature can't be verified"""
+        mock.return_value = False
+        result = await async_views.endpoint(self.post(self.notification))
+        self.assertTrue(mock.called)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(result.content.decode('ascii'), 'Improper Signature')
+
+    @patch('django_bouncy.async_views.approve_subscription')
+    async def test_approve_subscription_called(self, mock):
+        """Test that a approve_subscription is called"""
+        mock.return_value = 'Test Return Value'
+        notification = loader('subscriptionconfirmation')
+        result = await async_views.endpoint(self.post(notification))
+        self.assertTrue(mock.called)
+        self.assertEqual(result, 'Test Return Value')
+
+    @override_settings(BOUNCY_AUTO_SUBSCRIBE=False)
+    async def test_subscription_throws_404(self):
+        """Test that a subscription request throws a 404 if not permitted"""
+        notification = loader('subscriptionconfirmation')
+        with self.assertRaises(Http404):
+            await async_views.endpoint(self.post(notification))
+
+    async def test_unsubscribe_confirmation_not_handled(self):
+        """Test that an unsubscribe notification is properly ignored"""
+        notification = loader('bounce_notification')
+        notification['Type'] = 'UnsubscribeConfirmation'
+        result = await async_views.endpoint(self.post(notification))
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(
+            result.content.decode('ascii'),
+            'UnsubscribeConfirmation Not Handled'
+        )
+
+    async def test_non_json_message_not_allowed(self):
+        """Test that a non-JSON message is properly ignored"""
+        notification = loader('bounce_notification')
+        notification['Message'] = 'Non JSON Message'
+        result = await async_views.endpoint(self.post(notification))
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(
+            result.content.decode('ascii'), 'Message is not valid JSON')
+
+
+DATABASE_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'database': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'bouncy_test_cache',
+    },
+}
+
+
+@override_settings(CACHES=DATABASE_CACHES)
+class AsyncDatabaseCacheTest(BouncyTestCase):
+    """Test the asynchronous endpoint with caches kept in the database"""
+    def setUp(self):
+        """Setup the test"""
+        call_command('createcachetable', 'bouncy_test_cache', verbosity=0)
+        admission.state.reset()
+        self.factory = AsyncRequestFactory()
+
+    def post(self, notification):
+        """Return a request from SNS carrying `notification`"""
+        request = self.factory.post(
+            '/', data=json.dumps(notification),
+            content_type='text/plain; charset=UTF-8')
+        request.META['HTTP_X_AMZ_SNS_TOPIC_ARN'] = notification['TopicArn']
+        return request
+
+    @override_settings(BOUNCY_SEEN_CACHE='database')
+    async def test_seen_cache(self):
+        """Test that the duplicate check doesn't run on the event loop"""
+        result = await async_views.endpoint(self.post(self.notification))
+        self.assertEqual(result.content.decode('ascii'), 'Bounce Processed')
+
+        await sync_to_async(caches['database'].set)(
+            utils.SEEN_KEY_FORMAT.format(self.notification['MessageId']),
+            True
+        )
+        result = await async_views.endpoint(self.post(self.notification))
+        self.assertEqual(
+            result.content.decode('ascii'), 'Duplicate Notification')
+
+    @override_settings(
+        BOUNCY_MAX_CLUSTER_IN_FLIGHT=5, BOUNCY_ADMISSION_CACHE='database')
+    async def test_cluster_count(self):
+        """Test that the shared in-flight count is read off the event loop"""
+        result = await async_views.endpoint(self.post(self.notification))
+        self.assertEqual(result.content.decode('ascii'), 'Bounce Processed')
+        self.assertEqual(await sync_to_async(admission.cluster_in_flight)(), 0)
+
+        # The limit is only enforced if the count could be read
+        await sync_to_async(caches['database'].set)(
+            admission.CLUSTER_IN_FLIGHT_KEY, 5)
+        result = await async_views.endpoint(self.post(self.notification))
+        self.assertEqual(result.status_code, 503)
@@ -0,0 +1,74 @@
+"""Tests for backends.py in the django-bouncy app"""
+from django.core import mail
+from django.core.mail import EmailMessage, get_connection, send_mass_mail
+from django.test.utils import override_settings
+
+from django_bouncy.tests.helpers import BouncyTestCase
+from django_bouncy import suppression
+from django_bouncy.models import AddressStatus
+
+
+@override_settings(
+    EMAIL_BACKEND='django_bouncy.backends.SuppressingEmailBackend',
+    BOUNCY_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+)
+class SuppressingEmailBackendTest(BouncyTestCase):
+    """Test the SuppressingEmailBackend"""
+    def setUp(self):
+        """Setup the backend test"""
+        suppression.suppression_cache.clear()
+        AddressStatus.objects.create(
+            address='hard@example.com', hard_bounce=True)
+
+    def test_suppressed_recipients_removed(self):
+        """Test that suppressed recipients are removed from every field"""
+        message = EmailMessage(
+            'Subject', 'Body', 'sender@example.com',
+            to=['Hard <hard@example.com>', 'good@example.com'],
+            cc=['hard@example.com'], bcc=['other@example.com']
+        )
+        connection = get_connection()
+        sent = connection.send_messages([message])
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(connection.suppressed_count, 2)
+        self.assertEqual(mail.outbox[0].to, ['good@example.com'])
+        self.assertEqual(mail.outbox[0].cc, [])
+        self.assertEqual(mail.outbox[0].bcc, ['other@example.com'])
+        # The original message is left untouched
+        self.assertEqual(len(message.to), 2)
+
+    def test_empty_message_dropped(self):
+        """Test that a message left without recipients isn't sent"""
+        sent = send_mass_mail((
+            ('Subject', 'Body', 'sender@example.com', ['hard@example.com']),
+            ('Subject', 'Body', 'sender@example.com', ['good@example.com']),
+        ))
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['good@example.com'])
+
+    @override_settings(BOUNCY_DROP_SUPPRESSED_MESSAGES=False)
+    def test_empty_message_kept(self):
+        """Test that empty messages are passed on if configured to"""
+        connection = get_connection()
+        connection.send_messages([EmailMessage(
+            'Subject', 'Body', 'sender@example.com', ['hard@example.com'])])
+
+        self.assertEqual(connection.dropped_count, 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [])
+
+    def test_one_lookup_per_batch(self):
+        """Test that a whole batch is checked with a single query"""
+        messages = [
+            EmailMessage(
+                'Subject', 'Body', 'sender@example.com',
+                ['user{}@example.com'.format(number)]
+            )
+            for number in range(20)
+        ]
+        with self.assertNumQueries(1):
+            sent = get_connection().send_messages(messages)
+        self.assertEqual(sent, 20)
@@ -0,0 +1,112 @@
+"""Tests for bloom.py in the django-bouncy app"""
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from six import StringIO
+
+from django_bouncy.tests.helpers import BouncyTestCase
+from django_bouncy.bloom import BloomFilter, SharedBloomFilter
+from django_bouncy import suppression, views
+from django_bouncy.models import AddressStatus
+
+
+class BloomFilterTest(SimpleTestCase):
+    """Test the Bloom filter"""
+    def setUp(self):
+        """Setup the Bloom filter test"""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'bloom')
+
+    def test_membership(self):
+        """Test that every added key is found, and most others aren't"""
+        bloom_filter = BloomFilter.for_capacity(1000, 0.01)
+        for number in range(1000):
+            bloom_filter.add('user{}@example.com'.format(number))
+
+        for number in range(1000):
+            self.assertIn('user{}@example.com'.format(number), bloom_filter)
+        false_positives = sum(
+            'other{}@example.com'.format(number) in bloom_filter
+            for number in range(10000)
+        )
+        self.assertLess(false_positives, 300)
+
+    def test_write_and_open(self):
+        """Test that a filter survives being written and mapped back"""
+        bloom_filter = BloomFilter.for_capacity(10, 0.001)
+        bloom_filter.add('hard@example.com')
+        bloom_filter.write(self.path)
+
+        mapped = BloomFilter.open(self.path)
+        self.assertIn('hard@example.com', mapped)
+        self.assertNotIn('good@example.com', mapped)
+        self.assertEqual(mapped.count, 1)
+        self.assertEqual(mapped.built_at, bloom_filter.built_at)
+        self.assertEqual(os.listdir(self.directory), ['bloom'])
+
+    def test_invalid_file(self):
+        """Test that a file that isn't a filter is rejected"""
+        with open(self.path, 'wb') as bad_file:
+            bad_file.write(b'Not A Bloom Filter' * 10)
+        with self.assertRaises(ValueError):
+            BloomFilter.open(self.path)
+
+    def test_shared_filter_reloaded(self):
+        """Test that a replaced file is picked up"""
+        shared = SharedBloomFilter(self.path, check_interval=0)
+        self.assertIsNone(shared.get())
+
+        bloom_filter = BloomFilter.for_capacity(10, 0.001)
+        bloom_filter.add('hard@example.com')
+        bloom_filter.write(self.path)
+        self.assertIn('hard@example.com', shared.get())
+
+        bloom_filter = BloomFilter.for_capacity(10, 0.001)
+        bloom_filter.add('other@example.com')
+        bloom_filter.write(self.path)
+        self.assertIn('other@example.com', shared.get())
+
+
+class BloomSuppressionTest(BouncyTestCase):
+    """Test the suppression API with a Bloom filter"""
+    def setUp(self):
+        """Setup the Bloom filter suppression test"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'bloom')
+        suppression.suppression_cache.clear()
+        suppression.recent_feedback.clear()
+
+        AddressStatus.objects.create(
+            address='hard@example.com', hard_bounce=True)
+        AddressStatus.objects.create(address='good@example.com')
+        call_command('bouncy_build_bloom', path=self.path, stdout=StringIO())
+
+        override = override_settings(BOUNCY_BLOOM_FILE=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_negative_without_queries(self):
+        """Test that addresses missing from the filter need no query"""
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                suppression.filter_sendable(
+                    ['good@example.com', 'new@example.com']),
+                ['good@example.com', 'new@example.com']
+            )
+
+    def test_positive_checked(self):
+        """Test that addresses in the filter are checked exactly"""
+        with self.assertNumQueries(1):
+            self.assertTrue(suppression.is_suppressed('hard@example.com'))
+
+    def test_recent_feedback_checked(self):
+        """Test that feedback saved since the build is still caught"""
+        with self.run_on_commit():
+            views.process_bounce(self.bounce, self.notification)
+        self.assertTrue(suppression.is_suppressed('recipient1@example.com'))
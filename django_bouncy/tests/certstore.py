@@ -0,0 +1,36 @@
+"""Tests for certstore.py in the django-bouncy app"""
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from django_bouncy import certstore
+
+
+class CertificateStoreTest(SimpleTestCase):
+    """Test the on-disk certificate store"""
+    def setUp(self):
+        self.cert_dir = os.path.join(tempfile.mkdtemp(), 'certs')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.cert_dir))
+
+    def test_round_trip(self):
+        """Test that a stored certificate is read back"""
+        with override_settings(BOUNCY_CERT_DIR=self.cert_dir):
+            certstore.write_certificate('https://example.com/a.pem', 'PEM')
+            self.assertEqual(
+                certstore.read_certificate('https://example.com/a.pem'),
+                b'PEM'
+            )
+            self.assertIsNone(
+                certstore.read_certificate('https://example.com/b.pem'))
+        # Only the certificate is left behind
+        self.assertEqual(len(os.listdir(self.cert_dir)), 1)
+
+    def test_disabled(self):
+        """Test that nothing is stored without BOUNCY_CERT_DIR"""
+        certstore.write_certificate('https://example.com/a.pem', b'PEM')
+        self.assertIsNone(
+            certstore.read_certificate('https://example.com/a.pem'))
+        self.assertFalse(os.path.exists(self.cert_dir))
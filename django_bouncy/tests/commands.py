@@ -0,0 +1,380 @@
+"""Tests for the management commands in the django-bouncy app"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+
+from cryptography.hazmat.primitives import serialization
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+from six import StringIO
+from six.moves import BaseHTTPServer
+try:
+    # Python 2.6/2.7
+    from mock import patch
+except ImportError:
+    # Python 3
+    from unittest.mock import patch
+
+from django_bouncy.tests.helpers import BouncyTestCase, DIRNAME, loader
+from django_bouncy.models import (
+    AddressStatus, Bounce, Complaint, Delivery, InboxMessage,
+    RolledUpNotification
+)
+from django_bouncy import views
+from django_bouncy.testing import SNSSigner, SNSSimulator
+
+
+class BouncyWorkerTest(BouncyTestCase):
+    """Test the bouncy_worker command"""
+    def queue(self, notification):
+        """Add `notification` to the inbox"""
+        return InboxMessage.objects.create(
+            sns_messageid=notification['MessageId'],
+            notification=json.dumps(notification)
+        )
+
+    def test_inbox_drained(self):
+        """Test that queued notifications are processed and removed"""
+        self.queue(self.notification)
+        self.queue(loader('complaint_notification'))
+
+        call_command('bouncy_worker', once=True, batch_size=1)
+
+        self.assertFalse(InboxMessage.objects.exists())
+        self.assertTrue(Bounce.objects.filter(
+            sns_messageid=self.notification['MessageId']).exists())
+        self.assertTrue(Complaint.objects.exists())
+
+    def test_non_json_message_dropped(self):
+        """Test that a notification without a JSON message is discarded"""
+        notification = loader('bounce_notification')
+        notification['Message'] = 'Non JSON Message'
+        self.queue(notification)
+
+        call_command('bouncy_worker', once=True)
+
+        self.assertFalse(InboxMessage.objects.exists())
+
+    def test_failure_recorded(self):
+        """Test that a failing notification is kept with its error"""
+        notification = loader('bounce_notification')
+        message = json.loads(notification['Message'])
+        del message['bounce']
+        notification['Message'] = json.dumps(message)
+        inbox_message = self.queue(notification)
+
+        call_command('bouncy_worker', once=True, max_attempts=2)
+
+        inbox_message.refresh_from_db()
+        self.assertEqual(inbox_message.attempts, 2)
+        self.assertIn('bounce', inbox_message.last_error)
+
+
+    def test_claimed_message_skipped(self):
+        """Test that a message claimed by another worker is left alone"""
+        inbox_message = self.queue(self.notification)
+        InboxMessage.objects.filter(pk=inbox_message.pk).update(
+            claimed_by='other', claimed_at=timezone.now())
+
+        call_command('bouncy_worker', once=True)
+
+        self.assertTrue(InboxMessage.objects.exists())
+        self.assertFalse(Bounce.objects.exists())
+
+    def test_expired_claim_taken(self):
+        """Test that a message claimed by a worker that died is processed"""
+        inbox_message = self.queue(self.notification)
+        InboxMessage.objects.filter(pk=inbox_message.pk).update(
+            claimed_by='other',
+            claimed_at=timezone.now() - timedelta(seconds=301)
+        )
+
+        call_command('bouncy_worker', once=True)
+
+        self.assertFalse(InboxMessage.objects.exists())
+        self.assertTrue(Bounce.objects.exists())
+
+
+class BouncyRebuildStatusTest(BouncyTestCase):
+    """Test the bouncy_rebuild_status command"""
+    def test_status_rebuilt(self):
+        """Test that the status table is rebuilt from stored feedback"""
+        views.process_bounce(self.bounce, self.notification)
+        AddressStatus.objects.all().delete()
+        AddressStatus.objects.create(address='stale@example.com')
+
+        call_command('bouncy_rebuild_status', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(AddressStatus.objects.values_list('address', flat=True)),
+            ['recipient1@example.com', 'recipient2@example.com']
+        )
+        self.assertTrue(AddressStatus.objects.get(
+            address='recipient1@example.com').hard_bounce)
+
+
+    def test_failed_rebuild_rolled_back(self):
+        """Test that a rebuild that fails leaves the old statuses in place"""
+        views.process_bounce(self.bounce, self.notification)
+
+        with patch('django_bouncy.management.commands.bouncy_rebuild_status.'
+                   'update_address_status', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                call_command('bouncy_rebuild_status', stdout=StringIO())
+
+        self.assertTrue(AddressStatus.objects.get(
+            address='recipient1@example.com').hard_bounce)
+
+
+@override_settings(BOUNCY_RETENTION_DAYS={'delivery': 90})
+class BouncyPruneTest(BouncyTestCase):
+    """Test the bouncy_prune command"""
+    def setUp(self):
+        super(BouncyPruneTest, self).setUp()
+        for number in range(5):
+            Delivery.objects.create(
+                sns_topic='topic', sns_messageid=str(number),
+                mail_timestamp=timezone.now(), mail_id='mail',
+                mail_from='sender@example.com',
+                address='{}@example.com'.format(number)
+            )
+        # The three oldest deliveries are past the retention period
+        Delivery.objects.filter(sns_messageid__in=['0', '1', '2']).update(
+            created_at=timezone.now() - timedelta(days=91))
+
+    def test_old_records_deleted(self):
+        """Test that only records past the retention period are deleted"""
+        out = StringIO()
+        call_command('bouncy_prune', batch_size=2, stdout=out)
+
+        self.assertEqual(
+            sorted(Delivery.objects.values_list('sns_messageid', flat=True)),
+            ['3', '4']
+        )
+        self.assertIn('Deleted 3 delivery record(s)', out.getvalue())
+
+    def test_dry_run(self):
+        """Test that a dry run only counts the old records"""
+        out = StringIO()
+        call_command('bouncy_prune', dry_run=True, stdout=out)
+
+        self.assertEqual(Delivery.objects.count(), 5)
+        self.assertIn('Would delete 3 delivery record(s)', out.getvalue())
+
+    def test_archive(self):
+        """Test that deleted records are archived first"""
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+
+        call_command(
+            'bouncy_prune', archive_dir=archive_dir, stdout=StringIO())
+
+        archive, = os.listdir(archive_dir)
+        with gzip.open(os.path.join(archive_dir, archive), 'rt') as records:
+            archived = [json.loads(line)['sns_messageid'] for line in records]
+        self.assertEqual(sorted(archived), ['0', '1', '2'])
+
+    @override_settings(BOUNCY_RETENTION_DAYS={'rolled_up': 7})
+    def test_rolled_up_pruned(self):
+        """Test that old rolled up MessageIds are deleted"""
+        for number in range(2):
+            RolledUpNotification.objects.create(sns_messageid=str(number))
+        RolledUpNotification.objects.filter(sns_messageid='0').update(
+            created_at=timezone.now() - timedelta(days=8))
+
+        call_command('bouncy_prune', stdout=StringIO())
+
+        self.assertEqual(list(RolledUpNotification.objects.values_list(
+            'sns_messageid', flat=True)), ['1'])
+
+    def test_no_retention_setting(self):
+        """Test that models without a retention setting are refused"""
+        with self.assertRaises(CommandError):
+            call_command('bouncy_prune', model=['bounce'], stdout=StringIO())
+
+
+class BouncyBenchmarkTest(BouncyTestCase):
+    """Test the bouncy_benchmark command"""
+    def test_results_written(self):
+        """Test that every benchmark's results are written as JSON"""
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        output = os.path.join(output_dir, 'results.json')
+
+        call_command(
+            'bouncy_benchmark', iterations=2, recipients=[3], skip_verify=True,
+            output=output, stdout=StringIO(), stderr=StringIO()
+        )
+
+        with open(output) as results_file:
+            results = json.load(results_file)
+        self.assertEqual(results['database'], 'sqlite')
+        self.assertEqual(
+            results['benchmarks']['endpoint[bouncex3]']['count'], 2)
+        self.assertIn('process_message[deliveryx3]', results['benchmarks'])
+        # Nothing the benchmark wrote is kept
+        self.assertFalse(Delivery.objects.exists())
+
+
+class _RecordingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers every POST like the endpoint, and keeps what was posted"""
+    protocol_version = 'HTTP/1.1'
+    posted = []
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Record the notification and answer it"""
+        notification = json.loads(
+            self.rfile.read(int(self.headers['Content-Length'])))
+        self.posted.append((self.headers['x-amz-sns-topic-arn'], notification))
+        body = b'Bounce Processed'
+        if notification['TopicArn'] != self.headers['x-amz-sns-topic-arn']:
+            body = b'Bad Topic'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep the test output quiet"""
+        pass
+
+
+class BouncyLoadtestTest(BouncyTestCase):
+    """Test the bouncy_loadtest command"""
+    def setUp(self):
+        _RecordingHandler.posted = []
+        self.server = BaseHTTPServer.HTTPServer(
+            ('127.0.0.1', 0), _RecordingHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{}/bouncy/'.format(
+            self.server.server_address[1])
+
+    def test_synthetic(self):
+        """Test that synthetic notifications are sent and reported"""
+        out = StringIO()
+        call_command(
+            'bouncy_loadtest', self.url, requests=9, concurrency=3,
+            recipients=4, stdout=out
+        )
+
+        self.assertEqual(len(_RecordingHandler.posted), 9)
+        self.assertEqual(
+            len(set(notification['MessageId']
+                    for _, notification in _RecordingHandler.posted)), 9)
+        self.assertIn('Sent 9 notification(s)', out.getvalue())
+        self.assertIn('9  200 Bounce Processed', out.getvalue())
+        self.assertIn('p99', out.getvalue())
+
+    def test_signed(self):
+        """Test that notifications are signed with the given key"""
+        key = SNSSigner(key_size=1024).private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        key_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, key_dir)
+        with open(os.path.join(key_dir, 'key.pem'), 'wb') as key_file:
+            key_file.write(key)
+
+        call_command(
+            'bouncy_loadtest', self.url, requests=1,
+            sign_key=os.path.join(key_dir, 'key.pem'), stdout=StringIO()
+        )
+
+        _, notification = _RecordingHandler.posted[0]
+        self.assertTrue(notification['Signature'])
+
+    def test_replay(self):
+        """Test that recorded notifications are replayed with new ids"""
+        call_command(
+            'bouncy_loadtest', self.url, requests=2, concurrency=1,
+            replay=[DIRNAME + '/examples/example_bounce_notification.json'],
+            stdout=StringIO()
+        )
+
+        _, notification = _RecordingHandler.posted[0]
+        self.assertEqual(notification['Message'], self.notification['Message'])
+        self.assertNotEqual(
+            notification['MessageId'], self.notification['MessageId'])
+
+
+class BouncyWarmCertsTest(BouncyTestCase):
+    """Test the bouncy_warm_certs command"""
+    def setUp(self):
+        self.simulator = SNSSimulator(signer=SNSSigner(key_size=1024))
+        self.simulator.start()
+        self.addCleanup(self.simulator.stop)
+        self.cert_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cert_dir)
+        warm_settings = override_settings(
+            BOUNCY_CERT_DIR=self.cert_dir, **self.simulator.settings())
+        warm_settings.enable()
+        self.addCleanup(warm_settings.disable)
+
+    def test_urls_stored(self):
+        """Test that the given certificates are stored"""
+        out = StringIO()
+        call_command(
+            'bouncy_warm_certs', self.simulator.signer.cert_url, stdout=out)
+
+        self.assertIn('Stored 1 of 1 certificate(s)', out.getvalue())
+        self.assertEqual(len(os.listdir(self.cert_dir)), 1)
+
+    def test_cached_url_stored(self):
+        """Test that a certificate already in the key cache is stored"""
+        self.simulator.signer.install()
+        call_command(
+            'bouncy_warm_certs', self.simulator.signer.cert_url,
+            stdout=StringIO()
+        )
+
+        self.assertEqual(len(os.listdir(self.cert_dir)), 1)
+
+    def test_stored_url_not_fetched(self):
+        """Test that a certificate already on disk isn't fetched again"""
+        call_command(
+            'bouncy_warm_certs', self.simulator.signer.cert_url,
+            stdout=StringIO()
+        )
+
+        out = StringIO()
+        with patch('django_bouncy.management.commands.bouncy_warm_certs.'
+                   'fetch_keyfile') as mock:
+            call_command(
+                'bouncy_warm_certs', self.simulator.signer.cert_url,
+                stdout=out
+            )
+
+        self.assertFalse(mock.called)
+        self.assertIn('Stored 1 of 1 certificate(s)', out.getvalue())
+
+    def test_inbox_urls_stored(self):
+        """Test that certificates of queued notifications are stored"""
+        notification = self.simulator.notification()
+        InboxMessage.objects.create(
+            sns_messageid=notification['MessageId'],
+            notification=json.dumps(notification)
+        )
+
+        call_command('bouncy_warm_certs', from_inbox=True, stdout=StringIO())
+
+        self.assertEqual(len(os.listdir(self.cert_dir)), 1)
+
+    def test_untrusted_url(self):
+        """Test that certificates on other hosts aren't fetched"""
+        with self.assertRaises(CommandError):
+            call_command(
+                'bouncy_warm_certs', 'https://example.com/cert.pem',
+                stdout=StringIO(), stderr=StringIO()
+            )
+        self.assertEqual(os.listdir(self.cert_dir), [])
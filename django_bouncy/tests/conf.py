@@ -0,0 +1,112 @@
+"""Tests for conf.py in the django-bouncy app"""
+# pylint: disable=protected-access
+import json
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from django_bouncy import conf
+from django_bouncy.conf import get_settings
+
+
+class BouncySettingsTest(SimpleTestCase):
+    """Test the settings snapshot"""
+    @override_settings(BOUNCY_TOPIC_ARN=['arn:one', 'arn:two'])
+    def test_topics_frozenset(self):
+        """Test that the allowed topics are held in a frozenset"""
+        self.assertEqual(
+            get_settings().topic_arns, frozenset(['arn:one', 'arn:two']))
+
+    def test_refreshed_on_setting_change(self):
+        """Test that the snapshot follows changes to the settings"""
+        with override_settings(BOUNCY_AUTO_SUBSCRIBE=False):
+            self.assertFalse(get_settings().auto_subscribe)
+        self.assertTrue(get_settings().auto_subscribe)
+
+    def test_compiled_regex(self):
+        """Test that the domain regexes are compiled"""
+        with override_settings(BOUNCY_CERT_DOMAIN_REGEX=r'example\.com$'):
+            regex = get_settings().cert_domain_regex
+        self.assertTrue(regex.search('sns.example.com'))
+        self.assertFalse(regex.search('example.com.evil'))
+
+    def test_immutable(self):
+        """Test that the snapshot can't be modified"""
+        with self.assertRaises(AttributeError):
+            get_settings().verify_certificate = False
+
+    @override_settings(BOUNCY_TOPIC_ARN='arn:one')
+    def test_string_topic(self):
+        """Test that a single string topic is rejected"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_settings()
+
+    @override_settings(BOUNCY_CERT_DOMAIN_REGEX='(unclosed')
+    def test_bad_regex(self):
+        """Test that an invalid regex is rejected"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_settings()
+
+    @override_settings(BOUNCY_KEY_CACHE='not-a-cache')
+    def test_unknown_cache(self):
+        """Test that an unknown cache alias is rejected"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_settings()
+
+    @override_settings(BOUNCY_RETENTION_DAYS={'deliveries': 90})
+    def test_unknown_retention_model(self):
+        """Test that retention for an unknown kind of feedback is rejected"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_settings()
+
+    def test_json_backend(self):
+        """Test that the JSON backend can be chosen"""
+        with override_settings(BOUNCY_JSON_BACKEND='json'):
+            self.assertIs(get_settings().json_loads, json.loads)
+        with override_settings(BOUNCY_JSON_BACKEND='json.loads'):
+            self.assertIs(get_settings().json_loads, json.loads)
+        self.assertTrue(callable(get_settings().json_loads))
+
+    def test_json_bytes(self):
+        """Test that the stdlib backend decodes bytes on every Python"""
+        self.assertEqual(conf._decode_json(b'{"Type": "\xc3\xa9"}'), {
+            'Type': u'\xe9'})
+        with self.assertRaises(ValueError):
+            conf._decode_json(b'{"Type": "\xff"}')
+
+    @override_settings(BOUNCY_JSON_BACKEND='not_a_module.loads')
+    def test_bad_json_backend(self):
+        """Test that a JSON backend which can't be imported is rejected"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_settings()
+
+    @override_settings(BOUNCY_CERT_FETCH_TIMEOUT=5)
+    def test_bad_fetch_timeout(self):
+        """Test that the fetch timeout must be a connect and read pair"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_settings()
+
+    @override_settings(BOUNCY_SIGNATURE_BACKEND='not_a_module.Backend')
+    def test_bad_signature_backend(self):
+        """Test that a signature backend which can't be imported is rejected"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_settings()
+
+    def test_whole_number_rate(self):
+        """Test that a rate of 0 or 1 may be a whole number"""
+        for rate in (0, 1):
+            with self.settings(BOUNCY_ROLLUP_SAMPLE_RATE=rate):
+                self.assertEqual(get_settings().rollup_sample_rate, rate)
+
+    @override_settings(BOUNCY_ROLLUP_SAMPLE_RATE=True)
+    def test_bad_rate(self):
+        """Test that a rate must be a number"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_settings()
+
+    @override_settings(BOUNCY_MAX_WRITE_LATENCY=-1)
+    def test_bad_write_latency(self):
+        """Test that the write latency limit can't be negative"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_settings()
@@ -0,0 +1,43 @@
+"""Tests for fetchers.py in the django-bouncy app"""
+# pylint: disable=protected-access
+from django.test import SimpleTestCase
+
+from django_bouncy.fetchers import HTTPFetcher
+from django_bouncy.testing import SNSSigner, SNSSimulator
+
+
+class HTTPFetcherTest(SimpleTestCase):
+    """Test the keep-alive certificate fetcher"""
+    def setUp(self):
+        self.simulator = SNSSimulator(signer=SNSSigner(key_size=1024))
+        self.simulator.start()
+        self.addCleanup(self.simulator.stop)
+        self.fetcher = HTTPFetcher()
+
+    def test_fetch(self):
+        """Test that the certificate is fetched"""
+        self.assertEqual(
+            self.fetcher(self.simulator.signer.cert_url),
+            self.simulator.signer.certificate_pem
+        )
+
+    def test_connection_reused(self):
+        """Test that a second fetch reuses the open connection"""
+        url = self.simulator.signer.cert_url
+        key = ('http', self.simulator.netloc)
+        self.fetcher(url)
+        connection = self.fetcher._local.connections[key]
+        self.fetcher(url)
+
+        self.assertIs(self.fetcher._local.connections[key], connection)
+
+    def test_not_found(self):
+        """Test that an unsuccessful response raises IOError"""
+        with self.assertRaises(IOError):
+            self.fetcher('http://{}/missing.pem'.format(self.simulator.netloc))
+
+    def test_unreachable(self):
+        """Test that a host that can't be reached raises IOError"""
+        self.simulator.stop()
+        with self.assertRaises(IOError):
+            self.fetcher(self.simulator.signer.cert_url)
@@ -4,19 +4,28 @@ import json
 
 from django.test import TestCase
 from django.test.utils import override_settings
-from django.conf import settings
+try:
+    # Python 2.6/2.7
+    from mock import patch
+except ImportError:
+    # Python 3
+    from unittest.mock import patch
 
 DIRNAME, _ = os.path.split(os.path.abspath(__file__))
 
 
-@override_settings(BOUNCY_VERIFY_CERTIFICATE=False)
+@override_settings(
+    BOUNCY_VERIFY_CERTIFICATE=False,
+    BOUNCY_TOPIC_ARN=[
+        'arn:aws:sns:us-east-1:250214102493:Demo_App_Unsubscribes'
+    ]
+)
 class BouncyTestCase(TestCase):
     """Custom TestCase for django-bouncy"""
     @classmethod
     def setUpClass(cls):
         """Setup the BouncyTestCase Class"""
         super(BouncyTestCase, cls).setUpClass()
-        cls.old_setting = getattr(settings, 'BOUNCY_TOPIC_ARN', None)
         cls.notification = loader('bounce_notification')
         cls.complaint = loader('complaint')
         cls.bounce = loader('bounce')
@@ -25,15 +34,20 @@ class BouncyTestCase(TestCase):
                                          'pem'))
         cls.pemfile = cls.keyfileobj.read()
 
-        settings.BOUNCY_TOPIC_ARN = [
-            'arn:aws:sns:us-east-1:250214102493:Demo_App_Unsubscribes'
-        ]
-
-    @classmethod
-    def tearDownClass(cls):
-        """Tear down the BouncyTestCase Class"""
-        if cls.old_setting is not None:
-            settings.BOUNCY_TOPIC_ARN = cls.old_setting
+    def run_on_commit(self):
+        """
+        Context manager running the on_commit callbacks registered inside it
+
+        Every test is wrapped in a transaction that is never committed, so
+        without this any transaction.on_commit callback would never run.
+        """
+        if hasattr(self, 'captureOnCommitCallbacks'):
+            # Django 3.2+
+            return self.captureOnCommitCallbacks(execute=True)
+        return patch(
+            'django.db.transaction.on_commit',
+            new=lambda func, using=None: func()
+        )
 
 
 def loader(example_name):
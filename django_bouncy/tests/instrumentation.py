@@ -0,0 +1,72 @@
+"""Tests for instrumentation.py in the django-bouncy app"""
+import json
+
+from django.http import Http404
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from django_bouncy.tests.helpers import BouncyTestCase
+from django_bouncy import instrumentation, views
+from django_bouncy.conf import get_settings
+
+
+@override_settings(
+    BOUNCY_METRICS_SINK='django_bouncy.instrumentation.MemorySink')
+class InstrumentationTest(BouncyTestCase):
+    """Test the instrumentation of the endpoint"""
+    def setUp(self):
+        get_settings().metrics_sink.clear()
+
+    def post(self, notification, topic):
+        """Post `notification` to the endpoint"""
+        request = RequestFactory().post(
+            '/', json.dumps(notification), content_type='application/json',
+            HTTP_X_AMZ_SNS_TOPIC_ARN=topic
+        )
+        return views.endpoint(request)
+
+    def test_processed_notification(self):
+        """Test that stages, types and responses are recorded"""
+        self.post(self.notification, self.notification['TopicArn'])
+
+        sink = get_settings().metrics_sink
+        self.assertEqual(sink.counters[(
+            'notifications', (('type', 'Notification'),))], 1)
+        self.assertEqual(sink.counters[(
+            'messages', (('type', 'Bounce'),))], 1)
+        self.assertEqual(sink.counters[(
+            'responses', (('status', '200'),))], 1)
+        stages = set(
+            labels[0][1] for name, labels in sink.timings
+            if name == 'stage_seconds'
+        )
+        self.assertTrue(set(
+            ['check', 'load_message', 'process_message', 'save']) <= stages)
+
+    def test_rejection_reason(self):
+        """Test that rejected requests are counted by reason"""
+        self.post(self.notification, 'arn:aws:sns:us-east-1:000:Bad')
+
+        sink = get_settings().metrics_sink
+        self.assertEqual(sink.counters[(
+            'responses', (('reason', 'Bad Topic'), ('status', '400')))], 1)
+
+    def test_metrics_view(self):
+        """Test that the metrics view serves the Prometheus text format"""
+        self.post(self.notification, 'arn:aws:sns:us-east-1:000:Bad')
+
+        response = views.metrics(RequestFactory().get('/'))
+        self.assertIn(
+            'bouncy_responses_total{reason="Bad Topic",status="400"} 1',
+            response.content.decode('utf-8')
+        )
+        self.assertIn('bouncy_request_seconds_count 1',
+                      response.content.decode('utf-8'))
+
+    def test_disabled(self):
+        """Test that nothing is recorded without a sink"""
+        with override_settings(BOUNCY_METRICS_SINK=None):
+            self.assertIs(
+                instrumentation.timer('check'), instrumentation.NULL_TIMER)
+            with self.assertRaises(Http404):
+                views.metrics(RequestFactory().get('/'))
@@ -0,0 +1,124 @@
+"""Tests for rollup.py in the django-bouncy app"""
+from datetime import datetime, timedelta, timezone
+
+from django.test.utils import override_settings
+try:
+    # Python 2.6/2.7
+    from mock import patch
+except ImportError:
+    # Python 3
+    from unittest.mock import patch
+
+from django_bouncy.tests.helpers import BouncyTestCase, loader
+from django_bouncy import views
+from django_bouncy.models import (
+    Delivery, DeliveryRollup, RolledUpNotification
+)
+from django_bouncy.rollup import roll_up_deliveries
+
+
+class DeliveryRollupTest(BouncyTestCase):
+    """Test rolling up deliveries"""
+    def setUp(self):
+        """Setup the rollup test"""
+        self.delivery = loader('delivery')
+        self.delivery_notification = loader('delivery_notification')
+
+    @override_settings(BOUNCY_ROLLUP_SENDERS=['Sender@example.com'])
+    def test_rolled_up_by_sender(self):
+        """Test that deliveries from a rolled up sender are only counted"""
+        views.process_delivery(self.delivery, self.delivery_notification)
+
+        self.assertFalse(Delivery.objects.exists())
+        rollup = DeliveryRollup.objects.get()
+        self.assertEqual(rollup.mail_from, 'sender@example.com')
+        self.assertEqual(rollup.domain, 'simulator.amazonses.com')
+        self.assertEqual(rollup.count, 1)
+        self.assertEqual(rollup.processing_time_total, 546)
+        self.assertEqual(rollup.hour.hour, 22)
+        self.assertEqual(rollup.hour.minute, 0)
+
+    def test_rolled_up_by_topic(self):
+        """Test that deliveries from a rolled up topic are only counted"""
+        with override_settings(BOUNCY_ROLLUP_TOPICS=[
+                self.delivery_notification['TopicArn']]):
+            views.process_delivery(self.delivery, self.delivery_notification)
+
+        self.assertFalse(Delivery.objects.exists())
+        self.assertTrue(DeliveryRollup.objects.exists())
+
+    def test_not_rolled_up(self):
+        """Test that other deliveries are saved in full"""
+        views.process_delivery(self.delivery, self.delivery_notification)
+
+        self.assertTrue(Delivery.objects.exists())
+        self.assertFalse(DeliveryRollup.objects.exists())
+
+    @override_settings(
+        BOUNCY_ROLLUP_SENDERS=['sender@example.com'],
+        BOUNCY_ROLLUP_SAMPLE_RATE=1.0
+    )
+    def test_sampled(self):
+        """Test that sampled deliveries are both counted and saved"""
+        views.process_delivery(self.delivery, self.delivery_notification)
+
+        self.assertTrue(Delivery.objects.exists())
+        self.assertTrue(DeliveryRollup.objects.exists())
+
+    @override_settings(BOUNCY_ROLLUP_SENDERS=['sender@example.com'])
+    def test_redelivery_not_counted(self):
+        """Test that a notification sent twice is only counted once"""
+        views.process_delivery(self.delivery, self.delivery_notification)
+        views.process_delivery(self.delivery, self.delivery_notification)
+
+        self.assertEqual(DeliveryRollup.objects.get().count, 1)
+        self.assertEqual(RolledUpNotification.objects.get().sns_messageid,
+                         self.delivery_notification['MessageId'])
+
+    @override_settings(
+        BOUNCY_ROLLUP_SENDERS=['sender@example.com'],
+        BOUNCY_ROLLUP_SAMPLE_RATE=1.0
+    )
+    def test_failed_sample_rolled_back(self):
+        """Test that a rollup is undone if its sample can't be saved"""
+        with patch('django_bouncy.views.save_feedback',
+                   side_effect=RuntimeError('Database Gone')):
+            with self.assertRaises(RuntimeError):
+                views.process_delivery(
+                    self.delivery, self.delivery_notification)
+        self.assertFalse(DeliveryRollup.objects.exists())
+        self.assertFalse(RolledUpNotification.objects.exists())
+
+        # Redelivering the notification counts it once
+        views.process_delivery(self.delivery, self.delivery_notification)
+        self.assertEqual(DeliveryRollup.objects.get().count, 1)
+        self.assertTrue(Delivery.objects.exists())
+
+    def test_counts_combined(self):
+        """Test that deliveries in the same hour and domain are combined"""
+        when = datetime(2015, 1, 1, 10, 30)
+        roll_up_deliveries('one', 'topic', 'sender@example.com', when, 100, [
+            'one@example.com', 'two@example.com', 'three@example.org'])
+        roll_up_deliveries('two', 'topic', 'sender@example.com', when, 40, [
+            'four@Example.com'])
+
+        rollup = DeliveryRollup.objects.get(domain='example.com')
+        self.assertEqual(rollup.count, 3)
+        self.assertEqual(rollup.processing_time_total, 240)
+        self.assertEqual(rollup.processing_time_min, 40)
+        self.assertEqual(rollup.processing_time_max, 100)
+        self.assertEqual(
+            DeliveryRollup.objects.get(domain='example.org').count, 1)
+
+    @override_settings(USE_TZ=True)
+    def test_hour_in_utc(self):
+        """Test that deliveries are rolled up by the hour in UTC"""
+        when = datetime(
+            2015, 1, 1, 10, 45,
+            tzinfo=timezone(timedelta(hours=5, minutes=30)))
+        roll_up_deliveries('one', 'topic', 'sender@example.com', when, 100, [
+            'one@example.com'])
+
+        self.assertEqual(
+            DeliveryRollup.objects.get().hour,
+            datetime(2015, 1, 1, 5, tzinfo=timezone.utc))
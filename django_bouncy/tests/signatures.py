@@ -0,0 +1,80 @@
+"""Tests for signatures.py in the django-bouncy app"""
+import base64
+
+from django.test import SimpleTestCase
+
+from django_bouncy import signatures, testing
+from django_bouncy.tests.helpers import loader
+
+
+class StringToSignTest(SimpleTestCase):
+    """Test building the string SNS signs"""
+    def test_notification(self):
+        """Test that notifications are signed without their Subject"""
+        notification = loader('bounce_notification')
+        self.assertEqual(
+            signatures.string_to_sign(notification),
+            u'Message\n{Message}\nMessageId\n{MessageId}\nTimestamp\n'
+            u'{Timestamp}\nTopicArn\n{TopicArn}\nType\n{Type}\n'.format(
+                **notification).encode('utf-8')
+        )
+
+    def test_subject(self):
+        """Test that a Subject is signed when there is one"""
+        notification = loader('bounce_notification')
+        notification['Subject'] = 'Amazon SES Email Event Notification'
+        self.assertIn(
+            b'MessageId\n' + notification['MessageId'].encode('ascii') +
+            b'\nSubject\nAmazon SES Email Event Notification\nTimestamp\n',
+            signatures.string_to_sign(notification)
+        )
+
+    def test_subscription(self):
+        """Test that subscription confirmations sign their token"""
+        notification = loader('subscriptionconfirmation')
+        self.assertIn(
+            b'\nToken\n' + notification['Token'].encode('ascii') + b'\n',
+            signatures.string_to_sign(notification)
+        )
+
+    def test_missing_field(self):
+        """Test that a missing signed field is an error"""
+        notification = loader('bounce_notification')
+        del notification['Timestamp']
+        with self.assertRaises(KeyError):
+            signatures.string_to_sign(notification)
+
+
+class CryptographyBackendTest(SimpleTestCase):
+    """Test the default signature backend"""
+    @classmethod
+    def setUpClass(cls):
+        super(CryptographyBackendTest, cls).setUpClass()
+        cls.signer = testing.SNSSigner(key_size=1024)
+        cls.backend = signatures.CryptographyBackend()
+        cls.public_key, cls.not_after = cls.backend.load_certificate(
+            cls.signer.certificate_pem)
+
+    def check(self, signature_version, verify_version):
+        """Sign a notification and verify it"""
+        self.signer.signature_version = signature_version
+        notification = self.signer.sign(
+            testing.make_notification(testing.make_message()))
+        return self.backend.verify(
+            self.public_key, base64.b64decode(notification['Signature']),
+            signatures.string_to_sign(notification), verify_version
+        )
+
+    def test_versions(self):
+        """Test that both signature versions are verified"""
+        self.assertTrue(self.check('1', '1'))
+        self.assertTrue(self.check('2', '2'))
+
+    def test_wrong_version(self):
+        """Test that a signature made with another hash is rejected"""
+        self.assertFalse(self.check('1', '2'))
+        self.assertFalse(self.check('2', '1'))
+
+    def test_unknown_version(self):
+        """Test that an unknown signature version is rejected"""
+        self.assertFalse(self.check('1', '3'))
@@ -0,0 +1,101 @@
+"""Tests for status.py in the django-bouncy app"""
+from datetime import datetime
+
+from django_bouncy.tests.helpers import BouncyTestCase, loader
+from django_bouncy import views
+from django_bouncy.models import AddressStatus, Bounce, Complaint, Delivery
+from django_bouncy.status import update_address_status
+
+
+class AddressStatusTest(BouncyTestCase):
+    """Test the AddressStatus table maintenance"""
+    def bounce_record(self, when, bounce_type='Transient', address=None):
+        """Return an unsaved Bounce record"""
+        # pylint: disable=no-self-use
+        return Bounce(
+            address=address or 'recipient@example.com',
+            mail_timestamp=when,
+            feedback_timestamp=when,
+            hard=bounce_type == 'Permanent',
+            bounce_type=bounce_type,
+            bounce_subtype='General'
+        )
+
+    def test_hard_bounce(self):
+        """Test that processing a hard bounce marks its addresses"""
+        views.process_bounce(self.bounce, self.notification)
+
+        status = AddressStatus.objects.get(address='recipient1@example.com')
+        self.assertTrue(status.hard_bounce)
+        self.assertEqual(status.soft_bounce_count, 0)
+        self.assertEqual(status.last_bounce_type, 'Permanent')
+        self.assertTrue(AddressStatus.objects.filter(
+            address='recipient2@example.com', hard_bounce=True).exists())
+
+    def test_soft_bounces_counted(self):
+        """Test that soft bounces are counted"""
+        update_address_status(Bounce, [
+            self.bounce_record(datetime(2015, 1, 1)),
+            self.bounce_record(datetime(2015, 1, 2)),
+        ])
+
+        status = AddressStatus.objects.get(address='recipient@example.com')
+        self.assertFalse(status.hard_bounce)
+        self.assertEqual(status.soft_bounce_count, 2)
+        self.assertEqual(status.last_bounce_time, datetime(2015, 1, 2))
+
+    def test_out_of_order(self):
+        """Test that an older bounce doesn't replace a newer one"""
+        update_address_status(Bounce, [
+            self.bounce_record(datetime(2015, 1, 2), 'Permanent')])
+        update_address_status(Bounce, [
+            self.bounce_record(datetime(2015, 1, 1), 'Transient')])
+
+        status = AddressStatus.objects.get(address='recipient@example.com')
+        self.assertTrue(status.hard_bounce)
+        self.assertEqual(status.soft_bounce_count, 1)
+        self.assertEqual(status.last_bounce_type, 'Permanent')
+        self.assertEqual(status.last_bounce_time, datetime(2015, 1, 2))
+
+    def test_address_normalized(self):
+        """Test that addresses are stored in their normalized form"""
+        update_address_status(Bounce, [self.bounce_record(
+            datetime(2015, 1, 1), address=' Recipient@Example.COM')])
+
+        self.assertTrue(AddressStatus.objects.filter(
+            address='recipient@example.com').exists())
+
+    def test_complaint(self):
+        """Test that processing a complaint marks its addresses"""
+        views.process_complaint(
+            self.complaint, loader('complaint_notification'))
+
+        status = AddressStatus.objects.get(address='recipient1@example.com')
+        self.assertTrue(status.complaint)
+        self.assertIsNotNone(status.last_complaint_time)
+        self.assertFalse(status.hard_bounce)
+
+    def test_delivery(self):
+        """Test that processing a delivery records its time"""
+        views.process_delivery(
+            loader('delivery'), loader('delivery_notification'))
+
+        status = AddressStatus.objects.get(
+            address='success@simulator.amazonses.com')
+        self.assertEqual(
+            status.last_delivery_time,
+            Delivery.objects.get().delivered_time
+        )
+        self.assertFalse(status.hard_bounce)
+        self.assertFalse(status.complaint)
+
+    def test_redelivery_not_counted(self):
+        """Test that a redelivered notification isn't counted twice"""
+        bounce = loader('bounce')
+        bounce['bounce']['bounceType'] = 'Transient'
+        views.process_bounce(bounce, self.notification)
+        views.process_bounce(bounce, self.notification)
+
+        status = AddressStatus.objects.get(address='recipient1@example.com')
+        self.assertEqual(status.soft_bounce_count, 1)
+        self.assertFalse(Complaint.objects.exists())
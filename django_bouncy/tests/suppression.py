@@ -0,0 +1,73 @@
+"""Tests for suppression.py in the django-bouncy app"""
+from django.test.utils import override_settings
+
+from django_bouncy.tests.helpers import BouncyTestCase
+from django_bouncy import suppression, views
+from django_bouncy.models import AddressStatus
+
+
+class SuppressionTest(BouncyTestCase):
+    """Test the suppression lookup API"""
+    def setUp(self):
+        """Setup the suppression test"""
+        suppression.suppression_cache.clear()
+        AddressStatus.objects.create(
+            address='hard@example.com', hard_bounce=True)
+        AddressStatus.objects.create(
+            address='complaint@example.com', complaint=True)
+        AddressStatus.objects.create(
+            address='soft@example.com', soft_bounce_count=3)
+
+    def test_is_suppressed(self):
+        """Test single address lookups"""
+        self.assertTrue(suppression.is_suppressed('hard@example.com'))
+        self.assertTrue(suppression.is_suppressed('complaint@example.com'))
+        self.assertFalse(suppression.is_suppressed('soft@example.com'))
+        self.assertFalse(suppression.is_suppressed('new@example.com'))
+
+    def test_normalized(self):
+        """Test that lookups ignore case and surrounding whitespace"""
+        self.assertTrue(suppression.is_suppressed(' Hard@Example.com'))
+
+    @override_settings(BOUNCY_SOFT_BOUNCE_LIMIT=3)
+    def test_soft_bounce_limit(self):
+        """Test that enough soft bounces suppress an address"""
+        self.assertTrue(suppression.is_suppressed('soft@example.com'))
+
+    def test_filter_sendable(self):
+        """Test that suppressed addresses are removed, keeping the order"""
+        addresses = [
+            'new@example.com', 'hard@example.com', 'soft@example.com',
+            'HARD@example.com', 'new@example.com'
+        ]
+        self.assertEqual(
+            suppression.filter_sendable(addresses),
+            ['new@example.com', 'soft@example.com', 'new@example.com']
+        )
+
+    def test_one_query_per_chunk(self):
+        """Test that addresses are looked up in chunks"""
+        addresses = [
+            'user{}@example.com'.format(number)
+            for number in range(suppression.CHUNK_SIZE + 1)
+        ]
+        with self.assertNumQueries(2):
+            sendable = suppression.filter_sendable(addresses)
+        self.assertEqual(sendable, addresses)
+
+    def test_cached(self):
+        """Test that results are cached"""
+        suppression.filter_sendable(['hard@example.com', 'new@example.com'])
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                suppression.filter_sendable(
+                    ['hard@example.com', 'new@example.com']),
+                ['new@example.com']
+            )
+
+    def test_invalidated_by_feedback(self):
+        """Test that new feedback removes an address from the cache"""
+        self.assertFalse(suppression.is_suppressed('recipient1@example.com'))
+        with self.run_on_commit():
+            views.process_bounce(self.bounce, self.notification)
+        self.assertTrue(suppression.is_suppressed('recipient1@example.com'))
@@ -0,0 +1,121 @@
+"""Tests for testing.py in the django-bouncy app"""
+import base64
+import json
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from django.test import RequestFactory, SimpleTestCase
+from django.test.utils import override_settings
+
+from django_bouncy.tests.helpers import BouncyTestCase
+from django_bouncy import testing, utils, views
+from django_bouncy.models import Bounce
+from django_bouncy.signatures import string_to_sign
+
+
+class SyntheticNotificationTest(SimpleTestCase):
+    """Test the synthetic notification helpers"""
+    @classmethod
+    def setUpClass(cls):
+        super(SyntheticNotificationTest, cls).setUpClass()
+        cls.signer = testing.SNSSigner(key_size=1024)
+
+    def test_message_recipients(self):
+        """Test that messages go to the requested number of recipients"""
+        message = testing.make_message('complaint', recipients=7)
+        self.assertEqual(len(message['complaint']['complainedRecipients']), 7)
+        self.assertTrue(set(views.VITAL_MESSAGE_FIELDS) <= set(message))
+
+    def test_notification_fields(self):
+        """Test that notifications have every field the endpoint needs"""
+        notification = testing.make_notification(testing.make_message())
+        self.assertTrue(
+            set(views.VITAL_NOTIFICATION_FIELDS) <= set(notification))
+        self.assertEqual(
+            json.loads(notification['Message'])['notificationType'], 'Bounce')
+
+    def test_signature(self):
+        """Test that the signature matches the certificate"""
+        notification = self.signer.sign(
+            testing.make_notification(testing.make_message()))
+
+        certificate = x509.load_pem_x509_certificate(
+            self.signer.certificate_pem, default_backend())
+        # Raises InvalidSignature if the signature doesn't match
+        certificate.public_key().verify(
+            base64.b64decode(notification['Signature']),
+            string_to_sign(notification),
+            padding.PKCS1v15(), hashes.SHA1()
+        )
+
+    def test_summarize(self):
+        """Test that latencies are summarized by nearest-rank percentile"""
+        summary = testing.summarize([n / 1000.0 for n in range(1, 101)])
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['p50_ms'], 50)
+        self.assertAlmostEqual(summary['p99_ms'], 99)
+
+
+class SNSSimulatorTest(BouncyTestCase):
+    """Test the local SNS stand-in"""
+    def setUp(self):
+        self.simulator = testing.SNSSimulator(
+            signer=testing.SNSSigner(key_size=1024))
+        self.simulator.start()
+        self.addCleanup(self.simulator.stop)
+        simulator_settings = override_settings(**self.simulator.settings())
+        simulator_settings.enable()
+        self.addCleanup(simulator_settings.disable)
+
+    def post(self, notification):
+        """Post `notification` to the endpoint"""
+        request = RequestFactory().post(
+            '/', json.dumps(notification), content_type='text/plain',
+            HTTP_X_AMZ_SNS_TOPIC_ARN=notification['TopicArn']
+        )
+        return views.endpoint(request)
+
+    def test_certificate_served(self):
+        """Test that the certificate is fetched from the simulator"""
+        self.assertEqual(
+            utils.grab_keyfile(self.simulator.signer.cert_url),
+            self.simulator.signer.certificate_pem
+        )
+
+    def test_subscription_confirmed(self):
+        """Test that SubscribeURL requests are answered"""
+        notification = self.simulator.subscription_confirmation()
+
+        response = utils.approve_subscription(notification)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'ConfirmSubscriptionResponse', response.content)
+        self.assertEqual(self.simulator.confirmed, [
+            (notification['TopicArn'], notification['Token'])])
+
+    def test_verified_notification(self):
+        """Test that a signed notification is verified and processed"""
+        response = self.post(self.simulator.notification(recipients=3))
+
+        self.assertEqual(response.content, b'Bounce Processed')
+        self.assertEqual(Bounce.objects.count(), 3)
+
+    def test_sha256_notification(self):
+        """Test that a SignatureVersion 2 notification is verified"""
+        self.simulator.signer.signature_version = '2'
+        response = self.post(self.simulator.notification())
+
+        self.assertEqual(response.content, b'Bounce Processed')
+
+    def test_tampered_notification(self):
+        """Test that a notification changed after signing is rejected"""
+        notification = self.simulator.notification()
+        notification['Message'] = notification['Message'].replace(
+            'Permanent', 'Transient')
+
+        response = self.post(notification)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content, b'Improper Signature')
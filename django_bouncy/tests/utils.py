@@ -1,6 +1,15 @@
 """Tests for utils.py in the django-bouncy app"""
-from django.conf import settings
+# pylint: disable=protected-access
+import shutil
+import tempfile
+import threading
+import time
+
+import dateutil.parser
+from django.core.cache import caches
 from django.dispatch import receiver
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
 try:
     # Python 2.6/2.7
     from mock import Mock, patch
@@ -9,28 +18,151 @@ except ImportError:
     from unittest.mock import Mock, patch
 
 from django_bouncy.tests.helpers import BouncyTestCase, loader
-from django_bouncy import utils, signals
+from django_bouncy import certstore, utils, signals
+
+
+# Stands in for the network when fetching certificates
+fetcher = Mock()
 
+# Stands in for the clock while the example certificate is still valid
+valid_clock = Mock(return_value=1388534400)
 
+
+@override_settings(BOUNCY_CERT_FETCHER='django_bouncy.tests.utils.fetcher')
 class TestVerificationSystem(BouncyTestCase):
     """Test the message verification utilities"""
-    @patch('django_bouncy.utils.urlopen')
-    def test_grab_keyfile(self, mock):
+    def setUp(self):
+        fetcher.reset_mock(return_value=True, side_effect=True)
+        caches['default'].clear()
+        utils.failed_certificates.clear()
+        utils.invalid_signatures.clear()
+
+    def test_grab_keyfile(self):
         """Test the grab_keyfile plugin"""
-        responsemock = Mock()
-        responsemock.read.return_value = self.pemfile
-        mock.return_value = responsemock
+        fetcher.return_value = self.pemfile
         result = utils.grab_keyfile('http://www.fakeurl.com')
 
-        mock.assert_called_with('http://www.fakeurl.com')
+        fetcher.assert_called_with('http://www.fakeurl.com')
         self.assertEqual(result, self.pemfile)
 
-    @patch('django_bouncy.utils.urlopen')
-    def test_bad_keyfile(self, mock):
+    def test_keyfile_cached(self):
+        """Test that a keyfile is only fetched once"""
+        fetcher.return_value = self.pemfile
+        utils.grab_keyfile('http://www.fakeurl.com')
+        utils.grab_keyfile('http://www.fakeurl.com')
+
+        self.assertEqual(fetcher.call_count, 1)
+
+    def test_keyfile_stored(self):
+        """Test that keyfiles are kept in BOUNCY_CERT_DIR"""
+        cert_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cert_dir)
+        fetcher.return_value = self.pemfile
+
+        with override_settings(BOUNCY_CERT_DIR=cert_dir):
+            utils.grab_keyfile('http://www.fakeurl.com')
+            caches['default'].clear()
+            result = utils.grab_keyfile('http://www.fakeurl.com')
+
+        self.assertEqual(fetcher.call_count, 1)
+        self.assertEqual(result, self.pemfile.encode('ascii'))
+
+    def test_concurrent_fetches_coalesced(self):
+        """Test that concurrent misses for one URL make a single fetch"""
+        def slow_fetch(url):
+            """Take long enough for every thread to miss the cache"""
+            # pylint: disable=unused-argument
+            time.sleep(0.1)
+            return self.pemfile
+        fetcher.side_effect = slow_fetch
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            utils.grab_keyfile('http://www.fakeurl.com'))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(fetcher.call_count, 1)
+        self.assertEqual(results, [self.pemfile] * 5)
+
+    def test_waits_for_other_process(self):
+        """Test that a fetch leased by another process isn't repeated"""
+        key_cache = caches['default']
+        key_cache.add(utils.CERT_LEASE_KEY_FORMAT.format(
+            'http://www.fakeurl.com'), True)
+        timer = threading.Timer(0.1, key_cache.set, args=(
+            'http://www.fakeurl.com', self.pemfile))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        result = utils.grab_keyfile('http://www.fakeurl.com')
+
+        self.assertEqual(result, self.pemfile)
+        self.assertFalse(fetcher.called)
+
+    def test_wait_does_not_hold_lock(self):
+        """Test that waiting on another process doesn't hold up other URLs"""
+        key_cache = caches['default']
+        key_cache.add(utils.CERT_LEASE_KEY_FORMAT.format(
+            'http://www.fakeurl.com'), True)
+        fetcher.return_value = self.pemfile
+        results = []
+
+        with patch.object(utils, 'fetch_locks', [threading.Lock()]):
+            waiter = threading.Thread(target=lambda: results.append(
+                utils.grab_keyfile('http://www.fakeurl.com')))
+            waiter.start()
+            time.sleep(0.1)
+            # The waiting thread shares the only lock with this URL
+            started = time.time()
+            utils.grab_keyfile('http://www.otherurl.com')
+            self.assertLess(time.time() - started, 1)
+
+            key_cache.set('http://www.fakeurl.com', self.pemfile)
+            waiter.join()
+
+        self.assertEqual(results, [self.pemfile])
+        fetcher.assert_called_once_with('http://www.otherurl.com')
+
+    def test_wait_ends_on_failure(self):
+        """Test that waiting on another fetch stops when it fails"""
+        caches['default'].add(utils.CERT_LEASE_KEY_FORMAT.format(
+            'http://www.fakeurl.com'), True)
+        timer = threading.Timer(0.1, utils.failed_certificates.set, args=(
+            'http://www.fakeurl.com', IOError('Host Unreachable')))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        started = time.time()
+        with self.assertRaises(IOError):
+            utils.grab_keyfile('http://www.fakeurl.com')
+
+        self.assertLess(time.time() - started, 1)
+        self.assertFalse(fetcher.called)
+
+    def test_wait_ends_on_stored_certificate(self):
+        """Test that waiting on another process stops when it stores the
+        certificate in BOUNCY_CERT_DIR"""
+        cert_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cert_dir)
+        caches['default'].add(utils.CERT_LEASE_KEY_FORMAT.format(
+            'http://www.fakeurl.com'), True)
+
+        with override_settings(BOUNCY_CERT_DIR=cert_dir):
+            timer = threading.Timer(0.1, certstore.write_certificate, args=(
+                'http://www.fakeurl.com', self.pemfile))
+            timer.start()
+            self.addCleanup(timer.cancel)
+            result = utils.grab_keyfile('http://www.fakeurl.com')
+
+        self.assertEqual(result, self.pemfile.encode('ascii'))
+        self.assertFalse(fetcher.called)
+
+    def test_bad_keyfile(self):
         """Test a non-valid keyfile"""
-        responsemock = Mock()
-        responsemock.read.return_value = 'Not A Certificate'
-        mock.return_value = responsemock
+        fetcher.return_value = 'Not A Certificate'
 
         with self.assertRaises(ValueError) as context_manager:
             utils.grab_keyfile('http://www.fakeurl.com')
@@ -38,6 +170,72 @@ class TestVerificationSystem(BouncyTestCase):
         the_exception = context_manager.exception
         self.assertEqual(the_exception.args[0], 'Invalid Certificate File')
 
+    def test_failed_fetch_remembered(self):
+        """Test that a failed fetch isn't repeated straight away"""
+        fetcher.side_effect = IOError('Host Unreachable')
+        for _ in range(2):
+            with self.assertRaises(IOError):
+                utils.grab_keyfile('http://www.fakeurl.com')
+
+        self.assertEqual(fetcher.call_count, 1)
+
+    def test_failed_fetch_not_repeated_by_waiters(self):
+        """Test that threads waiting on a failing fetch don't repeat it"""
+        def slow_failure(url):
+            """Take long enough for every thread to wait on the lock"""
+            # pylint: disable=unused-argument
+            time.sleep(0.1)
+            raise IOError('Host Unreachable')
+        fetcher.side_effect = slow_failure
+
+        errors = []
+
+        def grab():
+            """Record the error each thread sees"""
+            try:
+                utils.grab_keyfile('http://www.fakeurl.com')
+            except IOError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=grab) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(fetcher.call_count, 1)
+        self.assertEqual(len(errors), 5)
+
+    @override_settings(BOUNCY_NEGATIVE_CACHE_TIMEOUT=0)
+    def test_failed_fetch_retried(self):
+        """Test that failed fetches are retried with no negative cache"""
+        fetcher.side_effect = IOError('Host Unreachable')
+        for _ in range(2):
+            with self.assertRaises(IOError):
+                utils.grab_keyfile('http://www.fakeurl.com')
+
+        self.assertEqual(fetcher.call_count, 2)
+
+    def test_expired_certificate_rejected(self):
+        """Test that an expired certificate is rejected and forgotten"""
+        cert_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cert_dir)
+        fetcher.return_value = self.pemfile
+
+        with override_settings(BOUNCY_CERT_DIR=cert_dir):
+            for _ in range(2):
+                with self.assertRaises(ValueError) as context_manager:
+                    utils.load_certificate('http://www.fakeurl.com')
+                self.assertEqual(
+                    context_manager.exception.args[0], 'Expired Certificate')
+
+            self.assertIsNone(caches['default'].get('http://www.fakeurl.com'))
+            self.assertIsNone(
+                certstore.read_certificate('http://www.fakeurl.com'))
+        # The second attempt didn't fetch or parse it again
+        self.assertEqual(fetcher.call_count, 1)
+
+    @patch('time.time', valid_clock)
     @patch('django_bouncy.utils.grab_keyfile')
     def test_verify_notification(self, mock):
         """Test the verification of a valid notification"""
@@ -45,6 +243,7 @@ class TestVerificationSystem(BouncyTestCase):
         result = utils.verify_notification(self.notification)
         self.assertTrue(result)
 
+    @patch('time.time', valid_clock)
     @patch('django_bouncy.utils.grab_keyfile')
     def test_verify_subscription_notification(self, mock):
         """Test the verification of a valid subscription notification"""
@@ -54,6 +253,7 @@ class TestVerificationSystem(BouncyTestCase):
         result = utils.verify_notification(notification)
         self.assertTrue(result)
 
+    @patch('time.time', valid_clock)
     @patch('django_bouncy.utils.grab_keyfile')
     def test_notification_verification_failure(self, mock):
         """Test the failure of an invalid notification"""
@@ -64,6 +264,22 @@ class TestVerificationSystem(BouncyTestCase):
 
         self.assertFalse(result)
 
+    @patch('time.time', valid_clock)
+    @patch('django_bouncy.utils.grab_keyfile')
+    def test_invalid_signature_remembered(self, mock):
+        """Test that a replayed bad notification isn't verified again"""
+        mock.return_value = self.pemfile
+        notification = loader('bounce_notification')
+        notification['TopicArn'] = 'BadArn'
+
+        self.assertFalse(utils.verify_notification(notification))
+        self.assertFalse(utils.verify_notification(notification))
+        self.assertEqual(mock.call_count, 1)
+
+        # The genuine notification isn't affected
+        self.assertTrue(utils.verify_notification(self.notification))
+
+    @patch('time.time', valid_clock)
     @patch('django_bouncy.utils.grab_keyfile')
     def test_subscription_verification_failure(self, mock):
         """Test the failure of an invalid subscription notification"""
@@ -75,6 +291,71 @@ class TestVerificationSystem(BouncyTestCase):
         self.assertFalse(result)
 
 
+class CertificateCacheTest(BouncyTestCase):
+    """Test the in-process cache of parsed certificates"""
+    # 2014-01-01, before the example certificate expires
+    now = 1388534400
+    # 2014-09-12 23:59:59, when the example certificate expires
+    not_after = 1410566399
+
+    def setUp(self):
+        """Setup the certificate cache test"""
+        utils.certificate_cache.clear()
+        utils.failed_certificates.clear()
+
+    @patch('django_bouncy.utils.grab_keyfile')
+    def test_certificate_cached(self, mock):
+        """Test that a certificate is only fetched and parsed once"""
+        mock.return_value = self.pemfile
+        with patch('time.time', return_value=self.now):
+            first = utils.load_certificate('http://www.fakeurl.com')
+            second = utils.load_certificate('http://www.fakeurl.com')
+
+        self.assertIs(first, second)
+        self.assertEqual(mock.call_count, 1)
+        stats = utils.certificate_cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    @patch('django_bouncy.utils.grab_keyfile')
+    def test_cache_bounded_by_expiry(self, mock):
+        """Test that a certificate isn't cached past its expiry"""
+        mock.return_value = self.pemfile
+        with patch('time.time', return_value=self.not_after - 60):
+            utils.load_certificate('http://www.fakeurl.com')
+        with patch('time.time', return_value=self.not_after + 1):
+            with self.assertRaises(ValueError):
+                utils.load_certificate('http://www.fakeurl.com')
+
+        self.assertEqual(mock.call_count, 2)
+
+    @patch('django_bouncy.utils.grab_keyfile')
+    def test_stale_certificate_used(self, mock):
+        """Test that a stale certificate is used if it can't be refreshed"""
+        mock.return_value = self.pemfile
+        with patch('time.time', return_value=self.now):
+            first = utils.load_certificate('http://www.fakeurl.com')
+
+        mock.side_effect = IOError('Host Unreachable')
+        with patch('time.time', return_value=self.now + 86401):
+            second = utils.load_certificate('http://www.fakeurl.com')
+
+        self.assertIs(first, second)
+        self.assertEqual(mock.call_count, 2)
+
+    @patch('django_bouncy.utils.grab_keyfile')
+    def test_expired_stale_certificate_not_used(self, mock):
+        """Test that a stale certificate isn't used once it has expired"""
+        mock.return_value = self.pemfile
+        with patch('time.time', return_value=self.now):
+            utils.load_certificate('http://www.fakeurl.com')
+
+        mock.side_effect = IOError('Host Unreachable')
+        with patch('time.time', return_value=self.not_after + 1):
+            with self.assertRaises(IOError):
+                utils.load_certificate('http://www.fakeurl.com')
+
+
 class SubscriptionApprovalTest(BouncyTestCase):
     """Test the approve_subscription function"""
     @patch('django_bouncy.utils.urlopen')
@@ -120,11 +401,10 @@ class SubscriptionApprovalTest(BouncyTestCase):
         self.assertEqual(self.signal_result, 'Return Value')
         self.assertEqual(self.signal_notification, notification)
 
+    @override_settings(
+        BOUNCY_SUBSCRIBE_DOMAIN_REGEX=r"sns.[a-z0-9\-]+.amazonaws.com$")
     def test_bad_url(self):
         """Test to make sure an invalid URL isn't requested by our system"""
-        old_setting = getattr(settings, 'BOUNCY_SUBSCRIBE_DOMAIN_REGEX', None)
-        settings.BOUNCY_SUBSCRIBE_DOMAIN_REGEX = \
-            r"sns.[a-z0-9\-]+.amazonaws.com$"
         notification = loader('bounce_notification')
         notification['SubscribeURL'] = 'http://bucket.s3.amazonaws.com'
         result = utils.approve_subscription(notification)
@@ -133,5 +413,42 @@ class SubscriptionApprovalTest(BouncyTestCase):
         self.assertEqual(
             result.content.decode('ascii'), 'Improper Subscription Domain')
 
-        if old_setting is not None:
-            settings.BOUNCY_SUBSCRIBE_DOMAIN_REGEX = old_setting
+
+class CleanTimeTest(SimpleTestCase):
+    """Test the clean_time function"""
+    def setUp(self):
+        utils.parsed_times.clear()
+
+    def test_matches_dateutil(self):
+        """Test that the fast path gives the same datetime as dateutil"""
+        for time_string in [
+                '2012-05-25T14:59:38.605-07:00', '2014-05-28T22:40:59.638Z',
+                '2009-12-03T04:24:21-05:30', '2009-12-03T04:24:21.123456Z']:
+            with override_settings(USE_TZ=True):
+                self.assertEqual(
+                    utils.clean_time(time_string),
+                    dateutil.parser.parse(time_string)
+                )
+
+    @override_settings(USE_TZ=False)
+    def test_naive_utc(self):
+        """Test that times are naive UTC without timezone support"""
+        time = utils.clean_time('2012-05-25T14:59:38.605-07:00')
+        self.assertIsNone(time.tzinfo)
+        self.assertEqual((time.day, time.hour), (25, 21))
+
+    @override_settings(USE_TZ=True)
+    def test_other_formats(self):
+        """Test that other formats fall back on dateutil"""
+        time = utils.clean_time('Fri, 25 May 2012 14:59:38 -0700')
+        self.assertEqual(
+            time, dateutil.parser.parse('2012-05-25T14:59:38-07:00'))
+
+    @override_settings(USE_TZ=True)
+    def test_memoized(self):
+        """Test that a repeated string is only parsed once"""
+        with patch.object(
+                utils, '_parse_time', wraps=utils._parse_time) as parse:
+            utils.clean_time('2014-05-28T22:40:59.638Z')
+            utils.clean_time('2014-05-28T22:40:59.638Z')
+        self.assertEqual(parse.call_count, 1)
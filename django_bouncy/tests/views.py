@@ -2,8 +2,10 @@
 # pylint: disable=protected-access
 import json
 
+from django.core.cache import caches
+from django.db import IntegrityError, connection
 from django.test import RequestFactory
-from django.test.utils import override_settings
+from django.test.utils import override_settings, CaptureQueriesContext
 from django.http import Http404
 from django.conf import settings
 from django.dispatch import receiver
@@ -16,9 +18,10 @@ except ImportError:
     from mock import patch
 
 from django_bouncy.tests.helpers import BouncyTestCase, loader
-from django_bouncy import views, signals
+from django_bouncy.tests.utils import fetcher
+from django_bouncy import views, signals, utils
 from django_bouncy.utils import clean_time
-from django_bouncy.models import Bounce, Complaint, Delivery
+from django_bouncy.models import Bounce, Complaint, Delivery, InboxMessage
 
 
 class BouncyEndpointViewTest(BouncyTestCase):
@@ -91,6 +94,14 @@ class BouncyEndpointViewTest(BouncyTestCase):
         self.assertEqual(result.status_code, 400)
         self.assertEqual(result.content.decode('ascii'), 'Not Valid JSON')
 
+    @override_settings(BOUNCY_JSON_BACKEND='json')
+    def test_invalid_utf8_json(self):
+        """Test that a body which isn't UTF-8 is not valid JSON"""
+        self.request._body = b'{"Type": "\xff"}'
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(result.content.decode('ascii'), 'Not Valid JSON')
+
     def test_missing_necessary_key(self):
         """Test if the notification is missing vital keys"""
         self.request._body = json.dumps({})
@@ -119,18 +130,126 @@ class BouncyEndpointViewTest(BouncyTestCase):
         self.assertEqual(
             result.content.decode('ascii'), 'Improper Certificate Location')
 
+    @override_settings(BOUNCY_MAX_BODY_SIZE=1024)
+    def test_request_too_large(self):
+        """Test that a long request is rejected before it's read"""
+        self.request.META['CONTENT_LENGTH'] = '1025'
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(result.content.decode('ascii'), 'Request Too Large')
+
+    def test_unknown_message_type_header(self):
+        """Test that an unknown type in the header is rejected"""
+        self.request.META['HTTP_X_AMZ_SNS_MESSAGE_TYPE'] = 'NotAKnownType'
+        self.request._body = 'This Is Not JSON'
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(
+            result.content.decode('ascii'), 'Unknown Notification Type')
+
+    def test_mismatched_message_type(self):
+        """Test that the header and body must agree on the type"""
+        self.request.META['HTTP_X_AMZ_SNS_MESSAGE_TYPE'] = \
+            'SubscriptionConfirmation'
+        self.request._body = json.dumps(self.notification)
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(
+            result.content.decode('ascii'), 'Mismatched Notification Type')
+
+    @override_settings(BOUNCY_REQUIRE_SNS_HEADERS=True)
+    def test_required_headers(self):
+        """Test that SNS headers can be required"""
+        self.request._body = json.dumps(self.notification)
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(
+            result.content.decode('ascii'), 'No Message Type Header')
+
+        self.request.META['HTTP_X_AMZ_SNS_MESSAGE_TYPE'] = 'Notification'
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 200)
+
+    def test_json_not_object(self):
+        """Test that a body which isn't a JSON object is rejected"""
+        self.request._body = '[1, 2, 3]'
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(
+            result.content.decode('ascii'), 'Request Missing Necessary Keys')
+
+    @override_settings(
+        BOUNCY_VERIFY_CERTIFICATE=True,
+        BOUNCY_CERT_FETCHER='django_bouncy.tests.utils.fetcher'
+    )
+    def test_certificate_unavailable(self):
+        """Test that a certificate which can't be fetched is retried later"""
+        fetcher.reset_mock(return_value=True, side_effect=True)
+        fetcher.side_effect = IOError('Host Unreachable')
+        caches['default'].clear()
+        utils.failed_certificates.clear()
+        utils.certificate_cache.clear()
+        self.request._body = json.dumps(self.notification)
+
+        for _ in range(2):
+            result = views.endpoint(self.request)
+            self.assertEqual(result.status_code, 503)
+            self.assertEqual(
+                result.content.decode('ascii'), 'Certificate Unavailable')
+            self.assertEqual(result['Retry-After'], '30')
+        # The second request didn't fetch the certificate again
+        self.assertEqual(fetcher.call_count, 1)
+
+    @override_settings(
+        BOUNCY_VERIFY_CERTIFICATE=True,
+        BOUNCY_CERT_FETCHER='django_bouncy.tests.utils.fetcher'
+    )
+    def test_invalid_certificate(self):
+        """Test that a file which isn't a certificate is rejected"""
+        fetcher.reset_mock(return_value=True, side_effect=True)
+        fetcher.return_value = 'Not A Certificate'
+        caches['default'].clear()
+        utils.failed_certificates.clear()
+        utils.certificate_cache.clear()
+        self.request._body = json.dumps(self.notification)
+
+        for _ in range(2):
+            result = views.endpoint(self.request)
+            self.assertEqual(result.status_code, 400)
+            self.assertEqual(
+                result.content.decode('ascii'), 'Invalid Certificate')
+        self.assertEqual(fetcher.call_count, 1)
+
+    @override_settings(BOUNCY_VERIFY_CERTIFICATE=True)
+    def test_signed_field_missing(self):
+        """Test that a subscription without its signed fields is rejected"""
+        notification = loader('bounce_notification')
+        notification['Type'] = 'SubscriptionConfirmation'
+        self.request._body = json.dumps(notification)
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(result.content.decode('ascii'), 'Improper Signature')
+
+    @override_settings(BOUNCY_VERIFY_CERTIFICATE=True)
+    def test_signed_field_not_string(self):
+        """Test that a notification with a signed field that isn't a string
+        is rejected"""
+        self.notification['MessageId'] = {'forged': True}
+        self.request._body = json.dumps(self.notification)
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(result.content.decode('ascii'), 'Improper Signature')
+
+    @override_settings(BOUNCY_AUTO_SUBSCRIBE=False)
     def test_subscription_throws_404(self):
         """
         Test that a subscription request sent to bouncy throws a 404 if not
         permitted
         """
-        original_setting = getattr(settings, 'BOUNCY_AUTO_SUBSCRIBE', True)
-        settings.BOUNCY_AUTO_SUBSCRIBE = False
         with self.assertRaises(Http404):
             notification = loader('subscriptionconfirmation')
             self.request._body = json.dumps(notification)
             views.endpoint(self.request)
-        settings.BOUNCY_AUTO_SUBSCRIBE = original_setting
 
     @patch('django_bouncy.views.approve_subscription')
     def test_approve_subscription_called(self, mock):
@@ -165,6 +284,48 @@ class BouncyEndpointViewTest(BouncyTestCase):
             result.content.decode('ascii'), 'Message is not valid JSON')
 
 
+    def test_duplicate_notification(self):
+        """Test that a redelivered notification isn't processed again"""
+        self.addCleanup(caches['default'].clear)
+        self.request._body = json.dumps(self.notification)
+        with self.run_on_commit():
+            views.endpoint(self.request)
+
+        with patch('django_bouncy.views.process_message') as mock:
+            result = views.endpoint(self.request)
+
+        self.assertFalse(mock.called)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(
+            result.content.decode('ascii'), 'Duplicate Notification')
+
+    @override_settings(BOUNCY_SEEN_CACHE=None)
+    def test_duplicate_check_disabled(self):
+        """Test that redeliveries are processed without a seen cache"""
+        self.request._body = json.dumps(self.notification)
+        with self.run_on_commit():
+            views.endpoint(self.request)
+        result = views.endpoint(self.request)
+
+        self.assertEqual(result.content.decode('ascii'), 'Bounce Processed')
+        self.assertEqual(Bounce.objects.filter(
+            sns_messageid=self.notification['MessageId']).count(), 1)
+
+    @override_settings(BOUNCY_DEFERRED_PROCESSING=True)
+    def test_deferred_processing(self):
+        """Test that a notification is queued when processing is deferred"""
+        self.request._body = json.dumps(self.notification).encode('utf-8')
+        result = views.endpoint(self.request)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(
+            result.content.decode('ascii'), 'Notification Queued')
+        self.assertFalse(Bounce.objects.filter(
+            sns_messageid=self.notification['MessageId']).exists())
+        self.assertEqual(json.loads(InboxMessage.objects.get(
+            sns_messageid=self.notification['MessageId']
+        ).notification), self.notification)
+
+
 class ProcessMessageTest(BouncyTestCase):
     """Test the process_message function"""
     def test_missing_fields(self):
@@ -223,13 +384,130 @@ class ProcessBounceTest(BouncyTestCase):
             self.signal_count += 1
             self.signal_notification = kwargs['notification']
 
-        result = views.process_bounce(self.bounce, self.notification)
+        with self.run_on_commit():
+            result = views.process_bounce(self.bounce, self.notification)
 
         self.assertEqual(result.status_code, 200)
         self.assertEqual(result.content.decode('ascii'), 'Bounce Processed')
         self.assertEqual(self.signal_count, 2)
         self.assertEqual(self.signal_notification, self.notification)
 
+    def test_batch_signal_sent(self):
+        """Test that one feedback_batch signal is sent per notification"""
+        # pylint: disable=attribute-defined-outside-init, unused-variable
+        self.batches = []
+
+        @receiver(signals.feedback_batch)
+        def _signal_receiver(sender, **kwargs):
+            """Test signal receiver"""
+            self.batches.append((sender, kwargs['instances']))
+
+        with self.run_on_commit():
+            views.process_bounce(self.bounce, self.notification)
+            views.process_bounce(self.bounce, self.notification)
+
+        self.assertEqual(len(self.batches), 1)
+        sender, instances = self.batches[0]
+        self.assertIs(sender, Bounce)
+        self.assertEqual(
+            sorted(instance.address for instance in instances),
+            ['recipient1@example.com', 'recipient2@example.com']
+        )
+
+    def test_signals_wait_for_commit(self):
+        """Test that no feedback signal is sent before the commit"""
+        # pylint: disable=attribute-defined-outside-init, unused-variable
+        self.signal_count = 0
+
+        @receiver(signals.feedback)
+        def _signal_receiver(sender, **kwargs):
+            """Test signal receiver"""
+            # pylint: disable=unused-argument
+            self.signal_count += 1
+
+        result = views.process_bounce(self.bounce, self.notification)
+
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(Bounce.objects.filter(
+            sns_messageid='f34c6922-c3a1-54a1-bd88-23f998b43978').exists())
+        self.assertEqual(self.signal_count, 0)
+
+    def test_redelivery_not_saved(self):
+        """Test that bounces from a redelivered notification are skipped"""
+        # pylint: disable=attribute-defined-outside-init, unused-variable
+        self.signal_count = 0
+
+        @receiver(signals.feedback)
+        def _signal_receiver(sender, **kwargs):
+            """Test signal receiver"""
+            # pylint: disable=unused-argument
+            self.signal_count += 1
+
+        original_count = Bounce.objects.count()
+        with self.run_on_commit():
+            views.process_bounce(self.bounce, self.notification)
+            views.process_bounce(self.bounce, self.notification)
+
+        self.assertEqual(Bounce.objects.count(), original_count + 2)
+        self.assertEqual(self.signal_count, 2)
+
+    def test_signalled_instances_saved(self):
+        """Test that the feedback signal gets saved instances"""
+        instances = []
+
+        @receiver(signals.feedback)
+        def _signal_receiver(sender, **kwargs):
+            """Test signal receiver"""
+            # pylint: disable=unused-argument
+            instances.append(kwargs['instance'])
+
+        with self.run_on_commit():
+            views.process_bounce(self.bounce, self.notification)
+
+        self.assertEqual(len(instances), 2)
+        for instance in instances:
+            self.assertIsNotNone(instance.pk)
+            # Saving again updates the row rather than inserting another
+            instance.save()
+        self.assertEqual(Bounce.objects.count(), 2)
+
+    def test_conflicting_insert_retried(self):
+        """Test that an insert racing a redelivery is tried again"""
+        original = Bounce.objects.bulk_create
+
+        def conflict_once(*args, **kwargs):
+            """Fail like a concurrent insert the first time only"""
+            if mock.call_count == 1:
+                raise IntegrityError('Conflict')
+            return original(*args, **kwargs)
+
+        with patch.object(Bounce.objects, 'bulk_create') as mock:
+            mock.side_effect = conflict_once
+            views.process_bounce(self.bounce, self.notification)
+
+        self.assertEqual(mock.call_count, 2)
+        self.assertEqual(Bounce.objects.filter(
+            sns_messageid=self.notification['MessageId']).count(), 2)
+
+    def test_conflicting_insert_raised(self):
+        """Test that a second conflict is left for SNS to redeliver"""
+        with patch.object(Bounce.objects, 'bulk_create') as mock:
+            mock.side_effect = IntegrityError('Conflict')
+            with self.assertRaises(IntegrityError):
+                views.process_bounce(self.bounce, self.notification)
+
+        self.assertEqual(mock.call_count, 2)
+
+    def test_single_insert(self):
+        """Test that every bounce in a notification is saved at once"""
+        with CaptureQueriesContext(connection) as context:
+            views.process_bounce(self.bounce, self.notification)
+
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT')
+                   and Bounce._meta.db_table in query['sql']]
+        self.assertEqual(len(inserts), 1)
+
     def test_correct_bounces_created(self):
         """Test to ensure that bounces are correctly inserted"""
         # Delete any existing bounces
@@ -290,8 +568,9 @@ class ProcessComplaintTest(BouncyTestCase):
             self.signal_notification = kwargs['notification']
             self.signal_message = kwargs['message']
 
-        result = views.process_complaint(
-            self.complaint, self.complaint_notification)
+        with self.run_on_commit():
+            result = views.process_complaint(
+                self.complaint, self.complaint_notification)
 
         self.assertEqual(result.status_code, 200)
         self.assertEqual(result.content.decode('ascii'), 'Complaint Processed')
@@ -355,8 +634,9 @@ class ProcessDeliveryTest(BouncyTestCase):
             self.signal_notification = kwargs['notification']
             self.signal_message = kwargs['message']
 
-        result = views.process_delivery(
-            self.delivery, self.delivery_notification)
+        with self.run_on_commit():
+            result = views.process_delivery(
+                self.delivery, self.delivery_notification)
 
         self.assertEqual(result.status_code, 200)
         self.assertEqual(result.content.decode('ascii'), 'Delivery Processed')
@@ -18,51 +18,57 @@ except ImportError:
     from urllib.parse import urlparse
 
 import base64
+import datetime
+import hashlib
 import re
+import threading
+import time
 import pem
 import logging
 import six
 
-from OpenSSL import crypto
 from django.conf import settings
 from django.core.cache import caches
+from django.db import transaction
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.utils import timezone
 from django.utils.encoding import smart_bytes
 import dateutil.parser
 
 from django_bouncy import signals
+from django_bouncy.certstore import (
+    delete_certificate, read_certificate, write_certificate
+)
+from django_bouncy.conf import get_settings
+from django_bouncy.instrumentation import increment, timer
+from django_bouncy.lru import LRUCache
+from django_bouncy.signatures import string_to_sign
 
-NOTIFICATION_HASH_FORMAT = u'''Message
-{Message}
-MessageId
-{MessageId}
-Timestamp
-{Timestamp}
-TopicArn
-{TopicArn}
-Type
-{Type}
-'''
-
-SUBSCRIPTION_HASH_FORMAT = u'''Message
-{Message}
-MessageId
-{MessageId}
-SubscribeURL
-{SubscribeURL}
-Timestamp
-{Timestamp}
-Token
-{Token}
-TopicArn
-{TopicArn}
-Type
-{Type}
-'''
+SEEN_KEY_FORMAT = u'bouncy-seen:{}'
+CERT_LEASE_KEY_FORMAT = u'bouncy-cert-lease:{}'
 
 logger = logging.getLogger(__name__)
 
+# Public keys of signing certificates, keyed by their SigningCertURL
+certificate_cache = LRUCache(maxsize=32)
+
+# Recent certificate fetch failures, keyed by SigningCertURL, and
+# fingerprints of notifications whose signatures didn't verify
+failed_certificates = LRUCache(maxsize=64)
+invalid_signatures = LRUCache(maxsize=1024)
+
+# Held while fetching a certificate. URLs share them by hash.
+fetch_locks = [threading.Lock() for _ in range(16)]
+
+# Datetimes from recent clean_time calls, keyed by string and USE_TZ
+parsed_times = LRUCache(maxsize=256)
+
+# The ISO 8601 format SES uses, such as 2012-05-25T14:59:38.605-07:00
+SES_TIME_REGEX = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?'
+    r'(Z|[+-]\d{2}:\d{2})$'
+)
+
 
 def grab_keyfile(cert_url):
     """
@@ -70,48 +76,196 @@ def grab_keyfile(cert_url):
 
     SNS keys expire and Amazon does not promise they will use the same key
     for all SNS requests. So we need to keep a copy of the cert in our
-    cache
+    cache, and in BOUNCY_CERT_DIR if it's set.
+
+    When many requests need the same uncached certificate at once only one
+    of them fetches it. Threads in a process wait on a lock, and processes
+    sharing the key cache wait on a lease held in it, for as long as a
+    fetch may take. A failed fetch isn't retried for
+    BOUNCY_NEGATIVE_CACHE_TIMEOUT seconds.
     """
-    key_cache = caches[getattr(settings, 'BOUNCY_KEY_CACHE', 'default')]
+    bouncy_settings = get_settings()
+    key_cache = caches[bouncy_settings.key_cache]
 
     pemfile = key_cache.get(cert_url)
-    if not pemfile:
-        response = urlopen(cert_url)
-        pemfile = response.read()
-        # Extract the first certificate in the file and confirm it's a valid
-        # PEM certificate
-        certificates = pem.parse(smart_bytes(pemfile))
-
-        # A proper certificate file will contain 1 certificate
-        if len(certificates) != 1:
-            logger.error('Invalid Certificate File: URL %s', cert_url)
-            raise ValueError('Invalid Certificate File')
-
-        key_cache.set(cert_url, pemfile)
+    if pemfile:
+        return pemfile
+
+    # Don't keep fetching a certificate that just failed
+    _raise_failed_fetch(cert_url)
+
+    lock = fetch_locks[hash(cert_url) % len(fetch_locks)]
+    lease_key = CERT_LEASE_KEY_FORMAT.format(cert_url)
+    lease_timeout = sum(bouncy_settings.cert_fetch_timeout)
+    waited = False
+    while True:
+        with lock:
+            # Another thread or process may have fetched it, or failed to,
+            # while this one waited
+            pemfile = key_cache.get(cert_url) or read_certificate(cert_url)
+            if pemfile:
+                key_cache.set(cert_url, pemfile)
+                return pemfile
+            _raise_failed_fetch(cert_url)
+
+            leased = key_cache.add(lease_key, True, lease_timeout)
+            # If another process's fetch didn't finish in time, fetch it here
+            # instead
+            if leased or waited:
+                try:
+                    return fetch_keyfile(cert_url)
+                except (IOError, ValueError) as error:
+                    if bouncy_settings.negative_cache_timeout:
+                        failed_certificates.set(
+                            cert_url, error,
+                            timeout=bouncy_settings.negative_cache_timeout
+                        )
+                    raise
+                finally:
+                    if leased:
+                        key_cache.delete(lease_key)
+
+        # Another process is fetching it. The lock isn't held while waiting,
+        # so fetches of other URLs sharing it aren't held up.
+        _wait_for_fetch(key_cache, cert_url, lease_key, lease_timeout)
+        waited = True
+
+
+def _wait_for_fetch(key_cache, cert_url, lease_key, timeout):
+    """
+    Function to wait up to `timeout` seconds for another process to fetch
+    `cert_url`, fail to, or give up its lease
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(0.05)
+        if (key_cache.get(cert_url) or read_certificate(cert_url)
+                or failed_certificates.get(cert_url) is not None
+                or not key_cache.get(lease_key)):
+            return
+
+
+def _raise_failed_fetch(cert_url):
+    """Function to raise the error of a recent failed fetch of `cert_url`"""
+    error = failed_certificates.get(cert_url)
+    if error is not None:
+        increment('negative_cache', kind='certificate')
+        raise error.with_traceback(None)
+
+
+def fetch_keyfile(cert_url):
+    """
+    Function to fetch a keyfile, check it and store it
+
+    Raises `IOError` if it can't be fetched, and `ValueError` if it isn't
+    a certificate.
+    """
+    with timer('fetch_certificate'):
+        pemfile = get_settings().cert_fetcher(cert_url)
+    # Extract the first certificate in the file and confirm it's a valid PEM
+    # certificate
+    certificates = pem.parse(smart_bytes(pemfile))
+
+    # A proper certificate file will contain 1 certificate
+    if len(certificates) != 1:
+        logger.error('Invalid Certificate File: URL %s', cert_url)
+        raise ValueError('Invalid Certificate File')
+
+    write_certificate(cert_url, pemfile)
+    caches[get_settings().key_cache].set(cert_url, pemfile)
     return pemfile
 
 
+def load_certificate(cert_url):
+    """
+    Function to acquire the public key of the signing certificate
+
+    Keys are loaded by BOUNCY_SIGNATURE_BACKEND and kept in a per-process
+    cache for BOUNCY_CERT_CACHE_TIMEOUT seconds, but never past the
+    certificate's own expiry. If a certificate can't be refreshed once that
+    time has passed (for example, if Amazon's certificate host is
+    unreachable) the previously loaded key is used for as long as the
+    certificate is still valid. Raises `ValueError` if the certificate has
+    expired.
+    """
+    entry = certificate_cache.get(cert_url)
+    if entry is not None:
+        increment('certificate_cache', result='hit')
+        return entry[0]
+    increment('certificate_cache', result='miss')
+
+    try:
+        pemfile = grab_keyfile(cert_url)
+    except IOError:
+        entry = certificate_cache.get_stale(cert_url)
+        if entry is None or entry[1] <= time.time():
+            raise
+        logger.warning('Using Stale Certificate: URL %s', cert_url)
+        increment('certificate_cache', result='stale')
+        return entry[0]
+
+    bouncy_settings = get_settings()
+    public_key, not_after = bouncy_settings.signature_backend.load_certificate(
+        pemfile)
+    now = time.time()
+    if not_after <= now:
+        _reject_expired(cert_url)
+    timeout = min(bouncy_settings.cert_cache_timeout, not_after - now)
+    certificate_cache.set(cert_url, (public_key, not_after), timeout=timeout)
+    return public_key
+
+
+def _reject_expired(cert_url):
+    """
+    Function to raise `ValueError` for the expired certificate at `cert_url`
+
+    It's removed from the key cache and BOUNCY_CERT_DIR, so it's fetched
+    again once BOUNCY_NEGATIVE_CACHE_TIMEOUT seconds have passed.
+    """
+    bouncy_settings = get_settings()
+    logger.error('Expired Certificate: URL %s', cert_url)
+    caches[bouncy_settings.key_cache].delete(cert_url)
+    delete_certificate(cert_url)
+    error = ValueError('Expired Certificate')
+    if bouncy_settings.negative_cache_timeout:
+        failed_certificates.set(
+            cert_url, error, timeout=bouncy_settings.negative_cache_timeout)
+    raise error
+
+
 def verify_notification(data):
     """
     Function to verify notification came from a trusted source
 
-    Returns True if verfied, False if not verified
+    Returns True if verfied, False if not verified. Raises `IOError` if the
+    signing certificate can't be fetched, and `ValueError` if it isn't a
+    valid certificate. Notifications that fail are remembered for
+    BOUNCY_NEGATIVE_CACHE_TIMEOUT seconds, so replaying them costs a hash
+    rather than a certificate lookup and a verification.
     """
-    pemfile = grab_keyfile(data['SigningCertURL'])
-    cert = crypto.load_certificate(crypto.FILETYPE_PEM, pemfile)
-    signature = base64.decodestring(six.b(data['Signature']))
-
-    if data['Type'] == "Notification":
-        hash_format = NOTIFICATION_HASH_FORMAT
-    else:
-        hash_format = SUBSCRIPTION_HASH_FORMAT
+    bouncy_settings = get_settings()
+    message = string_to_sign(data)
+    signature_version = data.get('SignatureVersion', '1')
+    fingerprint = hashlib.sha256(b'\n'.join([
+        smart_bytes(data['SigningCertURL']), smart_bytes(signature_version),
+        smart_bytes(data['Signature']), message
+    ])).digest()
+    if invalid_signatures.get(fingerprint):
+        increment('negative_cache', kind='signature')
+        return False
 
+    public_key = load_certificate(data['SigningCertURL'])
     try:
-        crypto.verify(
-            cert, signature, six.b(hash_format.format(**data)), 'sha1')
-    except crypto.Error:
-        return False
-    return True
+        signature = base64.b64decode(data['Signature'])
+        verified = bouncy_settings.signature_backend.verify(
+            public_key, signature, message, signature_version)
+    except (TypeError, ValueError):
+        verified = False
+
+    if not verified and bouncy_settings.negative_cache_timeout:
+        invalid_signatures.set(
+            fingerprint, True, timeout=bouncy_settings.negative_cache_timeout)
+    return verified
 
 
 def approve_subscription(data):
@@ -124,12 +278,7 @@ def approve_subscription(data):
     url = data['SubscribeURL']
 
     domain = urlparse(url).netloc
-    pattern = getattr(
-        settings,
-        'BOUNCY_SUBSCRIBE_DOMAIN_REGEX',
-        r"sns.[a-z0-9\-]+.amazonaws.com$"
-    )
-    if not re.search(pattern, domain):
+    if not get_settings().subscribe_domain_regex.search(domain):
         logger.error('Invalid Subscription Domain %s', url)
         return HttpResponseBadRequest('Improper Subscription Domain')
 
@@ -150,10 +299,75 @@ def approve_subscription(data):
     return HttpResponse(six.u(result))
 
 
+def is_duplicate_notification(data):
+    """
+    Function to check if a notification has already been handled
+
+    SNS delivers notifications at least once, and will redeliver one that it
+    thinks has timed out. Redeliveries found in BOUNCY_SEEN_CACHE can be
+    answered without verifying or processing them again.
+    """
+    alias = get_settings().seen_cache
+    if alias is None or data['Type'] != 'Notification':
+        return False
+    return caches[alias].get(
+        SEEN_KEY_FORMAT.format(data['MessageId'])) is not None
+
+
+def remember_notification(data):
+    """
+    Function to record that a notification has been handled
+
+    Nothing is recorded until the current transaction has been committed, so
+    a notification that fails to be saved can still be redelivered.
+    """
+    bouncy_settings = get_settings()
+    if bouncy_settings.seen_cache is None:
+        return
+    key = SEEN_KEY_FORMAT.format(data['MessageId'])
+    transaction.on_commit(lambda: caches[bouncy_settings.seen_cache].set(
+        key, True, bouncy_settings.seen_timeout))
+
+
+def normalize_address(address):
+    """Return the normalized form of an email address used for lookups"""
+    return address.strip().lower()
+
+
 def clean_time(time_string):
-    """Return a datetime from the Amazon-provided datetime string"""
-    # Get a timezone-aware datetime object from the string
-    time = dateutil.parser.parse(time_string)
+    """
+    Return a datetime from the Amazon-provided datetime string
+
+    Every record built from a notification shares the same few timestamps,
+    so recently parsed strings are remembered.
+    """
+    key = (time_string, settings.USE_TZ)
+    time = parsed_times.get(key)
+    if time is None:
+        time = _parse_time(time_string)
+        parsed_times.set(key, time)
+    return time
+
+
+def _parse_time(time_string):
+    """Function to parse a datetime string, quickly if it is in SES's format"""
+    match = SES_TIME_REGEX.match(time_string)
+    if match:
+        (year, month, day, hour, minute, second, fraction,
+         offset) = match.groups()
+        if offset == 'Z':
+            tzinfo = timezone.utc
+        else:
+            minutes = int(offset[1:3]) * 60 + int(offset[4:6])
+            tzinfo = datetime.timezone(datetime.timedelta(
+                minutes=-minutes if offset[0] == '-' else minutes))
+        time = datetime.datetime(
+            int(year), int(month), int(day), int(hour), int(minute),
+            int(second), int((fraction or '0').ljust(6, '0')), tzinfo
+        )
+    else:
+        # Get a timezone-aware datetime object from the string
+        time = dateutil.parser.parse(time_string)
     if not settings.USE_TZ:
         # If timezone support is not active, convert the time to UTC and
         # remove the timezone field
@@ -1,21 +1,30 @@
 """Views for the django_bouncy app"""
-import json
 try:
     from urlparse import urlparse
 except ImportError:
     from urllib.parse import urlparse
 
-import re
+import json
 import logging
+from collections import OrderedDict
 
+from django.db import IntegrityError, transaction
 from django.http import HttpResponseBadRequest, HttpResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
-from django.conf import settings
 
+from django_bouncy.admission import limit_view, snapshot, write_timer
+from django_bouncy.conf import get_settings
 from django_bouncy.utils import (
-    verify_notification, approve_subscription, clean_time
+    verify_notification, approve_subscription, clean_time,
+    is_duplicate_notification, remember_notification
+)
+from django_bouncy.models import Bounce, Complaint, Delivery, InboxMessage
+from django_bouncy.status import update_address_status
+from django_bouncy.rollup import should_roll_up, is_sampled, roll_up_deliveries
+from django_bouncy.signatures import has_signature_fields
+from django_bouncy.instrumentation import (
+    increment, instrument_view, timer
 )
-from django_bouncy.models import Bounce, Complaint, Delivery
 from django_bouncy import signals
 
 VITAL_NOTIFICATION_FIELDS = [
@@ -35,97 +44,238 @@ logger = logging.getLogger(__name__)
 
 
 @csrf_exempt
+@instrument_view
+@limit_view
 def endpoint(request):
     """Endpoint that SNS accesses. Includes logic verifying request"""
-    # pylint: disable=too-many-return-statements,too-many-branches
-
     # In order to 'hide' the endpoint, all non-POST requests should return
     # the site's default HTTP404
     if request.method != 'POST':
         raise Http404
 
-    # If necessary, check that the topic is correct
-    if hasattr(settings, 'BOUNCY_TOPIC_ARN'):
-        # Confirm that the proper topic header was sent
-        if 'HTTP_X_AMZ_SNS_TOPIC_ARN' not in request.META:
-            return HttpResponseBadRequest('No TopicArn Header')
-
-        # Check to see if the topic is in the settings
-        # Because you can have bounces and complaints coming from multiple
-        # topics, BOUNCY_TOPIC_ARN is a list
-        if (not request.META['HTTP_X_AMZ_SNS_TOPIC_ARN']
-                in settings.BOUNCY_TOPIC_ARN):
-            return HttpResponseBadRequest('Bad Topic')
-
-    # Load the JSON POST Body
-    if isinstance(request.body, str):
-        # requests return str in python 2.7
-        request_body = request.body
-    else:
-        # and return bytes in python 3.4
-        request_body = request.body.decode()
+    with timer('check'):
+        data, response = check_request(request)
+    if response is not None:
+        return response
+
+    # Verify that the notification is signed by Amazon
+    if get_settings().verify_certificate:
+        with timer('verify'):
+            response = check_signature(data)
+        if response is not None:
+            return response
+    increment('notifications', type=data['Type'])
+
+    # Send a signal to say a valid notification has been received
+    with timer('notification_signal'):
+        signals.notification.send(
+            sender='bouncy_endpoint', notification=data, request=request)
+
+    # Handle subscription-based messages.
+    if data['Type'] == 'SubscriptionConfirmation':
+        # Allow the disabling of the auto-subscription feature
+        if not get_settings().auto_subscribe:
+            raise Http404
+        return approve_subscription(data)
+    elif data['Type'] == 'UnsubscribeConfirmation':
+        return unsubscribe_confirmation()
+
+    # Leave the rest of the work to the bouncy_worker management command
+    if get_settings().deferred_processing:
+        with timer('enqueue'):
+            return enqueue_notification(request, data)
+
+    return process_notification(data)
+
+
+def metrics(request):
+    """
+    View serving the instrumentation totals in the Prometheus text format
+
+    Only available when BOUNCY_METRICS_SINK is
+    `django_bouncy.instrumentation.MemorySink`. It isn't in
+    `django_bouncy.urls`, so add it to your own URLs behind whatever access
+    control your metrics need.
+    """
+    sink = get_settings().metrics_sink
+    if not hasattr(sink, 'render'):
+        raise Http404
+    return HttpResponse(
+        sink.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def admission(request):
+    """
+    View serving the admission control state as JSON
+
+    Shows the notifications in flight, the moving average of database write
+    latency, and the limits they're held to. Like `metrics`, it isn't in
+    `django_bouncy.urls`.
+    """
+    # pylint: disable=unused-argument
+    return HttpResponse(
+        json.dumps(snapshot()), content_type='application/json')
+
+
+def check_request(request):
+    """
+    Function to check a request before its signature is verified
+
+    Returns a tuple of the decoded notification and `None`, or of `None` and
+    the response to return if the request isn't acceptable.
+    """
+    # pylint: disable=too-many-return-statements,too-many-branches
+    bouncy_settings = get_settings()
+
+    # Everything up to parsing the body only looks at the headers, so junk
+    # is turned away without reading it
     try:
-        data = json.loads(request_body)
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
     except ValueError:
-        logger.warning('Notification Not Valid JSON: {}'.format(request_body))
-        return HttpResponseBadRequest('Not Valid JSON')
+        content_length = 0
+    if content_length > bouncy_settings.max_body_size:
+        logger.warning('Request Too Large: %d bytes', content_length)
+        return None, HttpResponseBadRequest('Request Too Large')
+
+    message_type = request.META.get('HTTP_X_AMZ_SNS_MESSAGE_TYPE')
+    if message_type is None:
+        if bouncy_settings.require_sns_headers:
+            return None, HttpResponseBadRequest('No Message Type Header')
+    elif message_type not in ALLOWED_TYPES:
+        logger.info('Notification Type Not Known %s', message_type)
+        return None, HttpResponseBadRequest('Unknown Notification Type')
+
+    topic_arn = request.META.get('HTTP_X_AMZ_SNS_TOPIC_ARN')
+    if topic_arn is None:
+        # Confirm that the proper topic header was sent, if necessary
+        if (bouncy_settings.topic_arns is not None
+                or bouncy_settings.require_sns_headers):
+            return None, HttpResponseBadRequest('No TopicArn Header')
+    # Check to see if the topic is in the settings
+    elif (bouncy_settings.topic_arns is not None
+          and topic_arn not in bouncy_settings.topic_arns):
+        return None, HttpResponseBadRequest('Bad Topic')
+
+    # Load the JSON POST Body, straight from the bytes
+    try:
+        data = bouncy_settings.json_loads(request.body)
+    except ValueError:
+        logger.warning('Notification Not Valid JSON: %r', request.body)
+        return None, HttpResponseBadRequest('Not Valid JSON')
 
     # Ensure that the JSON we're provided contains all the keys we expect
     # Comparison code from http://stackoverflow.com/questions/1285911/
-    if not set(VITAL_NOTIFICATION_FIELDS) <= set(data):
+    if not isinstance(data, dict) or not set(
+            VITAL_NOTIFICATION_FIELDS) <= set(data):
         logger.warning('Request Missing Necessary Keys')
-        return HttpResponseBadRequest('Request Missing Necessary Keys')
+        return None, HttpResponseBadRequest('Request Missing Necessary Keys')
 
     # Ensure that the type of notification is one we'll accept
     if not data['Type'] in ALLOWED_TYPES:
         logger.info('Notification Type Not Known %s', data['Type'])
-        return HttpResponseBadRequest('Unknown Notification Type')
+        return None, HttpResponseBadRequest('Unknown Notification Type')
+
+    # SNS sends the same type in the header and the body
+    if message_type is not None and data['Type'] != message_type:
+        logger.warning('Mismatched Notification Type %s', message_type)
+        return None, HttpResponseBadRequest('Mismatched Notification Type')
+
+    # A signature can't be checked against fields that are missing or aren't
+    # strings, so a forged notification is turned away here
+    if (bouncy_settings.verify_certificate
+            and not has_signature_fields(data)):
+        logger.warning('Notification Signed Fields Not Valid')
+        return None, HttpResponseBadRequest('Improper Signature')
+
+    # Answer redeliveries of a notification we've already handled without
+    # doing any of the work again
+    if is_duplicate_notification(data):
+        logger.info('Duplicate Notification %s', data['MessageId'])
+        return None, HttpResponse('Duplicate Notification')
 
     # Confirm that the signing certificate is hosted on a correct domain
     # AWS by default uses sns.{region}.amazonaws.com
     # On the off chance you need this to be a different domain, allow the
     # regex to be overridden in settings
     domain = urlparse(data['SigningCertURL']).netloc
-    pattern = getattr(
-        settings, 'BOUNCY_CERT_DOMAIN_REGEX', r"sns.[a-z0-9\-]+.amazonaws.com$"
-    )
-    if not re.search(pattern, domain):
+    if not bouncy_settings.cert_domain_regex.search(domain):
         logger.warning(
             'Improper Certificate Location %s', data['SigningCertURL'])
-        return HttpResponseBadRequest('Improper Certificate Location')
+        return None, HttpResponseBadRequest('Improper Certificate Location')
 
-    # Verify that the notification is signed by Amazon
-    if (getattr(settings, 'BOUNCY_VERIFY_CERTIFICATE', True)
-            and not verify_notification(data)):
-        logger.error('Verification Failure %s', )
+    return data, None
+
+
+def check_signature(data):
+    """
+    Function to verify the signature of a notification
+
+    Returns `None` if it's verified, or the response to return if it isn't.
+    A certificate that can't be fetched is answered with a 503, so SNS
+    tries again later.
+    """
+    try:
+        verified = verify_notification(data)
+    except ValueError:
+        logger.warning('Invalid Certificate %s', data['SigningCertURL'])
+        return HttpResponseBadRequest('Invalid Certificate')
+    except IOError:
+        logger.warning('Certificate Unavailable %s', data['SigningCertURL'])
+        response = HttpResponse('Certificate Unavailable', status=503)
+        response['Retry-After'] = str(get_settings().retry_after)
+        return response
+    if not verified:
+        logger.error('Verification Failure %s', data['MessageId'])
         return HttpResponseBadRequest('Improper Signature')
+    return None
 
-    # Send a signal to say a valid notification has been received
-    signals.notification.send(
-        sender='bouncy_endpoint', notification=data, request=request)
 
-    # Handle subscription-based messages.
-    if data['Type'] == 'SubscriptionConfirmation':
-        # Allow the disabling of the auto-subscription feature
-        if not getattr(settings, 'BOUNCY_AUTO_SUBSCRIBE', True):
-            raise Http404
-        return approve_subscription(data)
-    elif data['Type'] == 'UnsubscribeConfirmation':
-        # We won't handle unsubscribe requests here. Return a 200 status code
-        # so Amazon won't redeliver the request. If you want to remove this
-        # endpoint, remove it either via the API or the AWS Console
-        logger.info('UnsubscribeConfirmation Not Handled')
-        return HttpResponse('UnsubscribeConfirmation Not Handled')
+def unsubscribe_confirmation():
+    """Function to respond to an UnsubscribeConfirmation"""
+    # We won't handle unsubscribe requests here. Return a 200 status code
+    # so Amazon won't redeliver the request. If you want to remove this
+    # endpoint, remove it either via the API or the AWS Console
+    logger.info('UnsubscribeConfirmation Not Handled')
+    return HttpResponse('UnsubscribeConfirmation Not Handled')
+
+
+def enqueue_notification(request, data):
+    """Function to store a verified notification for later processing"""
+    with write_timer():
+        InboxMessage.objects.create(
+            sns_messageid=data['MessageId'],
+            notification=request.body.decode('utf-8')
+        )
+    remember_notification(data)
+    logger.info('Notification Queued %s', data['MessageId'])
+    return HttpResponse('Notification Queued')
+
+
+def process_notification(data):
+    """Function to process the message inside a verified notification"""
+    with timer('load_message'):
+        message, response = load_message(data)
+    if response is None:
+        with timer('process_message'):
+            response = process_message(message, data)
+    remember_notification(data)
+    return response
+
+
+def load_message(data):
+    """
+    Function to decode the JSON message inside a notification
 
+    Returns a tuple of the message and `None`, or of `None` and the response
+    to return if the message isn't JSON.
+    """
     try:
-        message = json.loads(data['Message'])
+        return get_settings().json_loads(data['Message']), None
     except ValueError:
         # This message is not JSON. But we need to return a 200 status code
         # so that Amazon doesn't attempt to deliver the message again
         logger.info('Non-Valid JSON Message Received')
-        return HttpResponse('Message is not valid JSON')
-
-    return process_message(message, data)
+        return None, HttpResponse('Message is not valid JSON')
 
 
 def process_message(message, notification):
@@ -140,6 +290,7 @@ def process_message(message, notification):
         # this same message a few seconds later.
         logger.info('JSON Message Missing Vital Fields')
         return HttpResponse('Missing Vital Fields')
+    increment('messages', type=message['notificationType'])
 
     if message['notificationType'] == 'Complaint':
         return process_complaint(message, notification)
@@ -155,19 +306,22 @@ def process_bounce(message, notification):
     """Function to process a bounce notification"""
     mail = message['mail']
     bounce = message['bounce']
+    # Every record shares these timestamps, so they are only parsed once
+    mail_timestamp = clean_time(mail['timestamp'])
+    feedback_timestamp = clean_time(bounce['timestamp'])
 
     bounces = []
     for recipient in bounce['bouncedRecipients']:
-        # Create each bounce record. Add to a list for reference later.
-        bounces += [Bounce.objects.create(
+        # Build each bounce record. They are all saved together below.
+        bounces += [Bounce(
             sns_topic=notification['TopicArn'],
             sns_messageid=notification['MessageId'],
-            mail_timestamp=clean_time(mail['timestamp']),
+            mail_timestamp=mail_timestamp,
             mail_id=mail['messageId'],
             mail_from=mail['source'],
             address=recipient['emailAddress'],
             feedback_id=bounce['feedbackId'],
-            feedback_timestamp=clean_time(bounce['timestamp']),
+            feedback_timestamp=feedback_timestamp,
             hard=bool(bounce['bounceType'] == 'Permanent'),
             bounce_type=bounce['bounceType'],
             bounce_subtype=bounce['bounceSubType'],
@@ -177,14 +331,7 @@ def process_bounce(message, notification):
             diagnostic_code=recipient.get('diagnosticCode')
         )]
 
-    # Send signals for each bounce.
-    for bounce in bounces:
-        signals.feedback.send(
-            sender=Bounce,
-            instance=bounce,
-            message=message,
-            notification=notification
-        )
+    save_feedback(Bounce, bounces, message, notification)
 
     logger.info('Logged %s Bounce(s)', str(len(bounces)))
 
@@ -195,6 +342,9 @@ def process_complaint(message, notification):
     """Function to process a complaint notification"""
     mail = message['mail']
     complaint = message['complaint']
+    # Every record shares these timestamps, so they are only parsed once
+    mail_timestamp = clean_time(mail['timestamp'])
+    feedback_timestamp = clean_time(complaint['timestamp'])
 
     if 'arrivalDate' in complaint:
         arrival_date = clean_time(complaint['arrivalDate'])
@@ -203,29 +353,22 @@ def process_complaint(message, notification):
 
     complaints = []
     for recipient in complaint['complainedRecipients']:
-        # Create each Complaint. Save in a list for reference later.
-        complaints += [Complaint.objects.create(
+        # Build each Complaint. They are all saved together below.
+        complaints += [Complaint(
             sns_topic=notification['TopicArn'],
             sns_messageid=notification['MessageId'],
-            mail_timestamp=clean_time(mail['timestamp']),
+            mail_timestamp=mail_timestamp,
             mail_id=mail['messageId'],
             mail_from=mail['source'],
             address=recipient['emailAddress'],
             feedback_id=complaint['feedbackId'],
-            feedback_timestamp=clean_time(complaint['timestamp']),
+            feedback_timestamp=feedback_timestamp,
             useragent=complaint.get('userAgent'),
             feedback_type=complaint.get('complaintFeedbackType'),
             arrival_date=arrival_date
         )]
 
-    # Send signals for each complaint.
-    for complaint in complaints:
-        signals.feedback.send(
-            sender=Complaint,
-            instance=complaint,
-            message=message,
-            notification=notification
-        )
+    save_feedback(Complaint, complaints, message, notification)
 
     logger.info('Logged %s Complaint(s)', str(len(complaints)))
 
@@ -236,37 +379,147 @@ def process_delivery(message, notification):
     """Function to process a delivery notification"""
     mail = message['mail']
     delivery = message['delivery']
+    # Every record shares these values, so they are only worked out once
+    mail_timestamp = clean_time(mail['timestamp'])
+    processing_time = int(delivery['processingTimeMillis'])
 
     if 'timestamp' in delivery:
         delivered_datetime = clean_time(delivery['timestamp'])
     else:
         delivered_datetime = None
 
+    if should_roll_up(mail['source'], notification['TopicArn']):
+        # The rollup and its sampled records are committed together, so a
+        # failure leaves nothing behind for a redelivery to count again
+        with transaction.atomic():
+            with write_timer():
+                counted = roll_up_deliveries(
+                    notification['MessageId'], notification['TopicArn'],
+                    mail['source'], delivered_datetime or mail_timestamp,
+                    processing_time, delivery['recipients']
+                )
+            if counted:
+                logger.info('Rolled up %s Deliveries(s)',
+                            str(len(delivery['recipients'])))
+            # Only a sample of rolled up notifications are also saved in full
+            if is_sampled(notification['MessageId']):
+                save_deliveries(message, notification, mail_timestamp,
+                                delivered_datetime, processing_time)
+        return HttpResponse('Delivery Processed')
+
+    save_deliveries(message, notification, mail_timestamp,
+                    delivered_datetime, processing_time)
+
+    return HttpResponse('Delivery Processed')
+
+
+def save_deliveries(message, notification, mail_timestamp,
+                    delivered_datetime, processing_time):
+    """Function to save a Delivery record for each recipient"""
+    mail = message['mail']
+    delivery = message['delivery']
     deliveries = []
     for eachrecipient in delivery['recipients']:
-        # Create each delivery 
-        deliveries += [Delivery.objects.create(
+        # Build each delivery. They are all saved together below.
+        deliveries += [Delivery(
             sns_topic=notification['TopicArn'],
             sns_messageid=notification['MessageId'],
-            mail_timestamp=clean_time(mail['timestamp']),
+            mail_timestamp=mail_timestamp,
             mail_id=mail['messageId'],
             mail_from=mail['source'],
             address=eachrecipient,
             # delivery
             delivered_time=delivered_datetime,
-            processing_time=int(delivery['processingTimeMillis']),
+            processing_time=processing_time,
             smtp_response=delivery['smtpResponse']
         )]
 
-    # Send signals for each delivery.
-    for eachdelivery in deliveries:
-        signals.feedback.send(
-            sender=Delivery,
-            instance=eachdelivery,
-            message=message,
-            notification=notification
-        )
+    save_feedback(Delivery, deliveries, message, notification)
 
     logger.info('Logged %s Deliveries(s)', str(len(deliveries)))
 
-    return HttpResponse('Delivery Processed')
+
+def save_feedback(model, instances, message, notification):
+    """
+    Save every feedback record built from a single notification
+
+    All records are written with one bulk insert inside a single transaction,
+    which also updates each address's AddressStatus. The feedback and
+    feedback_batch signals are only sent once that transaction has been
+    committed, so receivers never act on rows that could still be rolled back.
+
+    Records already saved from an earlier delivery of the same notification
+    are skipped, and no signals are sent for them. Every instance passed to
+    the signals has its primary key, whatever the database backend.
+    """
+    with timer('save'), write_timer(), transaction.atomic():
+        instances = _insert_feedback(model, instances, notification)
+        update_address_status(model, instances)
+        transaction.on_commit(lambda: _send_feedback_signals(
+            model, instances, message, notification))
+
+
+def _insert_feedback(model, instances, notification):
+    """
+    Insert the records that haven't been saved yet, and return them
+
+    A redelivery of the same notification being saved at the same moment
+    can insert some of the records first. The insert is then tried once
+    more without them; if it still conflicts the `IntegrityError` is raised,
+    and SNS will redeliver the notification later.
+    """
+    # A recipient listed twice is only saved once
+    unique = OrderedDict()
+    for instance in instances:
+        unique.setdefault(instance.address, instance)
+    instances = list(unique.values())
+    addresses = list(unique)
+
+    for attempt in range(2):
+        existing = set(model.objects.filter(
+            sns_messageid=notification['MessageId'], address__in=addresses
+        ).values_list('address', flat=True))
+        instances = [
+            instance for instance in instances
+            if instance.address not in existing
+        ]
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(instances)
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+
+    if instances and instances[0].pk is None:
+        # Only some backends set primary keys from a bulk insert
+        pks = dict(model.objects.filter(
+            sns_messageid=notification['MessageId'],
+            address__in=[instance.address for instance in instances]
+        ).values_list('address', 'pk'))
+        for instance in instances:
+            instance.pk = pks[instance.address]
+    return instances
+
+
+def _send_feedback_signals(model, instances, message, notification):
+    """
+    Send one feedback_batch signal for the newly saved records, then a
+    feedback signal for each of them
+    """
+    if not instances:
+        return
+    with timer('feedback_signals'):
+        signals.feedback_batch.send(
+            sender=model,
+            instances=instances,
+            message=message,
+            notification=notification
+        )
+        for instance in instances:
+            signals.feedback.send(
+                sender=model,
+                instance=instance,
+                message=message,
+                notification=notification
+            )
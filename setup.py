@@ -13,7 +13,8 @@ setup(
     version='0.2.7',
     author='Nick Catalano',
     packages=[
-        'django_bouncy', 'django_bouncy.migrations', 'django_bouncy.tests'],
+        'django_bouncy', 'django_bouncy.migrations', 'django_bouncy.tests',
+        'django_bouncy.management', 'django_bouncy.management.commands'],
     url='https://github.com/ofa/django-bouncy',
     description=(
         "A way to handle bounce and abuse reports delivered by Amazon's Simple"
@@ -24,11 +25,17 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=[
-        'Django>=1.11',
+        'Django>=2.2',
         'python-dateutil>=2.1',
-        'pyopenssl>=0.13.1',
+        'cryptography>=2.5',
         'pem>=16.0.0',
     ],
+    extras_require={
+        # A faster JSON decoder, used automatically when installed
+        'orjson': ['orjson>=3.0'],
+        # The asynchronous endpoint in django_bouncy.async_urls
+        'async': ['Django>=3.1'],
+    },
     keywords="aws ses sns seacucumber boto",
     classifiers=[
         'Development Status :: 4 - Beta',